@@ -4,13 +4,10 @@ DEBUG = True
 
 ALLOWED_HOSTS = ['localhost', '127.0.0.1']
 
-# Database - SQLite for development
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+# Database - SQLite unless DATABASE_URL is set (see base.py)
+
+# Profile every request locally
+SQL_PROFILER_SAMPLE_RATE = 1.0
 
 # Static files for development
 STATIC_ROOT = BASE_DIR / 'staticfiles'
\ No newline at end of file
@@ -1,8 +1,13 @@
+import os
+
 from .base import *
 
 DEBUG = False
 
 ALLOWED_HOSTS = ['localhost', '127.0.0.1', 'astra-ubml.onrender.com']
+# Render sets this to each service's own hostname (e.g. the API service's)
+if os.environ.get('RENDER_EXTERNAL_HOSTNAME'):
+    ALLOWED_HOSTS.append(os.environ['RENDER_EXTERNAL_HOSTNAME'])
 
 # Security settings for production
 SECURE_SSL_REDIRECT = True
@@ -11,13 +16,8 @@ CSRF_COOKIE_SECURE = True
 SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
 
-# Database - can use SQLite or PostgreSQL
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+# Database - PostgreSQL via DATABASE_URL (render.yaml gives every service the
+# same one), plus optional read replicas (see base.py)
 
 # Static files for production
 STATIC_ROOT = BASE_DIR / 'staticfiles'
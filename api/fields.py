@@ -0,0 +1,109 @@
+"""
+Sparse fieldsets and includes (?fields=, ?include=).
+
+Each list the API returns is described by a Resource: the fields a client may
+ask for, each with the values() lookup (or expression) that reads it, and the
+ones sent when it doesn't ask. ?fields=id,title narrows the records to those
+fields, and the query then reads only their columns. ?include=author adds a
+related object to each record with its default fields, narrowed with
+?fields[author]=username. Endpoints that return a single object (the stats)
+take ?fields= to pick its top-level keys.
+
+Unknown names raise InvalidFields, which the views turn into a 400 listing
+the valid ones.
+"""
+
+from dataclasses import dataclass, field
+
+
+class InvalidFields(ValueError):
+    """Raised for ?fields= or ?include= names the resource doesn't have"""
+
+    def __init__(self, param, unknown, valid):
+        super().__init__(f'Unknown {param}: {", ".join(sorted(unknown))}')
+        self.valid = sorted(valid)
+
+
+def _names(request, param):
+    """Comma-separated names from a query parameter, or None if it is absent"""
+    if param not in request.GET:
+        return None
+    return [name for name in (part.strip() for part in request.GET[param].split(',')) if name]
+
+
+@dataclass
+class Resource:
+    name: str
+    fields: dict                                    # field -> values() lookup or expression
+    default: tuple                                  # fields sent without ?fields=
+    includes: dict = field(default_factory=dict)    # include -> Resource, lookups relative to this one
+
+    def _fields(self, request, param):
+        names = _names(request, param)
+        if names is None:
+            return list(self.default)
+        unknown = set(names) - self.fields.keys()
+        if unknown:
+            raise InvalidFields(f'{self.name} {param}', unknown, self.fields)
+        return list(dict.fromkeys(names))
+
+    def select(self, request):
+        """The Selection asked for by request's ?fields=, ?include= and ?fields[<include>]="""
+        includes = _names(request, 'include') or []
+        unknown = set(includes) - self.includes.keys()
+        if unknown:
+            raise InvalidFields(f'{self.name} include', unknown, self.includes)
+        return Selection(self, self._fields(request, 'fields'), {
+            name: self.includes[name]._fields(request, f'fields[{name}]') for name in dict.fromkeys(includes)
+        })
+
+
+@dataclass
+class Selection:
+    resource: Resource
+    fields: list
+    includes: dict      # include -> [fields]
+
+    def _lookups(self):
+        yield from ((name, self.resource.fields[name]) for name in self.fields)
+        for include, names in self.includes.items():
+            related = self.resource.includes[include]
+            yield from ((f'{include}.{name}', related.fields[name]) for name in names)
+
+    def values(self, queryset, *extra):
+        """queryset.values() reading just the selected fields, plus the extra lookups the caller needs"""
+        lookups, expressions = list(extra), {}
+        for name, lookup in self._lookups():
+            if isinstance(lookup, str):
+                lookups.append(lookup)
+            else:
+                expressions[name.replace('.', '_')] = lookup
+        return queryset.values(*dict.fromkeys(lookups), **expressions)
+
+    def shape(self, rows):
+        """Turn values() rows (or plain dicts keyed by field) into the records to send"""
+        def read(row, name, lookup):
+            return row[lookup if isinstance(lookup, str) else name.replace('.', '_')]
+
+        resource = self.resource
+        records = []
+        for row in rows:
+            record = {name: read(row, name, resource.fields[name]) for name in self.fields}
+            for include, names in self.includes.items():
+                related = resource.includes[include]
+                record[include] = {
+                    name: read(row, f'{include}.{name}', related.fields[name]) for name in names
+                }
+            records.append(record)
+        return records
+
+
+def pick(request, data, keep=()):
+    """data narrowed to the top-level keys in ?fields= (plus keep), or all of it without ?fields="""
+    names = _names(request, 'fields')
+    if names is None:
+        return data
+    unknown = set(names) - data.keys()
+    if unknown:
+        raise InvalidFields('fields', unknown, data.keys() - set(keep))
+    return {key: value for key, value in data.items() if key in names or key in keep}
@@ -0,0 +1,76 @@
+"""
+Compression of JSON responses.
+
+Responses with a JSON content type of at least API_COMPRESS_MIN_BYTES are
+compressed with the best encoding the client accepts: Brotli when the
+optional `brotli` package is installed, otherwise gzip. HTML pages are left
+alone, so CSRF tokens can't leak through compressed sizes (BREACH), as are
+streaming responses, which would lose their incremental delivery.
+"""
+
+import gzip
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _brotli(content):
+    return brotli.compress(content, quality=settings.API_BROTLI_QUALITY)
+
+
+def _gzip(content):
+    # mtime=0 keeps the output identical for identical content
+    return gzip.compress(content, compresslevel=settings.API_GZIP_LEVEL, mtime=0)
+
+
+# encoding -> compress(bytes), in order of preference
+CODINGS = {'br': _brotli, 'gzip': _gzip} if brotli is not None else {'gzip': _gzip}
+
+
+def accepted_encodings(header):
+    """The content codings an Accept-Encoding header allows (q > 0)"""
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = params.strip()
+        try:
+            allowed = not quality.startswith('q=') or float(quality[2:]) > 0
+        except ValueError:
+            allowed = False
+        if coding and allowed:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        if (response.streaming or response.has_header('Content-Encoding')
+                or not response.get('Content-Type', '').startswith('application/json')):
+            return response
+        # Whether or not this response is compressed, caches must tell clients apart
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < settings.API_COMPRESS_MIN_BYTES:
+            return response
+
+        accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        coding = next((name for name in CODINGS if name in accepted), None)
+        if coding is None:
+            return response
+        compressed = CODINGS[coding](response.content)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        response.headers['Content-Encoding'] = coding
+        # The compressed body differs byte for byte, so its validator can only be weak
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        return response
@@ -1,3 +1,201 @@
+import json
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from core import stats
+from core.models import Hub, Post, UserProfile
+
+
+class ApiTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('maya', first_name='Maya', last_name='Thompson')
+        UserProfile.objects.create(user=cls.author)
+        cls.hub = Hub.objects.create(name='Careers', description='Careers hub')
+        cls.posts = [
+            Post.objects.create(hub=cls.hub, author=cls.author, title=f'Post {i}', content='Content')
+            for i in range(5)
+        ]
+        cls.anonymous = Post.objects.create(hub=cls.hub, author=cls.author, title='Anonymous', content='Content',
+                                            is_anonymous=True)
+        cls.posts_url = reverse('api:posts_json', args=[cls.hub.slug])
+
+    def setUp(self):
+        cache.clear()
+
+    def get_json(self, url, data=None, status=200, **headers):
+        response = self.client.get(url, data, **headers)
+        self.assertEqual(response.status_code, status, response.content)
+        return json.loads(response.content)
+
+
+class PostsTests(ApiTestCase):
+    def test_cursors_round_trip(self):
+        seen, cursor = [], None
+        while True:
+            data = self.get_json(self.posts_url, {'page_size': 2, **({'cursor': cursor} if cursor else {})})
+            seen += [post['id'] for post in data['posts']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(sorted(seen), sorted(post.pk for post in [*self.posts, self.anonymous]))
+        self.assertEqual(len(seen), len(set(seen)))
+
+        last = self.get_json(self.posts_url, {'page_size': 2, 'cursor': data['prev_cursor']})
+        self.assertEqual([post['id'] for post in last['posts']], seen[-4:-2])
+
+    def test_invalid_cursor_is_a_400(self):
+        data = self.get_json(self.posts_url, {'cursor': 'garbage'}, status=400)
+        self.assertEqual(data['error'], 'Invalid cursor')
+
+    def test_cursor_from_another_sort_is_a_400(self):
+        cursor = self.get_json(self.posts_url, {'page_size': 2})['next_cursor']
+        self.get_json(self.posts_url, {'sort': 'top', 'cursor': cursor}, status=400)
+
+    def test_page_size_is_clamped(self):
+        with self.settings(FEED_MAX_PAGE_SIZE=3):
+            self.assertEqual(self.get_json(self.posts_url, {'page_size': 50})['page_size'], 3)
+
+    def test_unknown_fields_are_a_400_listing_the_valid_ones(self):
+        data = self.get_json(self.posts_url, {'fields': 'id,password'}, status=400)
+        self.assertIn('title', data['valid'])
+
+    def test_sparse_fields_and_includes(self):
+        data = self.get_json(self.posts_url, {'fields': 'id,title', 'include': 'hub', 'fields[hub]': 'slug'})
+        self.assertEqual(set(data['posts'][0]), {'id', 'title', 'hub'})
+        self.assertEqual(data['posts'][0]['hub'], {'slug': self.hub.slug})
+
+    def test_anonymous_posts_hide_their_author(self):
+        for query in ({}, {'fields': 'id,author__username'}, {'include': 'author'}):
+            with self.subTest(query=query):
+                posts = {post['id']: post for post in self.get_json(self.posts_url, query)['posts']}
+                hidden, shown = posts[self.anonymous.pk], posts[self.posts[0].pk]
+                names = [name for name in ('author__username', 'author') if name in hidden]
+                self.assertTrue(names)
+                for name in names:
+                    self.assertIsNone(hidden[name])
+                    self.assertIsNotNone(shown[name])
+
+    def test_unknown_hub_is_a_404(self):
+        self.get_json(reverse('api:posts_json', args=['nowhere']), status=404)
+
+
+class AsyncViewTests(ApiTestCase):
+    async def test_hubs(self):
+        response = await self.async_client.get(reverse('api:hubs_json'))
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual((data['total'], data['hubs'][0]['post_count']), (1, 6))
+
+    async def test_posts(self):
+        response = await self.async_client.get(self.posts_url, {'page_size': 3})
+        data = json.loads(response.content)
+        self.assertEqual((data['hub'], data['total'], len(data['posts'])), ('Careers', 6, 3))
+
+    async def test_search(self):
+        response = await self.async_client.get(reverse('api:search_json'), {'q': 'anonymous'})
+        data = json.loads(response.content)
+        self.assertEqual([result['post_id'] for result in data['results']], [self.anonymous.pk])
+        self.assertNotIn('Maya', json.dumps(data['results']))
+
+    async def test_search_needs_a_query(self):
+        response = await self.async_client.get(reverse('api:search_json'))
+        self.assertEqual(response.status_code, 400)
+
+    async def test_json_responses_vary_on_accept_encoding(self):
+        response = await self.async_client.get(self.posts_url, {'page_size': 100, 'fields': 'id,content'},
+                                               headers={'Accept-Encoding': 'gzip'})
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+
+class ConditionalGetTests(ApiTestCase):
+    def test_unchanged_posts_are_not_modified(self):
+        etag = self.client.get(self.posts_url)['ETag']
+        self.assertEqual(self.client.get(self.posts_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_new_posts_change_the_etag(self):
+        etag = self.client.get(self.posts_url)['ETag']
+        Post.objects.create(hub=self.hub, author=self.author, title='New', content='Content')
+        self.assertEqual(self.client.get(self.posts_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_varies_with_the_query(self):
+        etag = self.client.get(self.posts_url)['ETag']
+        self.assertEqual(self.client.get(self.posts_url, {'sort': 'hot'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_top_pages_change_when_the_window_moves(self):
+        response = self.client.get(self.posts_url, {'sort': 'top'})
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        with mock.patch('django.utils.timezone.localdate', return_value=tomorrow):
+            for header in ({'HTTP_IF_NONE_MATCH': response['ETag']},
+                           {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']}):
+                self.assertEqual(self.client.get(self.posts_url, {'sort': 'top'}, **header).status_code, 200)
+
+    def test_hub_list_etag(self):
+        url = reverse('api:hubs_json')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Hub.objects.create(name='Design', description='Design hub')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class BatchTests(ApiTestCase):
+    url = reverse('api:batch')
+
+    def post_batch(self, requests, status=200):
+        response = self.client.post(self.url, json.dumps({'requests': requests}), content_type='application/json')
+        self.assertEqual(response.status_code, status, response.content)
+        return json.loads(response.content)
+
+    def test_responses_come_back_in_request_order(self):
+        urls = [f'{self.posts_url}?page_size=1', reverse('api:hubs_json'), f'{self.posts_url}?page_size=2']
+        data = self.get_json(self.url, {'url': urls})
+        self.assertEqual([response['id'] for response in data['responses']], urls)
+        self.assertEqual([response['status'] for response in data['responses']], [200, 200, 200])
+        self.assertEqual(len(data['responses'][0]['body']['posts']), 1)
+        self.assertEqual(len(data['responses'][2]['body']['posts']), 2)
+
+    def test_posted_ids_are_kept(self):
+        data = self.post_batch([{'url': reverse('api:hubs_json'), 'id': 'hubs'}, {'url': self.posts_url}])
+        self.assertEqual([response['id'] for response in data['responses']], ['hubs', self.posts_url])
+
+    def test_failures_stay_in_their_slot(self):
+        data = self.post_batch([
+            {'url': '/api/nowhere/', 'id': 'missing'},
+            {'url': reverse('api:posts_json', args=['nowhere']), 'id': 'no hub'},
+            {'url': reverse('core:home'), 'id': 'page'},
+            {'url': reverse('api:batch'), 'id': 'nested'},
+            {'url': f'{self.posts_url}?cursor=garbage', 'id': 'bad cursor'},
+            {'url': reverse('api:hubs_json'), 'id': 'hubs'},
+        ])
+        statuses = {response['id']: response['status'] for response in data['responses']}
+        self.assertEqual(statuses, {
+            'missing': 404, 'no hub': 404, 'page': 400, 'nested': 400, 'bad cursor': 400, 'hubs': 200,
+        })
+
+    def test_conditional_headers_are_not_passed_on(self):
+        etag = self.client.get(reverse('api:hubs_json'))['ETag']
+        data = self.get_json(self.url, {'url': reverse('api:hubs_json')}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(data['responses'][0]['status'], 200)
+
+    def test_invalid_batches_are_a_400(self):
+        self.get_json(self.url, status=400)
+        self.post_batch([{'id': 'no url'}], status=400)
+        self.post_batch([{'url': 'https://example.com/api/hubs/'}], status=400)
+        with self.settings(API_BATCH_MAX_REQUESTS=2):
+            self.get_json(self.url, {'url': [reverse('api:hubs_json')] * 3}, status=400)
+
+    def test_batched_views_share_the_platform_snapshot(self):
+        # Built here, as the gathered queries behind a cold build can't see this test's transaction
+        stats.get_platform_snapshot()
+        read = mock.AsyncMock(wraps=stats._aget_platform_snapshot)
+        with mock.patch.object(stats, '_aget_platform_snapshot', read):
+            data = self.get_json(self.url, {'url': [reverse('api:platform_stats'), reverse('api:skills_distribution')]})
+        self.assertEqual([response['status'] for response in data['responses']], [200, 200])
+        self.assertEqual(read.await_count, 1)
 
-# Create your tests here.
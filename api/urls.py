@@ -10,4 +10,6 @@ urlpatterns = [
     path('stats/platform/', views.platform_stats, name='platform_stats'),
     path('stats/growth/', views.growth_stats, name='growth_stats'),
     path('stats/skills/', views.skills_distribution, name='skills_distribution'),
+    path('search/', views.search_json, name='search_json'),
+    path('batch/', views.batch, name='batch'),
 ]
\ No newline at end of file
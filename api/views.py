@@ -1,116 +1,327 @@
-from django.http import JsonResponse
-from django.db.models import Count, Q
-from django.db.models.functions import TruncDate
-from core.models import Hub, Post, Comment, UserProfile, MentorshipRequest, Skill, User
-from datetime import datetime, timedelta
-
-
-def hubs_json(request):
-    """Return all hubs with stats as JSON"""
-    hubs = Hub.objects.annotate(
-        member_count=Count('members'),
-        post_count=Count('posts')
-    ).values('id', 'name', 'slug', 'icon', 'description', 'member_count', 'post_count')
-
-    return JsonResponse({
-        'hubs': list(hubs),
+import asyncio
+import json
+import logging
+from inspect import iscoroutinefunction
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models.functions import Substr
+from django.http import Http404, HttpRequest, HttpResponse, QueryDict
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from core.async_utils import sharing
+from core.models import Hub
+from core.pagination import paginate_keyset, get_page_size, InvalidCursor
+from core.search import search_request
+from core.stats import aget_platform_snapshot, snapshot_validators
+from core import ranking, rollups, versions
+from .fields import Resource, InvalidFields, pick
+from .responses import encode, json_response, error_response, invalid_fields_response, splice
+
+logger = logging.getLogger(__name__)
+
+# Left out of batched requests: a 304 would leave the combined response without that body
+CONDITIONAL_HEADERS = ('HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE')
+
+HUBS = Resource('hubs', {
+    name: name for name in (
+        'id', 'name', 'slug', 'icon', 'description', 'member_count', 'post_count', 'created_at',
+    )
+}, default=('id', 'name', 'slug', 'icon', 'description', 'member_count', 'post_count'))
+
+# Null for anonymous posts, whether asked for with ?fields= or by default, as is ?include=author
+POST_AUTHOR_FIELDS = ('author__username', 'author__first_name', 'author__last_name')
+
+POSTS = Resource('posts', {
+    **{name: name for name in (
+        'id', 'title', 'content', 'post_type', 'is_anonymous', 'video_url',
+        'helpful_count', 'comment_count', 'hot_score', 'top_score', 'created_at', 'updated_at',
+        *POST_AUTHOR_FIELDS,
+    )},
+    'excerpt': Substr('content', 1, settings.API_EXCERPT_CHARS),
+}, default=(
+    'id', 'title', 'content', 'post_type',
+    'helpful_count', 'comment_count', 'hot_score', 'top_score', 'created_at',
+    *POST_AUTHOR_FIELDS,
+), includes={
+    'author': Resource('author', {
+        'username': 'author__username',
+        'first_name': 'author__first_name',
+        'last_name': 'author__last_name',
+        'is_mentor': 'author__profile__is_mentor',
+        'reputation_score': 'author__profile__reputation_score',
+        'avatar_hash': 'author__profile__avatar_hash',
+    }, default=('username', 'first_name', 'last_name')),
+    'hub': Resource('hub', {
+        'id': 'hub__id', 'name': 'hub__name', 'slug': 'hub__slug', 'icon': 'hub__icon',
+    }, default=('id', 'name', 'slug', 'icon')),
+})
+
+SEARCH_RESULTS = Resource('results', {
+    name: name for name in (
+        'type', 'post_id', 'comment_id', 'title', 'hub', 'post_type', 'author', 'snippet', 'score',
+    )
+}, default=('type', 'post_id', 'comment_id', 'title', 'hub', 'post_type', 'author', 'snippet', 'score'))
+
+
+def _hide_author(record):
+    """Null whatever the post record says about its author"""
+    for name in POST_AUTHOR_FIELDS:
+        if name in record:
+            record[name] = None
+    if 'author' in record:
+        record['author'] = None
+
+
+def _posts_validators(request, hub_slug):
+    hub_id = Hub.objects.filter(slug=hub_slug).values_list('pk', flat=True).first()
+    if hub_id is None:
+        return None
+    # The Top window moves at midnight, dropping posts without a new version of the hub
+    sort = ranking.get_sort(request)
+    etag, modified = versions.validators([f'hub:{hub_id}'], request.get_full_path(), ranking.window_bucket(sort))
+    moved = ranking.window_moved_at(sort)
+    return etag, max(filter(None, (modified, moved)), default=None)
+
+
+def _growth_validators(request):
+    # The series end today, so the same rollups give a different body tomorrow
+    return versions.validators(['rollups'], request.get_full_path(), timezone.localdate())
+
+
+def _snapshot_validators(request):
+    return snapshot_validators(request.get_full_path())
+
+
+@versions.conditional(lambda request: versions.validators(['hubs'], request.get_full_path()))
+async def hubs_json(request):
+    """Return all hubs with stats as JSON (?fields=)"""
+    try:
+        selection = HUBS.select(request)
+    except InvalidFields as error:
+        return invalid_fields_response(error)
+    hubs = selection.shape([hub async for hub in selection.values(Hub.objects.all())])
+
+    return json_response({
+        'hubs': hubs,
         'total': len(hubs)
     })
 
 
-def posts_json(request, hub_slug):
-    """Return posts for a specific hub as JSON"""
+@versions.conditional(_posts_validators)
+async def posts_json(request, hub_slug):
+    """
+    Return one page of a hub's posts as JSON (?sort=new|hot|top, ?cursor=,
+    ?page_size=, ?fields=, ?include=author,hub)
+    """
     try:
-        hub = Hub.objects.get(slug=hub_slug)
-        posts = hub.posts.select_related('author').values(
-            'id', 'title', 'content', 'post_type',
-            'helpful_count', 'created_at',
-            'author__username', 'author__first_name', 'author__last_name'
-        )
-
-        return JsonResponse({
-            'hub': hub.name,
-            'posts': list(posts),
-            'total': len(posts)
-        })
+        hub = await Hub.objects.aget(slug=hub_slug)
     except Hub.DoesNotExist:
-        return JsonResponse({'error': 'Hub not found'}, status=404)
-
-
-def platform_stats(request):
-    """Overall platform statistics for analytics dashboard"""
-    stats = {
-        'total_users': User.objects.count(),
-        'total_posts': Post.objects.count(),
-        'total_comments': Comment.objects.count(),
-        'total_hubs': Hub.objects.count(),
-        'total_mentors': UserProfile.objects.filter(is_mentor=True).count(),
-        'total_mentorship_requests': MentorshipRequest.objects.count(),
-        'pending_requests': MentorshipRequest.objects.filter(status='pending').count(),
-        'accepted_requests': MentorshipRequest.objects.filter(status='accepted').count(),
-    }
+        return error_response('Hub not found', 404)
+    try:
+        selection = POSTS.select(request)
+    except InvalidFields as error:
+        return invalid_fields_response(error)
 
-    # Hub stats
-    hub_stats = Hub.objects.annotate(
-        member_count=Count('members'),
-        post_count=Count('posts')
-    ).values('name', 'icon', 'member_count', 'post_count')
-
-    stats['hub_breakdown'] = list(hub_stats)
-
-    # Post type distribution
-    post_types = Post.objects.values('post_type').annotate(
-        count=Count('id')
-    ).order_by('-count')
-
-    stats['post_types'] = list(post_types)
-
-    return JsonResponse(stats)
-
-
-def growth_stats(request):
-    """User and post growth over time (last 30 days)"""
-    thirty_days_ago = datetime.now() - timedelta(days=30)
-
-    # Users by date
-    users_by_date = User.objects.filter(
-        date_joined__gte=thirty_days_ago
-    ).annotate(
-        date=TruncDate('date_joined')
-    ).values('date').annotate(
-        count=Count('id')
-    ).order_by('date')
-
-    # Posts by date
-    posts_by_date = Post.objects.filter(
-        created_at__gte=thirty_days_ago
-    ).annotate(
-        date=TruncDate('created_at')
-    ).values('date').annotate(
-        count=Count('id')
-    ).order_by('date')
-
-    return JsonResponse({
-        'users': [
-            {'date': str(item['date']), 'count': item['count']}
-            for item in users_by_date
-        ],
-        'posts': [
-            {'date': str(item['date']), 'count': item['count']}
-            for item in posts_by_date
-        ]
+    sort = ranking.get_sort(request)
+    posts, keys = ranking.sorted_posts(hub.posts.all(), sort)
+    # The sort keys are read for the cursors whether or not they were asked for
+    hides_author = 'author' in selection.includes or not set(POST_AUTHOR_FIELDS).isdisjoint(selection.fields)
+    extra = [*keys, 'is_anonymous'] if hides_author else keys
+    try:
+        page = await sync_to_async(paginate_keyset)(
+            selection.values(posts, *extra), request.GET.get('cursor'), get_page_size(request), keys)
+    except InvalidCursor:
+        return error_response('Invalid cursor', 400)
+
+    records = selection.shape(page.items)
+    if hides_author:
+        for row, record in zip(page.items, records):
+            if row['is_anonymous']:
+                _hide_author(record)
+
+    return json_response({
+        'hub': hub.name,
+        'sort': sort,
+        'posts': records,
+        'total': hub.post_count,
+        'page_size': page.page_size,
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
     })
 
 
-def skills_distribution(request):
-    """Most common skills across the platform"""
-    skills = Skill.objects.annotate(
-        user_count=Count('users')
-    ).filter(user_count__gt=0).order_by('-user_count')[:10]
+@versions.conditional(_snapshot_validators)
+async def platform_stats(request):
+    """Overall platform statistics for analytics dashboard (?fields=)"""
+    snapshot = await aget_platform_snapshot()
+    data = {
+        key: snapshot[key] for key in (
+            'total_users', 'total_posts', 'total_comments', 'total_hubs',
+            'total_mentors', 'total_mentorship_requests',
+        )
+    }
+    data['pending_requests'] = snapshot['mentorship']['pending']
+    data['accepted_requests'] = snapshot['mentorship']['accepted']
+    data['hub_breakdown'] = snapshot['hub_breakdown']
+    data['post_types'] = snapshot['post_types']
+    data['computed_at'] = snapshot['computed_at']
+
+    try:
+        return json_response(pick(request, data, keep=('computed_at',)))
+    except InvalidFields as error:
+        return invalid_fields_response(error)
 
+
+@versions.conditional(_growth_validators)
+async def growth_stats(request):
+    """Daily signups, posts, comments, votes and mentorship requests (?days=30|90|365, ?hub=<slug>, ?fields=)"""
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        days = 30
+    days = max(1, min(days, 365))
+
+    hub = None
+    if request.GET.get('hub'):
+        hub = await Hub.objects.filter(slug=request.GET['hub']).afirst()
+        if hub is None:
+            return error_response('Hub not found', 404)
+
+    # response key -> rollup metric; all read in one query
+    metrics = {'posts': 'posts', 'comments': 'comments', 'votes': 'votes'}
+    if hub is None:
+        metrics.update(users='signups', mentorship_requests='mentorship_requests')
+    try:
+        # Only the series asked for are read
+        metrics = pick(request, metrics)
+    except InvalidFields as error:
+        return invalid_fields_response(error)
+    series = await sync_to_async(rollups.multi_series)(list(metrics.values()), days, hub)
+
+    data = {'days': days, 'hub': hub.slug if hub else None}
+    data.update((key, series[metric]) for key, metric in metrics.items())
+    return json_response(data)
+
+
+@versions.conditional(_snapshot_validators)
+async def skills_distribution(request):
+    """Most common skills across the platform"""
+    snapshot = await aget_platform_snapshot()
     data = [
-        {'skill': skill.name, 'count': skill.user_count}
-        for skill in skills
+        {'skill': item['skill'], 'count': item['users']}
+        for item in snapshot['top_skills']
     ]
 
-    return JsonResponse({'skills': data})
+    return json_response({'skills': data})
+
+
+async def search_json(request):
+    """Ranked full-text search over posts and comments (?q=, ?hub=, ?type=, ?page=, ?fields=)"""
+    try:
+        selection = SEARCH_RESULTS.select(request)
+    except InvalidFields as error:
+        return invalid_fields_response(error)
+    page = await sync_to_async(search_request)(request)
+    if not page.query:
+        return error_response('Missing search query', 400)
+
+    return json_response({
+        'query': page.query,
+        'results': selection.shape(result.as_dict() for result in page.results),
+        'total': page.total,
+        'page': page.page,
+        'page_size': page.page_size,
+        'has_next': page.has_next,
+    })
+
+
+class InvalidBatch(ValueError):
+    """Raised for a batch body or query that isn't a list of API URLs"""
+
+
+def _batch_specs(request):
+    """[{'id', 'url'}] from a POSTed {"requests": [{"url", "id"?}]} or repeated ?url="""
+    if request.method == 'POST':
+        try:
+            specs = json.loads(request.body)['requests']
+            specs = [{'id': spec.get('id', spec['url']), 'url': spec['url']} for spec in specs]
+        except (ValueError, TypeError, KeyError, AttributeError):
+            raise InvalidBatch('Expected {"requests": [{"url": ..., "id": ...}, ...]}')
+    else:
+        specs = [{'id': url, 'url': url} for url in request.GET.getlist('url')]
+    if not specs:
+        raise InvalidBatch('No requests given')
+    if len(specs) > settings.API_BATCH_MAX_REQUESTS:
+        raise InvalidBatch(f'At most {settings.API_BATCH_MAX_REQUESTS} requests per batch')
+    for spec in specs:
+        if not isinstance(spec['url'], str) or not spec['url'].startswith('/') or urlsplit(spec['url']).netloc:
+            raise InvalidBatch(f'Not a path on this site: {spec["url"]!r}')
+    return specs
+
+
+def _sub_request(request, path, query):
+    """A GET for path?query with request's session and user"""
+    sub = HttpRequest()
+    sub.method = 'GET'
+    sub.path = sub.path_info = path
+    sub.META = {key: value for key, value in request.META.items() if key not in CONDITIONAL_HEADERS}
+    sub.META.update(REQUEST_METHOD='GET', PATH_INFO=path, QUERY_STRING=query)
+    sub.GET = QueryDict(query)
+    sub.COOKIES = request.COOKIES
+    for attribute in ('session', 'user', 'auser'):
+        if hasattr(request, attribute):
+            setattr(sub, attribute, getattr(request, attribute))
+    return sub
+
+
+async def _run_batched(request, url):
+    """(status, JSON body bytes or None) of one batched request"""
+    path, query = urlsplit(url)[2:4]
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return 404, encode({'error': 'Not found'})
+    if match.namespace != 'api' or match.url_name == 'batch':
+        return 400, encode({'error': 'Only other API endpoints can be batched'})
+
+    sub = _sub_request(request, path, query)
+    sub.resolver_match = match
+    view = match.func
+    if not iscoroutinefunction(view):
+        view = sync_to_async(view)
+    try:
+        response = await view(sub, *match.args, **match.kwargs)
+    except Http404:
+        return 404, encode({'error': 'Not found'})
+    except Exception:
+        logger.exception('Batched request to %s failed', url)
+        return 500, encode({'error': 'Server error'})
+    is_json = response.get('Content-Type', '').startswith('application/json')
+    return response.status_code, response.content if is_json else None
+
+
+@csrf_exempt    # only ever runs GETs of other API endpoints, which need no token either
+@require_http_methods(['GET', 'POST'])
+async def batch(request):
+    """
+    Several API GETs in one round trip (?url=/api/...&url=..., or POST
+    {"requests": [{"url": "/api/...", "id": "..."}]}); returns their statuses
+    and bodies in order. They share this request's session and user, and
+    reads they have in common (the platform snapshot) are done once.
+    """
+    try:
+        specs = _batch_specs(request)
+    except InvalidBatch as error:
+        return error_response(str(error), 400)
+
+    with sharing():
+        results = await asyncio.gather(*(_run_batched(request, spec['url']) for spec in specs))
+
+    # The bodies are already JSON, so they are spliced in rather than parsed and encoded again
+    parts = [splice({'id': spec['id'], 'status': status}, 'body', body)
+             for spec, (status, body) in zip(specs, results)]
+    return HttpResponse(b'{"responses":[' + b','.join(parts) + b']}', content_type='application/json')
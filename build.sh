@@ -5,4 +5,6 @@ pip install -r requirements.txt
 
 python manage.py collectstatic --no-input
 python manage.py migrate
+# Growth rollups for rows written before they existed; resumes from its checkpoint
+python manage.py backfill_rollups
 python manage.py seed_data
\ No newline at end of file
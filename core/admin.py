@@ -1,5 +1,10 @@
 from django.contrib import admin
-from .models import UserProfile, Hub, Post, Comment, MentorshipRequest, Skill, Badge, HelpfulVote
+from django.db.models import Q
+from django.utils import timezone
+from .models import (
+    UserProfile, Hub, Post, Comment, MentorshipRequest, Skill, Badge, HelpfulVote, ReputationEvent, Task, TaskSchedule,
+)
+from .search import get_backend
 
 
 @admin.register(UserProfile)
@@ -41,6 +46,15 @@ class PostAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at', 'updated_at', 'helpful_count']
     date_hierarchy = 'created_at'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Use the full-text index instead of LIKE scans over title/content; the
+        # admin pages the matches itself, so they aren't ranked or capped
+        if not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(
+            get_backend().post_filter(search_term) | Q(author__username__icontains=search_term)
+        ), False
+
 
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
@@ -62,4 +76,42 @@ class MentorshipRequestAdmin(admin.ModelAdmin):
 class HelpfulVoteAdmin(admin.ModelAdmin):
     list_display = ['user', 'post', 'comment', 'created_at']
     list_filter = ['created_at']
-    search_fields = ['user__username']
\ No newline at end of file
+    search_fields = ['user__username']
+
+
+@admin.register(ReputationEvent)
+class ReputationEventAdmin(admin.ModelAdmin):
+    list_display = ['user', 'kind', 'points', 'actor', 'created_at']
+    list_filter = ['kind', 'created_at']
+    search_fields = ['user__username']
+    raw_id_fields = ['user', 'actor', 'post', 'comment', 'mentorship']
+
+    # Events are written by core.reputation alongside the score update; the log is append-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'priority', 'attempts', 'run_at', 'locked_by', 'finished_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name']
+    readonly_fields = ['created_at', 'finished_at', 'locked_by', 'locked_until', 'last_error']
+    actions = ['retry']
+
+    @admin.action(description='Queue selected tasks to run again now')
+    def retry(self, request, queryset):
+        queued = queryset.exclude(status='running').update(
+            status='queued', attempts=0, run_at=timezone.now(), finished_at=None)
+        self.message_user(request, f'{queued} tasks queued.')
+
+
+@admin.register(TaskSchedule)
+class TaskScheduleAdmin(admin.ModelAdmin):
+    list_display = ['name', 'next_run_at']
\ No newline at end of file
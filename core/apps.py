@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Signal receivers and background tasks that live outside models.py
+        from . import (  # noqa: F401
+            buffers, checks, db, events, fragments, live, matching, memberships, profiling, ranking, reputation, rollups,
+            search, stats, tasks, timeline, versions, voting,
+        )
@@ -0,0 +1,81 @@
+"""
+Helpers for async views.
+
+Django's async ORM methods (aget, acount, async for) hand every query to the
+one thread that owns the request's database connection, so awaiting several of
+them with asyncio.gather still runs them one after another. gather_queries runs
+independent, read-only ORM calls on a small pool of GATHER_QUERY_THREADS
+threads that each keep their own connection, so they overlap for real without
+a new database connection per call. The pool threads' connections follow
+CONN_MAX_AGE like a request's do.
+
+Inside a sharing() block (the API's batch endpoint opens one), shared() runs
+each keyed read once and hands every caller the same result, so views called
+together don't repeat each other's aggregates.
+"""
+
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_shared_results = contextvars.ContextVar('shared_results', default=None)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.GATHER_QUERY_THREADS,
+                                           thread_name_prefix='gather-queries')
+        return _executor
+
+
+def _on_pool_connection(func):
+    def run():
+        # Like a request: drop the thread's connection first and last if it is broken or past CONN_MAX_AGE
+        close_old_connections()
+        try:
+            return func()
+        finally:
+            close_old_connections()
+    return run
+
+
+async def gather_queries(*funcs):
+    """Run zero-argument sync callables concurrently and return their results in order"""
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    return await asyncio.gather(*(
+        # Each with a copy of the caller's context (database routing, profiling), as sync_to_async would
+        loop.run_in_executor(executor, contextvars.copy_context().run, _on_pool_connection(func))
+        for func in funcs
+    ))
+
+
+@contextmanager
+def sharing():
+    """Share shared() results between everything awaited inside the block"""
+    token = _shared_results.set({})
+    try:
+        yield
+    finally:
+        _shared_results.reset(token)
+
+
+async def shared(key, factory):
+    """await factory(), or inside sharing(), the result of the first call made with key"""
+    results = _shared_results.get()
+    if results is None:
+        return await factory()
+    if key not in results:
+        # A task, so callers running concurrently wait on the same read
+        results[key] = asyncio.ensure_future(factory())
+    return await results[key]
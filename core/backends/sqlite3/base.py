@@ -0,0 +1,17 @@
+"""
+SQLite with write transactions that take the write lock up front.
+
+Django's default BEGIN is deferred: the transaction reads under a shared lock
+and asks for the write lock at its first write. If another connection wrote
+in between, SQLite can't wait that out (it would deadlock), so it fails with
+"database is locked" straight away, ignoring busy_timeout. BEGIN IMMEDIATE
+waits for the write lock at the start instead, where busy_timeout applies.
+(Django 5.1+ offers this as OPTIONS['transaction_mode'].)
+"""
+
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
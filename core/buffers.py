@@ -0,0 +1,219 @@
+"""
+Write-behind counters.
+
+Some writes land on the same few rows again and again: a viral post's
+helpful_count, its author's reputation_score, today's DailyRollup rows. Doing
+them in the writer's transaction makes every writer wait on the row locks of
+the one before. Instead, add() collects the deltas once the writer's
+transaction commits, keyed by a tuple whose first item names the applier
+registered for it, and flush() hands each applier its summed deltas in one
+transaction. A thousand votes on one post become one UPDATE per row.
+
+Where the deltas wait is up to COUNTER_BUFFER_BACKEND:
+
+    memory  in the process that wrote them. A timer thread flushes them
+            COUNTER_FLUSH_INTERVAL seconds after they arrive, or sooner once
+            COUNTER_FLUSH_THRESHOLD have piled up, and again at exit. A process
+            that is killed (SIGKILL, OOM) loses what it hadn't flushed: at most
+            the last COUNTER_FLUSH_INTERVAL seconds of deltas.
+    cache   in the shared Django cache (Redis), so any process or the periodic
+            flush_counters task can flush everyone's. Needs a cache all
+            processes share.
+
+Flushed deltas are only taken off the buffer once their transaction has
+committed, so a failed flush is retried rather than lost. The price is that a
+crash between the commit and the cleanup applies those deltas twice.
+"""
+
+import atexit
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+
+from .tasks import task
+
+logger = logging.getLogger(__name__)
+
+# name -> apply({key without the name: delta}), run inside the flush's transaction
+_appliers = {}
+
+
+def applier(name):
+    """Register the function that writes the deltas of keys starting with name"""
+    def register(func):
+        _appliers[name] = func
+        return func
+    return register
+
+
+def apply(deltas):
+    """Write {key: delta} with the registered appliers in one transaction; returns how many keys"""
+    grouped = defaultdict(dict)
+    for key, delta in deltas.items():
+        if delta:
+            grouped[key[0]][tuple(key[1:])] = delta
+    with transaction.atomic():
+        for name, group in grouped.items():
+            _appliers[name](group)
+    return len(deltas)
+
+
+def _flush_quietly(buffer):
+    """Flush for a writer that has already committed: a failure leaves the deltas buffered for the next try"""
+    try:
+        buffer.flush()
+    except Exception:
+        logger.exception('Flushing buffered counters failed; they stay buffered')
+        return False
+    return True
+
+
+class MemoryCounterBuffer:
+    """Per-process buffer, flushed by size, by a timer thread, or at interpreter exit"""
+
+    def __init__(self):
+        self._deltas = defaultdict(int)
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._due = threading.Event()
+
+    def add(self, key, delta):
+        with self._lock:
+            self._deltas[key] += delta
+            self._pending += 1
+            full = self._pending >= settings.COUNTER_FLUSH_THRESHOLD
+        if full:
+            _flush_quietly(self)
+        else:
+            self._due.set()
+
+    def flush(self):
+        with self._lock:
+            deltas, self._deltas = self._deltas, defaultdict(int)
+            self._pending = 0
+        if not deltas:
+            return 0
+        try:
+            return apply(deltas)
+        except Exception:
+            # Put the deltas back so the next flush retries them
+            with self._lock:
+                for key, delta in deltas.items():
+                    self._deltas[key] += delta
+                    self._pending += 1
+            raise
+
+    def _run_timer(self):
+        while True:
+            self._due.wait()
+            time.sleep(settings.COUNTER_FLUSH_INTERVAL)
+            self._due.clear()
+            try:
+                if not _flush_quietly(self):
+                    self._due.set()
+            finally:
+                # This thread's connections would otherwise stay open between flushes
+                connections.close_all()
+
+    def start(self):
+        threading.Thread(target=self._run_timer, name='counter-flush', daemon=True).start()
+        atexit.register(self.flush)
+
+
+class CacheCounterBuffer:
+    """
+    Buffer in the shared Django cache so all processes feed one flush.
+
+    Each key's delta is an integer cache entry updated with cache.incr. A key
+    with pending deltas is listed once, in a numbered registry slot taken with
+    cache.incr, guarded by a per-key flag set with cache.add, so concurrent
+    writers never overwrite each other's registrations. A flush reads the slots
+    since the last one, applies the deltas, and only then subtracts what it
+    applied and moves past those slots.
+    """
+    prefix = 'counters'
+    lock_key = 'counters:flush-lock'
+    due_key = 'counters:flush-due'
+    next_slot_key = 'counters:slots:next'
+    done_slot_key = 'counters:slots:done'
+
+    def _delta_key(self, key):
+        return f'{self.prefix}:delta:{json.dumps(list(key), separators=(",", ":"))}'
+
+    def _flag_key(self, delta_key):
+        return f'{delta_key}:listed'
+
+    def _slot_key(self, slot):
+        return f'{self.prefix}:slot:{slot}'
+
+    def add(self, key, delta):
+        delta_key = self._delta_key(key)
+        cache.add(delta_key, 0, timeout=None)
+        cache.incr(delta_key, delta)
+        if cache.add(self._flag_key(delta_key), 1, timeout=None):
+            cache.add(self.next_slot_key, 0, timeout=None)
+            cache.set(self._slot_key(cache.incr(self.next_slot_key)), delta_key, timeout=None)
+        done = cache.get(self.done_slot_key, 0)
+        pending = (cache.get(self.next_slot_key) or 0) - done
+        if pending >= settings.COUNTER_FLUSH_THRESHOLD or cache.add(
+                self.due_key, 1, settings.COUNTER_FLUSH_INTERVAL):
+            _flush_quietly(self)
+
+    def flush(self):
+        if not cache.add(self.lock_key, 1, timeout=60):
+            return 0
+        try:
+            done, last = cache.get(self.done_slot_key, 0), cache.get(self.next_slot_key) or 0
+            slot_keys = [self._slot_key(slot) for slot in range(done + 1, last + 1)]
+            delta_keys = set(cache.get_many(slot_keys).values())
+            # Unflag first: a delta added from here on lists its key again for
+            # the next flush. If apply() fails, done_slot_key stays put and the
+            # next flush reads these slots again.
+            cache.delete_many([self._flag_key(delta_key) for delta_key in delta_keys])
+            values = {delta_key: value for delta_key, value in cache.get_many(delta_keys).items() if value}
+            prefix = f'{self.prefix}:delta:'
+            flushed = apply({
+                tuple(json.loads(delta_key[len(prefix):])): value for delta_key, value in values.items()
+            })
+            # Subtract what was applied rather than resetting, so deltas that
+            # arrived meanwhile stay for the next flush
+            for delta_key, value in values.items():
+                cache.decr(delta_key, value)
+            cache.set(self.done_slot_key, last, timeout=None)
+            cache.delete_many(slot_keys)
+            return flushed
+        finally:
+            cache.delete(self.lock_key)
+
+
+BUFFERS = {'memory': MemoryCounterBuffer, 'cache': CacheCounterBuffer}
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = BUFFERS[settings.COUNTER_BUFFER_BACKEND]()
+            if isinstance(_buffer, MemoryCounterBuffer):
+                _buffer.start()
+        return _buffer
+
+
+def add(*key, delta=1):
+    """Buffer delta for key once the current transaction commits, so a rollback leaves nothing behind"""
+    transaction.on_commit(lambda: get_buffer().add(key, delta))
+
+
+@task()
+def flush_counters():
+    """Write this process's buffered deltas (everyone's with the cache buffer); returns how many keys"""
+    return get_buffer().flush()
@@ -0,0 +1,21 @@
+"""
+System checks for settings that would otherwise fail silently in production.
+"""
+
+from django.conf import settings
+from django.core.checks import Error, register
+
+from . import tasks
+
+
+@register()
+def task_queue_check(app_configs, **kwargs):
+    """Queued tasks in a local SQLite file never reach a worker running elsewhere"""
+    if settings.TASKS_EAGER or settings.DEBUG or not tasks.queue_is_local():
+        return []
+    return [Error(
+        'Background tasks are queued in a SQLite file that a worker on another machine cannot see.',
+        hint='Set DATABASE_URL to a database the web services and the worker share, or TASKS_EAGER=1 '
+             'to run tasks inline.',
+        id='core.E001',
+    )]
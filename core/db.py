@@ -0,0 +1,106 @@
+"""
+Database connection setup and read/write routing.
+
+Every new connection is tuned once, from settings: SQLITE_PRAGMAS (WAL so
+readers don't block on a writer, a busy timeout instead of an immediate
+"database is locked", and bigger page/mmap caches) or POSTGRES_SESSION_SETTINGS.
+Replica connections are also made read-only at the session level.
+
+PrimaryReplicaRouter sends all writes to 'default'. Reads go to one of
+DATABASE_REPLICAS only while a request for a REPLICA_READ_ROUTES view is
+being served and nothing has pinned it to the primary. A request is pinned
+once it writes, or when its client wrote within the last DATABASE_PIN_SECONDS
+(tracked with a cookie), so people always read their own writes. With no
+replicas configured everything stays on 'default'.
+"""
+
+import contextvars
+import random
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils.deprecation import MiddlewareMixin
+
+PRIMARY = 'default'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+@dataclass
+class RoutingState:
+    replica_reads: bool = False
+    pinned: bool = False
+    wrote: bool = False
+
+
+# Set per request by DatabaseRoutingMiddleware; code outside a request reads the primary
+_state = contextvars.ContextVar('db_routing_state', default=None)
+
+
+@receiver(connection_created)
+def configure_connection(sender, connection, **kwargs):
+    """Apply the per-connection settings for the backend"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for pragma, value in settings.SQLITE_PRAGMAS.items():
+                cursor.execute(f'PRAGMA {pragma} = {value}')
+        elif connection.vendor == 'postgresql':
+            session = dict(settings.POSTGRES_SESSION_SETTINGS)
+            if connection.alias in settings.DATABASE_REPLICAS:
+                session['default_transaction_read_only'] = 'on'
+            for name, value in session.items():
+                cursor.execute(f'SET {name} = %s', [value])
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if (state is None or not state.replica_reads or state.pinned or state.wrote
+                or not settings.DATABASE_REPLICAS):
+            return PRIMARY
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+def _reads_from_replica(resolver_match):
+    return any(
+        resolver_match.view_name == route if ':' in route else route in resolver_match.namespaces
+        for route in settings.REPLICA_READ_ROUTES
+    )
+
+
+class DatabaseRoutingMiddleware(MiddlewareMixin):
+    """Decide where each request's reads go and keep recent writers on the primary"""
+
+    def process_request(self, request):
+        _state.set(RoutingState(
+            pinned=request.method not in SAFE_METHODS or settings.DATABASE_PIN_COOKIE in request.COOKIES,
+        ))
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _state.get()
+        if state is not None and request.resolver_match is not None:
+            state.replica_reads = _reads_from_replica(request.resolver_match)
+
+    def process_response(self, request, response):
+        state = _state.get()
+        wrote = request.method not in SAFE_METHODS or (state is not None and state.wrote)
+        if settings.DATABASE_REPLICAS and wrote:
+            response.set_cookie(
+                settings.DATABASE_PIN_COOKIE, '1', max_age=settings.DATABASE_PIN_SECONDS,
+                httponly=True, samesite='Lax', secure=request.is_secure(),
+            )
+        return response
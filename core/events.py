@@ -0,0 +1,291 @@
+"""
+Live page updates: an in-process publish/subscribe broker.
+
+publish(channel, kind, data) sends a small JSON event to everyone following
+channel, once the publisher's transaction commits, so a page is never told
+about a row it can't read yet. Followers are async streams, one per open page
+(the event_stream SSE view, or the WebSocket endpoint in core/live.py). Each
+has a bounded asyncio queue that the broker fills from whichever thread the
+event arrives on.
+
+How an event gets from the publishing process to the streams is up to the
+backend (EVENTS_BACKEND):
+
+    memory    publish() hands the event straight to this process's streams.
+              Only enough when one process serves both the pages and the
+              streams, e.g. `uvicorn Astra.asgi:application` in development.
+    database  publish() inserts a LiveEvent row, and one thread per process
+              polls for new rows every EVENTS_POLL_INTERVAL seconds while
+              anyone is following. Works across web processes and the task
+              worker; rows are purged after EVENTS_RETENTION_SECONDS.
+
+Events are numbered in order, so a client that reconnects with Last-Event-ID
+is first sent the events it missed, as far as the backend still has them (the
+last EVENTS_REPLAY_LIMIT in memory, or the retained rows). A stream that falls
+EVENTS_QUEUE_SIZE events behind is ended and catches up the same way. Events
+are hints for an open page, not a log: one that is lost only means the page
+is as stale as it was before this existed until the next reload.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import aclosing
+from dataclasses import dataclass
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .async_utils import gather_queries
+from .models import LiveEvent
+from .tasks import task
+
+logger = logging.getLogger(__name__)
+
+POLL_BATCH_SIZE = 500
+
+
+@dataclass(frozen=True)
+class Event:
+    id: int
+    channel: str
+    kind: str
+    data: dict
+
+    def sse(self):
+        """The event as a text/event-stream message"""
+        return f'id: {self.id}\nevent: {self.kind}\ndata: {json.dumps(self.data)}\n\n'
+
+    def json(self):
+        return json.dumps({'id': self.id, 'channel': self.channel, 'kind': self.kind, 'data': self.data})
+
+
+class Subscription:
+    """One stream's place in the broker: the channels it follows and its queue of events"""
+
+    def __init__(self, channels):
+        self.channels = frozenset(channels)
+        self.queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+        self.loop = asyncio.get_running_loop()
+        self.overflowed = False
+
+    def deliver(self, event):
+        # Called from any thread; the queue belongs to the stream's event loop
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            pass    # the loop has closed, and the stream with it
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        """The next event, or None if none arrives within timeout seconds"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class Broker:
+    """Hands each event a backend receives to this process's subscriptions to its channel"""
+
+    def __init__(self):
+        self._subscriptions = {}    # channel -> set of Subscription
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels):
+        subscription = Subscription(channels)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                followers = self._subscriptions.get(channel, set())
+                followers.discard(subscription)
+                if not followers:
+                    self._subscriptions.pop(channel, None)
+
+    def channels(self):
+        """The channels anyone in this process follows"""
+        with self._lock:
+            return set(self._subscriptions)
+
+    def dispatch(self, event):
+        with self._lock:
+            followers = list(self._subscriptions.get(event.channel, ()))
+        for subscription in followers:
+            subscription.deliver(event)
+
+
+class MemoryBackend:
+    """Events go straight to this process's broker; the most recent are kept for replay"""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self._ids = itertools.count(1)
+        self._recent = deque(maxlen=settings.EVENTS_REPLAY_LIMIT)
+        self._lock = threading.Lock()
+
+    def send(self, channel, kind, data):
+        with self._lock:
+            event = Event(next(self._ids), channel, kind, data)
+            self._recent.append(event)
+        self.broker.dispatch(event)
+
+    def since(self, channels, last_id):
+        with self._lock:
+            return [event for event in self._recent if event.id > last_id and event.channel in channels]
+
+    def subscribed(self):
+        pass
+
+
+class DatabaseBackend:
+    """Events are LiveEvent rows; a polling thread hands new ones to this process's broker"""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self._last_id = None
+        self._poller = None
+        self._lock = threading.Lock()
+
+    def send(self, channel, kind, data):
+        LiveEvent.objects.create(channel=channel, kind=kind, data=data)
+
+    def since(self, channels, last_id):
+        rows = LiveEvent.objects.filter(channel__in=channels, pk__gt=last_id).order_by('pk')
+        return [_event(row) for row in rows[:settings.EVENTS_REPLAY_LIMIT]]
+
+    def subscribed(self):
+        """Start the poller with this process's first subscription"""
+        with self._lock:
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll_forever, name='live-events', daemon=True)
+                self._poller.start()
+
+    def _poll_forever(self):
+        while True:
+            close_old_connections()
+            try:
+                self.poll()
+            except Exception:
+                logger.exception('Polling for live events failed')
+            time.sleep(settings.EVENTS_POLL_INTERVAL)
+
+    def poll(self):
+        """Dispatch the rows added since the last poll; returns how many there were"""
+        if not self.broker.channels():
+            # Nobody to tell; start from the newest row again when someone subscribes
+            self._last_id = None
+            return 0
+        if self._last_id is None:
+            self._last_id = LiveEvent.objects.aggregate(last=Max('pk'))['last'] or 0
+        total = 0
+        while True:
+            rows = list(LiveEvent.objects.filter(pk__gt=self._last_id).order_by('pk')[:POLL_BATCH_SIZE])
+            for row in rows:
+                self.broker.dispatch(_event(row))
+            if rows:
+                self._last_id = rows[-1].pk
+            total += len(rows)
+            if len(rows) < POLL_BATCH_SIZE:
+                return total
+
+
+def _event(row):
+    return Event(row.pk, row.channel, row.kind, row.data)
+
+
+BACKENDS = {'memory': MemoryBackend, 'database': DatabaseBackend}
+
+broker = Broker()
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = BACKENDS[settings.EVENTS_BACKEND](broker)
+        return _backend
+
+
+def publish(channel, kind, data):
+    """Send an event to channel's followers once the current transaction commits; data must be JSON"""
+    transaction.on_commit(partial(_send, channel, kind, data))
+
+
+def _send(channel, kind, data):
+    try:
+        get_backend().send(channel, kind, data)
+    except Exception:
+        # The change itself has committed; a lost event only leaves pages stale
+        logger.exception('Publishing %s on %s failed', kind, channel)
+
+
+async def listen(channels, last_event_id=None, duration=None):
+    """
+    Yield the events published to channels: first those after last_event_id
+    the backend still has, then new ones as they arrive. Yields None after
+    every EVENTS_HEARTBEAT_SECONDS without an event, and stops after duration
+    seconds or when the caller falls too far behind.
+    """
+    backend = get_backend()
+    # Subscribe before replaying, so nothing published in between is missed
+    subscription = broker.subscribe(channels)
+    backend.subscribed()
+    try:
+        replayed = set()
+        if last_event_id is not None:
+            missed, = await gather_queries(partial(backend.since, subscription.channels, last_event_id))
+            for event in missed:
+                replayed.add(event.id)
+                yield event
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + duration if duration else None
+        while not subscription.overflowed:
+            timeout = settings.EVENTS_HEARTBEAT_SECONDS
+            if deadline is not None:
+                timeout = min(timeout, deadline - loop.time())
+                if timeout <= 0:
+                    return
+            event = await subscription.get(timeout)
+            if event is None or event.id not in replayed:
+                yield event
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def sse(channels, last_event_id=None):
+    """text/event-stream chunks for channels, ending after EVENTS_STREAM_SECONDS"""
+    # EventSource reconnects by itself, sending the last id it saw
+    yield f'retry: {settings.EVENTS_RETRY_MS}\n\n'
+    async with aclosing(listen(channels, last_event_id, settings.EVENTS_STREAM_SECONDS)) as stream:
+        async for event in stream:
+            # A comment line keeps proxies from closing an idle connection
+            yield ': keep-alive\n\n' if event is None else event.sse()
+
+
+@task(priority=-10)
+def purge_events():
+    """Delete LiveEvent rows older than EVENTS_RETENTION_SECONDS"""
+    cutoff = timezone.now() - timedelta(seconds=settings.EVENTS_RETENTION_SECONDS)
+    deleted, _ = LiveEvent.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,104 @@
+"""
+Streaming CSV / NDJSON exports.
+
+Rows are pulled from the database with QuerySet.iterator() and written out in
+fixed-size chunks through StreamingHttpResponse, so memory use and query count
+stay flat no matter how many rows an export has.
+"""
+
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from .models import Post, Comment, MentorshipRequest
+
+POST_TYPES = dict(Post.POST_TYPE_CHOICES)
+
+# dataset -> (queryset factory, [(column name, values() lookup)])
+DATASETS = {
+    'posts': (lambda: Post.objects.order_by('pk'), [
+        ('id', 'id'), ('hub', 'hub__slug'), ('author', 'author__username'), ('is_anonymous', 'is_anonymous'),
+        ('post_type', 'post_type'), ('title', 'title'), ('helpful_count', 'helpful_count'),
+        ('comment_count', 'comment_count'), ('created_at', 'created_at'), ('updated_at', 'updated_at'),
+    ]),
+    'comments': (lambda: Comment.objects.order_by('pk'), [
+        ('id', 'id'), ('post_id', 'post_id'), ('author', 'author__username'),
+        ('is_accepted_answer', 'is_accepted_answer'), ('helpful_count', 'helpful_count'),
+        ('content', 'content'), ('created_at', 'created_at'),
+    ]),
+    'mentorship': (lambda: MentorshipRequest.objects.order_by('pk'), [
+        ('id', 'id'), ('mentee', 'mentee__username'), ('mentor', 'mentor__username'), ('topic', 'topic'),
+        ('status', 'status'), ('created_at', 'created_at'), ('updated_at', 'updated_at'),
+    ]),
+}
+
+
+class Echo:
+    """File-like object whose write() hands the line back instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def _chunked(lines):
+    """Join small lines into chunks of roughly EXPORT_CHUNK_BYTES to keep write overhead down"""
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= settings.EXPORT_CHUNK_BYTES:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def csv_lines(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(header, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(header, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+FORMATS = {
+    'csv': (csv_lines, 'text/csv'),
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+}
+
+
+def stream(header, rows, fmt, filename):
+    """StreamingHttpResponse that writes rows in the given format as an attachment"""
+    render, content_type = FORMATS[fmt]
+    response = StreamingHttpResponse(_chunked(render(header, rows)), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def dataset_rows(name):
+    """(header, row iterator) for one of the staff bulk-export DATASETS"""
+    queryset, columns = DATASETS[name]
+    header = [column for column, _ in columns]
+    rows = queryset().values_list(*[lookup for _, lookup in columns]).iterator(
+        chunk_size=settings.EXPORT_CHUNK_SIZE)
+    return header, rows
+
+
+def portfolio_rows(user):
+    """(header, row iterator) for a user's portfolio export"""
+    header = ['Type', 'Title', 'Hub', 'Date', 'Helpful Count', 'Comments']
+    posts = user.posts.values_list(
+        'post_type', 'title', 'hub__name', 'created_at', 'helpful_count', 'comment_count'
+    ).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    rows = (
+        (POST_TYPES.get(post_type, post_type), title, hub, created_at.strftime('%Y-%m-%d'), helpful, comments)
+        for post_type, title, hub, created_at, helpful, comments in posts
+    )
+    return header, rows
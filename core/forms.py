@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from . import images
 from .models import UserProfile, Post, Comment, MentorshipRequest
 
 
@@ -28,6 +29,8 @@ class SignUpForm(UserCreationForm):
 
 
 class UserProfileForm(forms.ModelForm):
+    processed_image = None
+
     class Meta:
         model = UserProfile
         fields = ['bio', 'profile_image', 'location', 'visibility_mode', 'is_mentor', 'skills', 'equity_badges']
@@ -40,6 +43,20 @@ class UserProfileForm(forms.ModelForm):
             'equity_badges': forms.CheckboxSelectMultiple(),
         }
 
+    def clean_profile_image(self):
+        image = self.cleaned_data.get('profile_image')
+        # Decode new uploads here so a bad file is a form error; the files are written in save()
+        self.processed_image = images.process(image) if image and 'profile_image' in self.changed_data else None
+        return image
+
+    def save(self, commit=True):
+        if self.processed_image is not None:
+            images.save(self.processed_image)
+            images.apply(self.instance, self.processed_image)
+        elif not self.instance.profile_image:
+            self.instance.avatar_hash = ''
+        return super().save(commit)
+
 
 class PostForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,242 @@
+"""
+Versioned template fragment cache.
+
+{% fragment 'post_card' post ... %} caches a rendered block under a key built
+from the fragment name and its arguments. Model instances contribute a version
+rather than their raw values:
+
+    Post         its own updated_at, helpful_count and comment_count, so an
+                 edit, vote or comment changes the key with no lookup
+    UserProfile  a token in the cache, replaced by receivers on every profile,
+                 user, skill or badge change
+
+Any other argument (a display name, a hub name...) is part of the key as-is,
+so anything that changes on its own, like a relative time, belongs in an
+{% uncached %} block inside the fragment instead: it is left out of the
+cached HTML and rendered on every request. Old entries are never deleted,
+just no longer asked for, and expire after FRAGMENT_CACHE_TTL.
+
+A profile token replaced in one process's cache is invisible to the others
+unless the cache is shared, so fragments keyed on a profile are only cached
+for FRAGMENT_PROFILE_CACHE_TTL, which is 0 (render every time) without one.
+
+Hits, misses and stored bytes per fragment are counted locally and added to
+counters in the cache every FRAGMENT_STATS_FLUSH_EVERY renders, so with a
+shared cache (FRAGMENT_STATS_SHARED) stats() reports all workers, and
+without one just the process asked.
+"""
+
+import hashlib
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import Post, UserProfile, Skill, Badge
+
+# name -> what it caches, shown next to its stats on the analytics dashboard
+FRAGMENTS = {
+    'post_card': 'Post cards in the home feed',
+    'hub_post_card': 'Post cards on hub pages',
+    'profile_post_card': 'Post cards on profile pages',
+    'profile_sidebar': 'Skills and badges on profile pages',
+    'mentor_skills': 'Skills on mentor cards',
+}
+
+PROFILES_KEY = 'fragment:version:profiles'
+STATS_FIELDS = ('hits', 'misses', 'bytes_stored', 'bytes_served')
+
+
+def _profile_key(user_id):
+    return f'fragment:version:profile:{user_id}'
+
+
+def _post_version(post):
+    return f'post:{post.pk}:{post.updated_at.timestamp()}:{post.helpful_count}:{post.comment_count}'
+
+
+def _new_token():
+    return time.time_ns()
+
+
+def _profile_versions(profiles):
+    """Current tokens for the profiles; missing ones get a fresh token, never an old one"""
+    keys = [PROFILES_KEY, *(_profile_key(profile.user_id) for profile in profiles)]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, _new_token(), timeout=None)
+            found[key] = cache.get(key)
+    return [f'{key}={found[key]}' for key in keys]
+
+
+def make_key(name, args):
+    """(cache key, timeout) for fragment name rendered with args; the timeout is 0 when it mustn't be cached"""
+    parts = [name]
+    profiles = []
+    for arg in args:
+        if isinstance(arg, Post):
+            parts.append(_post_version(arg))
+        elif isinstance(arg, UserProfile):
+            profiles.append(arg)
+        else:
+            parts.append(repr(arg))
+    if profiles:
+        if not settings.FRAGMENT_PROFILE_CACHE_TTL:
+            return None, 0
+        parts += _profile_versions(profiles)
+    digest = hashlib.md5('|'.join(parts).encode(), usedforsecurity=False).hexdigest()
+    timeout = settings.FRAGMENT_PROFILE_CACHE_TTL if profiles else settings.FRAGMENT_CACHE_TTL
+    return f'fragment:{name}:{digest}', timeout
+
+
+def get_or_render(name, args, render):
+    """Return the cached fragment, or render() it and cache the result"""
+    key, timeout = make_key(name, args)
+    if not timeout:
+        return render()
+    html = cache.get(key)
+    if html is not None:
+        _record(name, hits=1, bytes_served=len(html))
+        return html
+    html = render()
+    cache.set(key, html, timeout=timeout)
+    _record(name, misses=1, bytes_stored=len(html))
+    return html
+
+
+def bump_profiles(user_ids=None):
+    """Invalidate fragments for the given users' profiles, or for every profile"""
+    if user_ids is None:
+        cache.set(PROFILES_KEY, _new_token(), timeout=None)
+    else:
+        token = _new_token()
+        cache.set_many({_profile_key(user_id): token for user_id in user_ids}, timeout=None)
+
+
+def _bump_on_commit(user_ids=None):
+    # After commit, so a render in between can't cache the old data under the new token
+    transaction.on_commit(partial(bump_profiles, user_ids))
+
+
+# --- stats ---
+
+_pending = Counter()
+_pending_events = 0
+_pending_lock = threading.Lock()
+
+
+def _stats_key(name, field):
+    return f'fragment:stats:{name}:{field}'
+
+
+def _record(name, **counts):
+    global _pending_events
+    with _pending_lock:
+        _pending.update({(name, field): value for field, value in counts.items()})
+        _pending_events += 1
+        if _pending_events < settings.FRAGMENT_STATS_FLUSH_EVERY:
+            return
+        pending = dict(_pending)
+        _pending.clear()
+        _pending_events = 0
+    _add_to_cache(pending)
+
+
+def _add_to_cache(pending):
+    for (name, field), value in pending.items():
+        key = _stats_key(name, field)
+        if not cache.add(key, value, timeout=None):
+            try:
+                cache.incr(key, value)
+            except ValueError:
+                # Evicted between add and incr
+                cache.set(key, value, timeout=None)
+
+
+def flush_stats():
+    """Push this process's unflushed counts to the shared counters"""
+    global _pending_events
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _pending_events = 0
+    _add_to_cache(pending)
+
+
+@dataclass
+class FragmentStats:
+    name: str
+    description: str
+    hits: int = 0
+    misses: int = 0
+    bytes_stored: int = 0
+    bytes_served: int = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    @property
+    def avg_size(self):
+        return self.bytes_stored // self.misses if self.misses else 0
+
+
+def stats():
+    """FragmentStats for every fragment, across all workers if FRAGMENT_STATS_SHARED"""
+    flush_stats()
+    keys = [_stats_key(name, field) for name in FRAGMENTS for field in STATS_FIELDS]
+    found = cache.get_many(keys)
+    return [
+        FragmentStats(name, description, **{
+            field: found.get(_stats_key(name, field), 0) for field in STATS_FIELDS
+        })
+        for name, description in FRAGMENTS.items()
+    ]
+
+
+# --- invalidation ---
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def profile_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _bump_on_commit([instance.user_id])
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Names feed the display name; a login only touches last_login
+    if raw or created or update_fields == frozenset({'last_login'}):
+        return
+    _bump_on_commit([instance.pk])
+
+
+@receiver(m2m_changed, sender=UserProfile.skills.through)
+@receiver(m2m_changed, sender=UserProfile.equity_badges.through)
+def profile_tags_changed(sender, instance, action, reverse, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # skill.users.add(...): several profiles at once, rare enough to drop them all
+        _bump_on_commit()
+    else:
+        _bump_on_commit([instance.user_id])
+
+
+@receiver(post_save, sender=Skill)
+@receiver(post_delete, sender=Skill)
+@receiver(post_save, sender=Badge)
+@receiver(post_delete, sender=Badge)
+def tag_changed(sender, raw=False, **kwargs):
+    if not raw:
+        _bump_on_commit()
@@ -0,0 +1,133 @@
+"""
+Profile photo processing.
+
+An upload is decoded once with Pillow, turned upright from its EXIF
+orientation, and re-encoded without any metadata (EXIF, GPS, ICC, comments):
+a JPEG copy no larger than AVATAR_ORIGINAL_MAX, plus square avatar renditions
+for each of AVATAR_SIZES in each of AVATAR_FORMATS. Every file is named after
+the SHA-256 of the uploaded bytes,
+
+    avatars/<first two hex digits>/<sha256>.jpg           the cleaned original
+    avatars/<first two hex digits>/<sha256>-<size>.<ext>  the renditions
+
+so a name never changes content. The avatar_file view serves them with
+far-future cache headers, and identical uploads map to the same files, which
+are only written once. `python manage.py build_avatars` processes images
+uploaded before this pipeline existed.
+"""
+
+import hashlib
+import io
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# format -> (Pillow format, file extension, MIME type)
+FORMATS = {
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+}
+CONTENT_TYPES = {ext: mime for _, ext, mime in FORMATS.values()}
+
+
+def _prefix(digest):
+    return f'avatars/{digest[:2]}/{digest}'
+
+
+def original_name(digest):
+    return f'{_prefix(digest)}.jpg'
+
+
+def rendition_name(digest, size, fmt):
+    return f'{_prefix(digest)}-{size}.{FORMATS[fmt][1]}'
+
+
+def rendition_names(digest):
+    return [rendition_name(digest, size, fmt) for size in settings.AVATAR_SIZES for fmt in settings.AVATAR_FORMATS]
+
+
+@dataclass
+class ProcessedImage:
+    digest: str
+    files: dict = field(default_factory=dict)   # storage name -> bytes
+
+    @property
+    def original_name(self):
+        return original_name(self.digest)
+
+
+def _encode(image, fmt):
+    pillow_format = FORMATS[fmt][0]
+    if pillow_format == 'JPEG' and image.mode != 'RGB':
+        # JPEG has no alpha; put transparent areas on white rather than black
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    buffer = io.BytesIO()
+    # No exif= or icc_profile= arguments, so none of the source metadata is written
+    image.save(buffer, pillow_format, quality=settings.AVATAR_FORMATS.get(fmt, 85), optimize=True)
+    return buffer.getvalue()
+
+
+def process(upload):
+    """
+    Decode an uploaded image file and build its cleaned original and renditions
+    in memory. Raises ValidationError for files Pillow can't read or that are
+    larger than AVATAR_MAX_PIXELS.
+    """
+    upload.seek(0)
+    data = upload.read()
+    digest = hashlib.sha256(data).hexdigest()
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.width * image.height > settings.AVATAR_MAX_PIXELS:
+            raise ValidationError('That image is too large. Please upload one under %(limit)s megapixels.',
+                                  params={'limit': settings.AVATAR_MAX_PIXELS // 1_000_000})
+        # Let the JPEG decoder downscale by a power of two when the result is still big enough
+        image.draft('RGB', (settings.AVATAR_ORIGINAL_MAX, settings.AVATAR_ORIGINAL_MAX))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise ValidationError('Upload a valid image. The file you uploaded was either not an image or corrupted.')
+
+    processed = ProcessedImage(digest)
+    original = image.copy()
+    original.thumbnail((settings.AVATAR_ORIGINAL_MAX, settings.AVATAR_ORIGINAL_MAX), Image.LANCZOS)
+    processed.files[processed.original_name] = _encode(original, 'jpeg')
+    for size in settings.AVATAR_SIZES:
+        square = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        for fmt in settings.AVATAR_FORMATS:
+            processed.files[rendition_name(digest, size, fmt)] = _encode(square, fmt)
+    return processed
+
+
+def save(processed):
+    """Write the files that aren't in storage yet (an identical upload may have written them)"""
+    for name, content in processed.files.items():
+        if not default_storage.exists(name):
+            default_storage.save(name, ContentFile(content))
+
+
+def apply(profile, processed):
+    """Point profile at a processed image; the caller saves the profile"""
+    # Assigning a name (not the upload) stops ImageField from saving the raw file as well
+    profile.profile_image = processed.original_name
+    profile.avatar_hash = processed.digest
+
+
+def has_renditions(digest):
+    return all(default_storage.exists(name) for name in rendition_names(digest))
+
+
+def url(name):
+    return reverse('core:avatar_file', args=[name.removeprefix('avatars/')])
+
+
+def srcset(digest, fmt):
+    """srcset attribute value listing every rendition of one format"""
+    return ', '.join(f'{url(rendition_name(digest, size, fmt))} {size}w' for size in settings.AVATAR_SIZES)
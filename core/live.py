@@ -0,0 +1,193 @@
+"""
+What open pages are told about (see core/events.py for the delivery).
+
+A post_detail page follows post:<pk>, and the mentorship dashboard follows
+mentorship:<user pk> for the viewer. Events carry only what changed, and the
+page's script patches itself with them instead of being reloaded:
+
+    post:<pk>             comment             a new comment on the post
+                          helpful             the post's or a comment's new helpful_count
+    mentorship:<user pk>  mentorship          a request the user sent or received changed status
+                          mentorship_request  the user received a new request
+
+Pages follow channels through the event_stream view (Server-Sent Events).
+Clients that would rather hold a WebSocket can connect to
+EVENTS_WEBSOCKET_PATH with the same ?channel= parameters; Astra/asgi.py
+routes it to websocket_application below.
+
+The streams can be served by a different process from the pages (EVENTS_URL),
+so the pages stay on WSGI with persistent database connections while only the
+long-lived streams wait on an event loop. The viewer's session cookie isn't
+sent there, so pages following a user's channel pass ?token=, the user's pk
+signed with the shared SECRET_KEY (events_token).
+"""
+
+import asyncio
+from contextlib import aclosing
+from functools import partial
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlsplit
+
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.contrib.auth.models import AnonymousUser, User
+from django.core import signing
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.http import parse_cookie
+
+from . import events
+from .async_utils import gather_queries
+from .models import Post, Comment, MentorshipRequest
+
+# Most channels one stream may follow
+MAX_CHANNELS = 10
+# Channels that follow the viewer rather than a public object
+USER_CHANNELS = {'mentorship'}
+TOKEN_SALT = 'core.live.events'
+
+
+def post_channel(post_id):
+    return f'post:{post_id}'
+
+
+def mentorship_channel(user_id):
+    return f'mentorship:{user_id}'
+
+
+def channels_for(user, requested):
+    """
+    The channels user may follow out of the requested names: 'post:<pk>' for
+    any post, and 'mentorship' for their own requests if they are logged in
+    """
+    channels = set()
+    for name in requested[:MAX_CHANNELS]:
+        kind, _, pk = name.partition(':')
+        if kind == 'post' and pk.isdigit():
+            channels.add(post_channel(int(pk)))
+        elif name == 'mentorship' and user.is_authenticated:
+            channels.add(mentorship_channel(user.pk))
+    return channels
+
+
+def events_token(user):
+    """A token that signs user in to the event streams of another process (EVENTS_URL)"""
+    return signing.dumps(user.pk, salt=TOKEN_SALT)
+
+
+def token_user(token):
+    """The active user events_token() signed for, or AnonymousUser for a bad or expired token"""
+    try:
+        pk = signing.loads(token, salt=TOKEN_SALT, max_age=settings.EVENTS_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return AnonymousUser()
+    return User.objects.filter(pk=pk, is_active=True).first() or AnonymousUser()
+
+
+async def afollower(user, token):
+    """user, or if they aren't logged in here the user token was signed for"""
+    if user.is_authenticated or not token:
+        return user
+    found, = await gather_queries(partial(token_user, token))
+    return found
+
+
+def allowed_origin(origin):
+    """Whether pages at origin (scheme://host) may follow streams here (EVENTS_ALLOWED_ORIGINS)"""
+    return origin in settings.EVENTS_ALLOWED_ORIGINS
+
+
+def parse_last_event_id(value):
+    return int(value) if value and value.isdigit() else None
+
+
+def helpful_counts_changed(post_ids=(), comment_ids=()):
+    """Tell the pages of the given posts and comments their current helpful_count"""
+    if post_ids:
+        for pk, count in Post.objects.filter(pk__in=post_ids).values_list('pk', 'helpful_count'):
+            events.publish(post_channel(pk), 'helpful', {'target': 'post', 'id': pk, 'helpful_count': count})
+    if comment_ids:
+        rows = Comment.objects.filter(pk__in=comment_ids).values_list('pk', 'post_id', 'helpful_count')
+        for pk, post_id, count in rows:
+            events.publish(post_channel(post_id), 'helpful', {'target': 'comment', 'id': pk, 'helpful_count': count})
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        return
+    events.publish(post_channel(instance.post_id), 'comment', {
+        'id': instance.pk,
+        'author': instance.author.get_full_name() or instance.author.username,
+        'content': instance.content,
+        'helpful_count': instance.helpful_count,
+        'created_at': instance.created_at.isoformat(),
+    })
+
+
+@receiver(post_save, sender=MentorshipRequest)
+def mentorship_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        events.publish(mentorship_channel(instance.mentor_id), 'mentorship_request',
+                       {'id': instance.pk, 'topic': instance.topic})
+        return
+    data = {'id': instance.pk, 'status': instance.status, 'status_display': instance.get_status_display()}
+    for user_id in (instance.mentee_id, instance.mentor_id):
+        events.publish(mentorship_channel(user_id), 'mentorship', data)
+
+
+def _scope_user(headers):
+    """The user logged in with the session cookie among an ASGI scope's headers"""
+    cookies = parse_cookie(headers.get(b'cookie', b'').decode('latin-1'))
+    session = import_module(settings.SESSION_ENGINE).SessionStore(cookies.get(settings.SESSION_COOKIE_NAME))
+    return get_user(SimpleNamespace(session=session))
+
+
+def _same_origin(headers):
+    # Browsers always send Origin with a WebSocket handshake; other clients may not
+    origin = headers.get(b'origin')
+    if origin is None:
+        return True
+    origin = origin.decode('latin-1')
+    return urlsplit(origin).netloc == headers.get(b'host', b'').decode('latin-1') or allowed_origin(origin)
+
+
+async def websocket_application(scope, receive, send):
+    """
+    ASGI app for WebSocket connections to EVENTS_WEBSOCKET_PATH. Takes the
+    same ?channel= (and ?last_event_id=, ?token=) parameters as the event_stream view
+    and sends each event as a JSON text message {id, channel, kind, data}.
+    """
+    if (await receive())['type'] != 'websocket.connect':
+        return
+    headers = dict(scope.get('headers', []))
+    if scope['path'] != settings.EVENTS_WEBSOCKET_PATH or not _same_origin(headers):
+        await send({'type': 'websocket.close', 'code': 4403})
+        return
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    user, = await gather_queries(partial(_scope_user, headers))
+    user = await afollower(user, query.get('token', [''])[0])
+    channels = channels_for(user, query.get('channel', []))
+    if not channels:
+        await send({'type': 'websocket.close', 'code': 4400})
+        return
+    await send({'type': 'websocket.accept'})
+
+    async def forward():
+        last_event_id = parse_last_event_id(query.get('last_event_id', [''])[0])
+        async with aclosing(events.listen(channels, last_event_id)) as stream:
+            async for event in stream:
+                if event is not None:
+                    await send({'type': 'websocket.send', 'text': event.json()})
+        # Only reached when the client fell behind; it reconnects with the last id it saw
+        await send({'type': 'websocket.close', 'code': 4408})
+
+    forwarding = asyncio.ensure_future(forward())
+    try:
+        while (await receive())['type'] != 'websocket.disconnect':
+            pass
+    finally:
+        forwarding.cancel()
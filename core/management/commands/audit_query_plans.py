@@ -0,0 +1,87 @@
+import re
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count, Q
+
+from core import reputation
+from core.matching import OPEN_STATUSES
+from core.models import Post, Comment, MentorshipRequest, HelpfulVote, TimelineEntry
+
+# The query shapes behind the busiest pages, as the views and services build
+# them. Plans don't depend on the ids or dates, so any will do.
+SOME_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+HOT_QUERIES = {
+    'hub feed': lambda: Post.objects.filter(hub_id=1).order_by('-created_at', '-id')[:21],
+    'hub feed, later page': lambda: Post.objects.filter(hub_id=1).filter(
+        Q(created_at__lt=SOME_TIME) | Q(created_at=SOME_TIME, id__lt=1)
+    ).order_by('-created_at', '-id')[:21],
+    'profile posts': lambda: Post.objects.filter(author_id=1).order_by('-created_at', '-id')[:21],
+    'hub feed, hot': lambda: Post.objects.filter(hub_id=1).order_by('-hot_score', '-id')[:21],
+    'hub feed, top this week': lambda: Post.objects.filter(hub_id=1, created_at__gte=SOME_TIME).order_by(
+        '-top_score', '-id')[:21],
+    'all posts, hot': lambda: Post.objects.order_by('-hot_score', '-id')[:21],
+    'home timeline': lambda: TimelineEntry.objects.filter(user_id=1).order_by('-created_at', '-post_id')[:21],
+    'post comments': lambda: Comment.objects.filter(post_id=1),
+    'mentor requests': lambda: MentorshipRequest.objects.filter(mentor_id=1),
+    'mentee requests': lambda: MentorshipRequest.objects.filter(mentee_id=1),
+    'mentor load': lambda: MentorshipRequest.objects.filter(
+        mentor_id__in=[1, 2, 3], status__in=OPEN_STATUSES
+    ).order_by().values_list('mentor_id').annotate(total=Count('pk')),
+    'post vote': lambda: HelpfulVote.objects.filter(user_id=1, post_id=1),
+    'comment votes on a post': lambda: HelpfulVote.objects.filter(
+        user_id=1, comment__post_id=1
+    ).values_list('comment_id', flat=True),
+    'leaderboard': lambda: reputation.leaderboard(50),
+}
+
+# Plan lines that mean a full scan or a sort the index didn't provide. Walking
+# an index in order (a LIMITed top-N like the leaderboard) is fine.
+BAD_PLAN_LINES = {
+    'sqlite': re.compile(r'\bSCAN\b(?!.*\bUSING (?:COVERING )?INDEX\b)|USE TEMP B-TREE'),
+    'postgresql': re.compile(r'Seq Scan|(?<!Incremental )\bSort\b'),
+}
+
+
+class Command(BaseCommand):
+    help = 'EXPLAINs the hot querysets and fails if any needs a full scan or an in-memory sort'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--queries', nargs='*', help='Only audit these (default: all of HOT_QUERIES)')
+        parser.add_argument('--analyze', action='store_true',
+                            help='Refresh the planner statistics first; without them some plans fall back to sorts')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        bad_line = BAD_PLAN_LINES.get(connection.vendor)
+        if bad_line is None:
+            raise CommandError(f'No plan rules for {connection.vendor}')
+        if options['analyze']:
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        names = options['queries'] or list(HOT_QUERIES)
+        unknown = set(names) - set(HOT_QUERIES)
+        if unknown:
+            raise CommandError(f'Unknown queries: {", ".join(sorted(unknown))}')
+
+        failures = []
+        for name in names:
+            plan = HOT_QUERIES[name]().using(options['database']).explain()
+            offending = [line.strip() for line in plan.splitlines() if bad_line.search(line)]
+            if offending:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f'✗ {name}'))
+                for line in offending:
+                    self.stdout.write(f'    {line}')
+            else:
+                self.stdout.write(f'✓ {name}')
+            if options['verbosity'] > 1:
+                self.stdout.write('\n'.join(f'    | {line}' for line in plan.splitlines()))
+
+        if failures:
+            raise CommandError(f'{len(failures)} hot queries scan or sort: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS(f'✅ {len(names)} query plans use indexes'))
@@ -0,0 +1,277 @@
+import io
+import json
+import logging
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.template.backends.django import Template as BackendTemplate
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import URLResolver, get_resolver, reverse
+
+from core.models import Hub, Post, MentorshipRequest, UserProfile
+
+BENCHMARKED_NAMESPACES = ('core', 'api')
+
+# Routes that change state on GET, only accept POST, serve uploaded files or stream
+SKIPPED_ROUTES = {'core:logout', 'core:join_hub', 'core:vote_helpful', 'core:vote_comment_helpful', 'core:avatar_file',
+                  'core:event_stream'}
+
+QUERY_STRINGS = {
+    'core:search': 'q=career',
+    'api:search_json': 'q=career',
+    'api:batch': 'url=/api/stats/platform/&url=/api/stats/growth/&url=/api/stats/skills/&url=/api/hubs/',
+}
+
+
+class QueryTimer:
+    """connection.execute_wrapper hook that counts queries and adds up their time"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+@contextmanager
+def render_timer():
+    """Time top-level template renders (includes go through the engine's own Template and aren't double counted)"""
+    timer = {'seconds': 0.0}
+    original = BackendTemplate.render
+
+    def timed_render(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return original(self, *args, **kwargs)
+        finally:
+            timer['seconds'] += time.perf_counter() - started
+
+    BackendTemplate.render = timed_render
+    try:
+        yield timer
+    finally:
+        BackendTemplate.render = original
+
+
+def discover_routes():
+    """[(name, [url kwarg names])] for every named route in the benchmarked namespaces"""
+    routes = []
+    for pattern in get_resolver().url_patterns:
+        if isinstance(pattern, URLResolver) and pattern.namespace in BENCHMARKED_NAMESPACES:
+            for route in pattern.url_patterns:
+                name = f'{pattern.namespace}:{route.name}'
+                if route.name and name not in SKIPPED_ROUTES:
+                    routes.append((name, list(getattr(route.pattern, 'converters', {}))))
+    return routes
+
+
+def percentile(values, pct):
+    if len(values) < 2:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[pct - 1]
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks every page and API route against a generated dataset and checks query budgets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', default='small', help='generate_dataset preset to benchmark against')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--current-db', action='store_true',
+                            help='Benchmark the configured database as-is instead of a generated test database')
+        parser.add_argument('--username', help='With --current-db, the user to benchmark as (default: first staff user)')
+        parser.add_argument('--iterations', type=int, default=10)
+        parser.add_argument('--warmup', type=int, default=1)
+        parser.add_argument('--routes', nargs='*', help='Only benchmark these route names (e.g. core:home)')
+        parser.add_argument('--baseline', default=str(settings.BENCHMARK_BASELINE))
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Write these results as the new baseline instead of comparing')
+        parser.add_argument('--latency-tolerance', type=float, default=0.5,
+                            help='Flag routes whose p95 is this fraction over the baseline p95')
+        parser.add_argument('--latency-floor-ms', type=float, default=5.0,
+                            help='Ignore p95 increases smaller than this, which are mostly timer noise')
+        parser.add_argument('--fail-on-latency', action='store_true',
+                            help='Treat latency regressions as failures, not just warnings')
+        parser.add_argument('--output', help='Also write the raw results to this JSON file')
+
+    # Query budgets are counted on the primary connection, so keep every read there
+    @override_settings(DATABASE_REPLICAS=[])
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = None
+        try:
+            if not options['current_db']:
+                old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+                self.stdout.write(f'🌱 Generating {options["scale"]} dataset...')
+                call_command('generate_dataset', scale=options['scale'], seed=options['seed'],
+                             stdout=self.stdout if options['verbosity'] > 1 else io.StringIO())
+            results = self.run_benchmarks(options)
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(results, handle, indent=2)
+
+        if options['update_baseline']:
+            with open(options['baseline'], 'w') as handle:
+                json.dump({
+                    'dataset': {'scale': options['scale'], 'seed': options['seed'], 'current_db': options['current_db']},
+                    'routes': results,
+                }, handle, indent=2, sort_keys=True)
+                handle.write('\n')
+            self.stdout.write(self.style.SUCCESS(f'✅ Baseline written to {options["baseline"]}'))
+            return
+
+        self.compare(results, options)
+
+    # -- running -------------------------------------------------------------
+
+    def fixtures(self, options):
+        """Pick the busiest rows so N+1 patterns show up, and a staff mentor who owns some of them"""
+        if options['current_db']:
+            user = User.objects.filter(username=options['username']).first() if options['username'] \
+                else User.objects.filter(is_staff=True).order_by('pk').first()
+            if user is None:
+                raise CommandError('No staff user to benchmark as; pass --username')
+        else:
+            profiles = UserProfile.objects.select_related('user').order_by('-post_count', 'pk')
+            profile = (profiles.filter(is_mentor=True, user__mentor_requests__isnull=False).first()
+                       or profiles.first())
+            if profile is None:
+                raise CommandError('The generated dataset has no users')
+            user = profile.user
+            user.is_staff = True
+            user.save(update_fields=['is_staff'])
+
+        post = Post.objects.filter(author=user).order_by('-comment_count', 'pk').first() or Post.objects.first()
+        hub = Hub.objects.order_by('-post_count', 'pk').first()
+        mentor = (UserProfile.objects.filter(is_mentor=True).exclude(user=user)
+                  .select_related('user').order_by('-reputation_score', 'pk').first())
+        mentorship = (MentorshipRequest.objects.filter(mentor=user).first()
+                      or MentorshipRequest.objects.first())
+        return user, {
+            'pk': post.pk if post else 0,
+            'post_pk': post.pk if post else 0,
+            'slug': hub.slug if hub else '',
+            'hub_slug': hub.slug if hub else '',
+            'username': user.username,
+            'dataset': 'posts',
+            'fmt': 'csv',
+        }, {
+            'core:request_mentorship': {'username': mentor.user.username if mentor else user.username},
+            'core:update_mentorship_status': {'pk': mentorship.pk if mentorship else 0},
+        }
+
+    def run_benchmarks(self, options):
+        user, defaults, overrides = self.fixtures(options)
+        client = Client()
+        client.force_login(user)
+
+        routes = discover_routes()
+        if options['routes']:
+            routes = [(name, params) for name, params in routes if name in options['routes']]
+
+        # Error statuses are reported in the table; don't also log every request
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            return self._run_routes(client, routes, defaults, overrides, options)
+        finally:
+            request_logger.setLevel(level)
+
+    def _run_routes(self, client, routes, defaults, overrides, options):
+        results = {}
+        for name, params in routes:
+            kwargs = {param: overrides.get(name, {}).get(param, defaults[param]) for param in params}
+            url = reverse(name, kwargs=kwargs)
+            if name in QUERY_STRINGS:
+                url = f'{url}?{QUERY_STRINGS[name]}'
+            for _ in range(options['warmup']):
+                self.request(client, url)
+            samples = [self.request(client, url) for _ in range(max(1, options['iterations']))]
+            totals = [sample['total_ms'] for sample in samples]
+            results[name] = {
+                'url': url,
+                'status': samples[-1]['status'],
+                'queries': max(sample['queries'] for sample in samples),
+                'db_ms': round(statistics.median(sample['db_ms'] for sample in samples), 2),
+                'render_ms': round(statistics.median(sample['render_ms'] for sample in samples), 2),
+                'p50_ms': round(percentile(totals, 50), 2),
+                'p95_ms': round(percentile(totals, 95), 2),
+            }
+        return results
+
+    @staticmethod
+    def request(client, url):
+        queries = QueryTimer()
+        with render_timer() as rendered, connection.execute_wrapper(queries):
+            started = time.perf_counter()
+            response = client.get(url)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            elapsed = time.perf_counter() - started
+        return {
+            'status': response.status_code,
+            'queries': queries.count,
+            'db_ms': queries.seconds * 1000,
+            'render_ms': rendered['seconds'] * 1000,
+            'total_ms': elapsed * 1000,
+        }
+
+    # -- reporting -----------------------------------------------------------
+
+    def compare(self, results, options):
+        try:
+            with open(options['baseline']) as handle:
+                baseline = json.load(handle)['routes']
+        except FileNotFoundError:
+            raise CommandError(f'No baseline at {options["baseline"]}; run with --update-baseline first')
+
+        failures, warnings = [], []
+        self.stdout.write(f'{"route":34} {"status":>6} {"queries":>13} {"db ms":>8} {"render ms":>10} '
+                          f'{"p50 ms":>8} {"p95 ms":>8}')
+        for name, result in results.items():
+            budget = baseline.get(name)
+            verdict = ''
+            if result['status'] >= 400:
+                failures.append(f'{name} returned {result["status"]}')
+                verdict = '✗ status'
+            elif budget is None:
+                warnings.append(f'{name} has no baseline')
+                verdict = '? new'
+            elif result['queries'] > budget['queries']:
+                failures.append(f'{name} ran {result["queries"]} queries (budget {budget["queries"]})')
+                verdict = '✗ queries'
+            elif (result['p95_ms'] > budget['p95_ms'] * (1 + options['latency_tolerance'])
+                  and result['p95_ms'] - budget['p95_ms'] > options['latency_floor_ms']):
+                message = f'{name} p95 {result["p95_ms"]}ms vs baseline {budget["p95_ms"]}ms'
+                (failures if options['fail_on_latency'] else warnings).append(message)
+                verdict = '✗ latency' if options['fail_on_latency'] else '! latency'
+
+            budget_label = f'{result["queries"]}/{budget["queries"]}' if budget else str(result['queries'])
+            self.stdout.write(f'{name:34} {result["status"]:>6} {budget_label:>13} {result["db_ms"]:>8} '
+                              f'{result["render_ms"]:>10} {result["p50_ms"]:>8} {result["p95_ms"]:>8}  {verdict}')
+
+        for message in warnings:
+            self.stdout.write(self.style.WARNING(f'⚠️  {message}'))
+        if failures:
+            raise CommandError('Over budget:\n  ' + '\n  '.join(failures))
+        self.stdout.write(self.style.SUCCESS(f'✅ {len(results)} routes within budget'))
@@ -0,0 +1,57 @@
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from core import images
+from core.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Cleans profile photos and builds their avatar renditions (see core/images.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Reprocess photos that already have every rendition')
+        parser.add_argument('--delete-originals', action='store_true',
+                            help='Delete the files replaced, once no profile uses them (they keep their metadata)')
+
+    def handle(self, *args, **options):
+        built = skipped = failed = 0
+        profiles = UserProfile.objects.exclude(profile_image='').exclude(profile_image__isnull=True)
+        for profile in profiles.select_related('user').iterator():
+            done = (profile.avatar_hash and profile.profile_image.name == images.original_name(profile.avatar_hash)
+                    and images.has_renditions(profile.avatar_hash))
+            if done and not options['force']:
+                skipped += 1
+                continue
+
+            old_name, old_hash = profile.profile_image.name, profile.avatar_hash
+            if not default_storage.exists(old_name):
+                self.stdout.write(self.style.WARNING(f'  {profile.user.username}: {old_name} is missing'))
+                failed += 1
+                continue
+            try:
+                with default_storage.open(old_name, 'rb') as upload:
+                    processed = images.process(upload)
+            except ValidationError as error:
+                self.stdout.write(self.style.WARNING(f'  {profile.user.username}: {" ".join(error.messages)}'))
+                failed += 1
+                continue
+
+            images.save(processed)
+            images.apply(profile, processed)
+            profile.save(update_fields=['profile_image', 'avatar_hash'])
+            built += 1
+            if options['delete_originals'] and old_name != processed.original_name:
+                self.delete_unused(old_name, old_hash)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Avatars built for {built} profiles ({skipped} already done, {failed} failed)'))
+
+    @staticmethod
+    def delete_unused(name, digest):
+        if not UserProfile.objects.filter(profile_image=name).exists():
+            default_storage.delete(name)
+        if digest and not UserProfile.objects.filter(avatar_hash=digest).exists():
+            for rendition in images.rendition_names(digest):
+                default_storage.delete(rendition)
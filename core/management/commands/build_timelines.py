@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from core.timeline import materialize
+
+
+class Command(BaseCommand):
+    help = 'Materializes home timelines for users who do not have one yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help='Only build timelines for these users')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(home_timeline__isnull=True, joined_hubs__isnull=False).distinct()
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+
+        built = 0
+        for user in users.iterator():
+            built += materialize(user)
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Built {built} timelines'))
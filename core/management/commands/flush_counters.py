@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.buffers import flush_counters
+
+
+class Command(BaseCommand):
+    help = 'Writes buffered write-behind counter deltas (helpful votes, reputation, rollups) to the database'
+
+    def handle(self, *args, **kwargs):
+        if settings.COUNTER_BUFFER_BACKEND == 'memory':
+            # Each web process flushes its own buffer on a timer; this one has nothing in it
+            self.stdout.write(self.style.WARNING(
+                "⚠️ COUNTER_BUFFER_BACKEND is 'memory': web processes flush their own buffers"))
+        flushed = flush_counters()
+        self.stdout.write(self.style.SUCCESS(f'✅ Flushed {flushed} buffered counters'))
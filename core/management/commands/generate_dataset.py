@@ -0,0 +1,423 @@
+import random
+import time
+from array import array
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from core import matching, stats, versions
+from core.models import (
+    UserProfile, Hub, Post, Comment, HelpfulVote, MentorshipRequest, Skill, Badge,
+)
+from .seed_data import (
+    SKILLS, BADGES, HUBS, POST_TEMPLATES, COMMENT_TEMPLATES, LOCATIONS,
+    MENTORSHIP_TOPICS, MENTORSHIP_MESSAGE,
+)
+
+# Vocabulary on top of seed_data's, so generated datasets have some variety
+EXTRA_SKILLS = [
+    ('Machine Learning', 'technical'), ('Cloud Computing', 'technical'), ('Cybersecurity', 'technical'),
+    ('UX Research', 'creative'), ('Photography', 'creative'), ('Illustration', 'creative'),
+    ('Negotiation', 'leadership'), ('Team Building', 'leadership'), ('Coaching', 'leadership'),
+    ('Accounting', 'business'), ('Sales', 'business'), ('Product Management', 'business'),
+    ('Policy Analysis', 'advocacy'), ('Grant Writing', 'advocacy'), ('Public Health', 'advocacy'),
+]
+
+EXTRA_BADGES = [
+    ('Returner', 'Came back to work after a career break', '🔁'),
+    ('Open Source Contributor', 'Shares code and knowledge in the open', '🧩'),
+    ('Founder', 'Started a company or nonprofit', '🏗️'),
+]
+
+HUB_FOCUSES = [
+    'Beginners', 'Mid-Career', 'Executives', 'Students', 'Parents', 'Remote Workers', 'Midwest',
+    'West Coast', 'East Coast', 'International', 'Research', 'Funding', 'Job Search', 'Networking',
+    'Book Club', 'Accountability', 'Career Breaks', 'Freelancers', 'Nonprofits', 'Policy',
+]
+
+EXTRA_LOCATIONS = ['Seattle, WA', 'Boston, MA', 'Atlanta, GA', 'Denver, CO', 'Toronto, ON', 'London, UK']
+
+FIRST_NAMES = ['Ava', 'Mia', 'Zoe', 'Lena', 'Ines', 'Aisha', 'Mei', 'Sofia', 'Nora', 'Ruth', 'Kira', 'Dana']
+LAST_NAMES = ['Garcia', 'Nguyen', 'Okafor', 'Kim', 'Silva', 'Cohen', 'Singh', 'Novak', 'Haddad', 'Ito']
+
+# Relative frequency of each model choice; values missing here are never generated
+STATUS_WEIGHTS = {'pending': 4, 'accepted': 3, 'declined': 1, 'completed': 2}
+VISIBILITY_WEIGHTS = {'public': 85, 'pseudonymous': 10, 'trusted': 5}
+
+
+def weighted_choices(choices, weights):
+    """(values, weights) for rng.choices(), drawn from a model field's choices so they can't drift"""
+    return tuple(zip(*((value, weights[value]) for value, _ in choices if value in weights)))
+
+
+# users, hubs, posts, comments, votes, mentorship requests
+PRESETS = {
+    'small': (1_000, 50, 10_000, 30_000, 50_000, 500),
+    'medium': (20_000, 200, 200_000, 600_000, 1_000_000, 5_000),
+    'large': (50_000, 500, 2_000_000, 6_000_000, 10_000_000, 20_000),
+}
+
+
+def zipf_sampler(rng, n, exponent):
+    """Return draw(k) -> k indexes in range(n), rank r picked with weight 1/r**exponent"""
+    cum_weights, total = [], 0.0
+    for rank in range(1, n + 1):
+        total += rank ** -exponent
+        cum_weights.append(total)
+    # Shuffle which index gets which rank so popularity isn't tied to creation order
+    order = list(range(n))
+    rng.shuffle(order)
+    return lambda k: rng.choices(order, cum_weights=cum_weights, k=k)
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the timestamps we set instead of auto_now/auto_now_add overwriting them"""
+    fields = [f for model in models for f in model._meta.fields if getattr(f, 'auto_now', False)
+              or getattr(f, 'auto_now_add', False)]
+    saved = [(f, f.auto_now, f.auto_now_add) for f in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = 'Generates a large, reproducible synthetic dataset for load testing and benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=PRESETS, default='small',
+                            help='Preset sizes; the count options below override individual numbers')
+        for name in ('users', 'hubs', 'posts', 'comments', 'votes', 'mentorship'):
+            parser.add_argument(f'--{name}', type=int)
+        parser.add_argument('--seed', type=int, default=42, help='Random seed; the same seed gives the same data')
+        parser.add_argument('--days', type=int, default=365, help='Spread activity over this many days')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Skew exponent for activity and popularity')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='gen_', help='Username and hub slug prefix for generated rows')
+        parser.add_argument('--skip-derived', action='store_true',
+                            help='Do not rebuild the search index, growth rollups, reputation and post scores afterwards')
+
+    def handle(self, *args, **options):
+        sizes = dict(zip(('users', 'hubs', 'posts', 'comments', 'votes', 'mentorship'), PRESETS[options['scale']]))
+        for name in sizes:
+            if options[name] is not None:
+                sizes[name] = options[name]
+        if sizes['users'] < 2 or sizes['hubs'] < 1:
+            raise CommandError('Need at least 2 users and 1 hub')
+
+        self.prefix = options['prefix']
+        if User.objects.filter(username__startswith=self.prefix).exists():
+            raise CommandError(f'Users starting with "{self.prefix}" already exist; pick another --prefix')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.zipf = options['zipf']
+        self.end = timezone.now().replace(microsecond=0)
+        self.start = self.end - timedelta(days=options['days'])
+        self.total_rows, self.total_seconds = 0, 0.0
+
+        self.stdout.write(f'🌱 Generating dataset (seed {options["seed"]}): ' +
+                          ', '.join(f'{count:,} {name}' for name, count in sizes.items()))
+
+        with explicit_timestamps(Hub, UserProfile, Post, Comment, HelpfulVote, MentorshipRequest):
+            skills, badges = self.make_vocabulary()
+            self.plan(sizes)
+            self.make_users(skills, badges)
+            self.make_hubs()
+            self.make_posts()
+            self.make_comments()
+            self.make_votes()
+            self.make_mentorship(sizes['mentorship'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Generated {self.total_rows:,} rows in {self.total_seconds:.1f}s '
+            f'({self.total_rows / max(self.total_seconds, 1e-9):,.0f} rows/s)'))
+
+        stats.bump_version()
+        matching.bump_version()
+        versions.bump(versions.EPOCH)
+        if not options['skip_derived']:
+            call_command('rebuild_search_index', stdout=self.stdout)
+            call_command('backfill_rollups', restart=True, stdout=self.stdout)
+            call_command('recompute_reputation', rebuild_log=True, stdout=self.stdout)
+            call_command('rescore_posts', stdout=self.stdout)
+        # Bulk loads leave the planner's statistics far behind; refresh them so it picks the right indexes
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    # -- helpers -----------------------------------------------------------
+
+    def insert(self, label, model, objects):
+        """bulk_create objects in batches, one transaction per batch; returns the new primary keys"""
+        pks = array('q')
+        started = time.perf_counter()
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                pks.extend(self._flush(model, batch))
+                batch = []
+        if batch:
+            pks.extend(self._flush(model, batch))
+        elapsed = time.perf_counter() - started
+        self.total_rows += len(pks)
+        self.total_seconds += elapsed
+        self.stdout.write(f'  {label}: {len(pks):,} rows in {elapsed:.1f}s '
+                          f'({len(pks) / max(elapsed, 1e-9):,.0f} rows/s)')
+        return pks
+
+    @staticmethod
+    def _flush(model, batch):
+        with transaction.atomic():
+            created = model.objects.bulk_create(batch)
+        return [obj.pk for obj in created]
+
+    def moment_after(self, earliest):
+        """Random aware datetime between earliest and the end of the window"""
+        span = (self.end - earliest).total_seconds()
+        return earliest + timedelta(seconds=self.rng.random() * max(span, 0))
+
+    # -- planning ----------------------------------------------------------
+
+    def plan(self, sizes):
+        """
+        Decide who does what before writing anything, so every stored counter
+        can be filled in at insert time instead of recomputed afterwards.
+        """
+        rng = self.rng
+        n_users, n_hubs = sizes['users'], sizes['hubs']
+        self.n_hubs = n_hubs
+        n_posts, n_comments, n_votes = sizes['posts'], sizes['comments'], sizes['votes']
+        window = (self.end - self.start).total_seconds()
+
+        self.joined = sorted(rng.random() * window for _ in range(n_users))
+        active_user = zipf_sampler(rng, n_users, self.zipf)
+        popular_hub = zipf_sampler(rng, n_hubs, self.zipf)
+
+        # Most people join a couple of hubs; a few join many
+        self.memberships = []
+        for _ in range(n_users):
+            wanted = min(n_hubs, int(rng.paretovariate(1.5)))
+            self.memberships.append(sorted(set(popular_hub(wanted))))
+
+        # Posts: active users post more, mostly in their own hubs
+        self.post_author = array('i', active_user(n_posts))
+        self.post_hub = array('i')
+        self.post_time = array('d')
+        for author in self.post_author:
+            hubs = self.memberships[author]
+            self.post_hub.append(rng.choice(hubs) if hubs and rng.random() < 0.8 else popular_hub(1)[0])
+            self.post_time.append(self.joined[author] + rng.random() * (window - self.joined[author]))
+
+        # Comments and votes pile onto a few popular posts
+        popular_post = zipf_sampler(rng, n_posts, self.zipf) if n_posts else None
+        self.comment_post = array('i', popular_post(n_comments) if n_posts else [])
+        self.comment_author = array('i', active_user(len(self.comment_post)))
+        self.comment_count = array('i', bytes(4 * n_posts))
+        for post in self.comment_post:
+            self.comment_count[post] += 1
+
+        n_comment_votes = n_votes // 4 if len(self.comment_post) else 0
+        self.post_votes = self._vote_counts(popular_post, n_posts, n_votes - n_comment_votes, n_users)
+        popular_comment = zipf_sampler(rng, len(self.comment_post), self.zipf) if n_comment_votes else None
+        self.comment_votes = self._vote_counts(popular_comment, len(self.comment_post), n_comment_votes, n_users)
+
+    @staticmethod
+    def _vote_counts(sampler, n_targets, n_votes, n_users):
+        counts = array('i', bytes(4 * n_targets))
+        if sampler is None:
+            return counts
+        for target in sampler(n_votes):
+            # One vote per user per target
+            if counts[target] < n_users:
+                counts[target] += 1
+        return counts
+
+    # -- writing -----------------------------------------------------------
+
+    def make_vocabulary(self):
+        skills = []
+        for name, category in SKILLS + EXTRA_SKILLS:
+            skill, _ = Skill.objects.get_or_create(name=name, defaults={'category': category})
+            skills.append(skill.pk)
+        badges = []
+        for name, desc, icon in BADGES + EXTRA_BADGES:
+            badge, _ = Badge.objects.get_or_create(name=name, defaults={'description': desc, 'icon': icon})
+            badges.append(badge.pk)
+        return skills, badges
+
+    def make_users(self, skills, badges):
+        rng, prefix = self.rng, self.prefix
+        password = make_password('demo1234')
+        self.user_ids = self.insert('users', User, (
+            User(
+                username=f'{prefix}{i:06d}',
+                first_name=rng.choice(FIRST_NAMES),
+                last_name=rng.choice(LAST_NAMES),
+                email=f'{prefix}{i:06d}@example.com',
+                password=password,
+                date_joined=self.start + timedelta(seconds=joined),
+            )
+            for i, joined in enumerate(self.joined)
+        ))
+
+        posts_by, comments_by = array('i', bytes(4 * len(self.user_ids))), array('i', bytes(4 * len(self.user_ids)))
+        for author in self.post_author:
+            posts_by[author] += 1
+        for author in self.comment_author:
+            comments_by[author] += 1
+
+        locations = LOCATIONS + EXTRA_LOCATIONS
+        modes, mode_weights = weighted_choices(UserProfile.VISIBILITY_CHOICES, VISIBILITY_WEIGHTS)
+        self.mentor_ids = []
+        profiles = []
+        for i, user_id in enumerate(self.user_ids):
+            is_mentor = rng.random() < 0.15
+            if is_mentor:
+                self.mentor_ids.append(i)
+            profiles.append(UserProfile(
+                user_id=user_id,
+                bio='Passionate about learning and growth. Here to connect and share knowledge.',
+                location=rng.choice(locations),
+                visibility_mode=rng.choices(modes, mode_weights)[0],
+                is_mentor=is_mentor,
+                post_count=posts_by[i],
+                comment_count=comments_by[i],
+                created_at=self.start + timedelta(seconds=self.joined[i]),
+            ))
+        profile_ids = self.insert('profiles', UserProfile, profiles)
+        del profiles
+
+        self.insert('profile skills', UserProfile.skills.through, (
+            UserProfile.skills.through(userprofile_id=profile_id, skill_id=skill_id)
+            for profile_id in profile_ids
+            for skill_id in rng.sample(skills, rng.randint(1, 5))
+        ))
+        self.insert('profile badges', UserProfile.equity_badges.through, (
+            UserProfile.equity_badges.through(userprofile_id=profile_id, badge_id=rng.choice(badges))
+            for profile_id in profile_ids if rng.random() < 0.3
+        ))
+
+    def make_hubs(self):
+        n_hubs = self.n_hubs
+        members = [0] * n_hubs
+        for hubs in self.memberships:
+            for hub in hubs:
+                members[hub] += 1
+        posts = [0] * n_hubs
+        for hub in self.post_hub:
+            posts[hub] += 1
+
+        names = [f'{name} · {focus}' for focus in HUB_FOCUSES for name, _, _ in HUBS]
+        hubs = []
+        for i in range(n_hubs):
+            base_name, icon, description = HUBS[i % len(HUBS)]
+            name = names[i % len(names)] + (f' {i // len(names) + 1}' if i >= len(names) else '')
+            hubs.append(Hub(
+                name=name, slug=slugify(f'{self.prefix}{name}'), icon=icon, description=description,
+                member_count=members[i], post_count=posts[i], created_at=self.start,
+            ))
+        self.hub_ids = self.insert('hubs', Hub, hubs)
+
+        self.insert('memberships', Hub.members.through, (
+            Hub.members.through(hub_id=self.hub_ids[hub], user_id=self.user_ids[user])
+            for user, hubs in enumerate(self.memberships)
+            for hub in hubs
+        ))
+
+    def make_posts(self):
+        rng = self.rng
+        filler = [content for _, _, content in POST_TEMPLATES] + COMMENT_TEMPLATES
+        types = [post_type for post_type, _, _ in POST_TEMPLATES]
+
+        def posts():
+            for i, author in enumerate(self.post_author):
+                post_type, title, content = rng.choice(POST_TEMPLATES)
+                created = self.start + timedelta(seconds=self.post_time[i])
+                yield Post(
+                    author_id=self.user_ids[author],
+                    hub_id=self.hub_ids[self.post_hub[i]],
+                    title=title,
+                    content=' '.join([content] + rng.sample(filler, 2)),
+                    post_type=post_type if rng.random() < 0.9 else rng.choice(types),
+                    is_anonymous=rng.random() < 0.1,
+                    helpful_count=self.post_votes[i],
+                    comment_count=self.comment_count[i],
+                    created_at=created,
+                    updated_at=created,
+                )
+
+        self.post_ids = self.insert('posts', Post, posts())
+
+    def make_comments(self):
+        rng = self.rng
+        self.comment_time = array('d')
+
+        def comments():
+            for i, post in enumerate(self.comment_post):
+                offset = self.post_time[post] + rng.random() * (
+                    (self.end - self.start).total_seconds() - self.post_time[post])
+                self.comment_time.append(offset)
+                yield Comment(
+                    post_id=self.post_ids[post],
+                    author_id=self.user_ids[self.comment_author[i]],
+                    content=rng.choice(COMMENT_TEMPLATES),
+                    helpful_count=self.comment_votes[i],
+                    is_accepted_answer=rng.random() < 0.05,
+                    created_at=self.start + timedelta(seconds=offset),
+                )
+
+        self.comment_ids = self.insert('comments', Comment, comments())
+
+    def make_votes(self):
+        rng, n_users = self.rng, len(self.user_ids)
+
+        def votes(counts, target_ids, target_times, field):
+            for i, count in enumerate(counts):
+                for voter in rng.sample(range(n_users), count):
+                    yield HelpfulVote(**{
+                        'user_id': self.user_ids[voter],
+                        field: target_ids[i],
+                        'created_at': self.moment_after(self.start + timedelta(seconds=target_times[i])),
+                    })
+
+        self.insert('post votes', HelpfulVote, votes(self.post_votes, self.post_ids, self.post_time, 'post_id'))
+        self.insert('comment votes', HelpfulVote,
+                    votes(self.comment_votes, self.comment_ids, self.comment_time, 'comment_id'))
+
+    def make_mentorship(self, count):
+        rng = self.rng
+        if not self.mentor_ids:
+            return
+        busy_mentor = zipf_sampler(rng, len(self.mentor_ids), self.zipf)
+        statuses, weights = weighted_choices(MentorshipRequest.STATUS_CHOICES, STATUS_WEIGHTS)
+
+        def requests():
+            for _ in range(count):
+                mentor = self.mentor_ids[busy_mentor(1)[0]]
+                mentee = rng.randrange(len(self.user_ids))
+                if mentee == mentor:
+                    continue
+                created = self.moment_after(self.start + timedelta(seconds=max(self.joined[mentor], self.joined[mentee])))
+                yield MentorshipRequest(
+                    mentee_id=self.user_ids[mentee],
+                    mentor_id=self.user_ids[mentor],
+                    topic=rng.choice(MENTORSHIP_TOPICS),
+                    message=MENTORSHIP_MESSAGE,
+                    status=rng.choices(statuses, weights)[0],
+                    created_at=created,
+                    updated_at=created,
+                )
+
+        self.insert('mentorship requests', MentorshipRequest, requests())
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index from all posts and comments'
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            documents = get_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS(f'✅ Indexed {documents} documents'))
@@ -0,0 +1,104 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from core import matching
+from core.models import Post, Comment, HelpfulVote, MentorshipRequest, ReputationEvent, UserProfile
+from core.reputation import POINTS
+
+
+def _event_total():
+    """Correlated SUM(points) of the profile's events, 0 when there are none"""
+    return Coalesce(Subquery(
+        ReputationEvent.objects.filter(user_id=OuterRef('user_id')).order_by()
+        .values('user_id').annotate(total=Sum('points')).values('total')
+    ), 0)
+
+
+# kind -> (source rows, row -> event fields); rows are values_list tuples
+LOG_SOURCES = {
+    'post': (
+        lambda: Post.objects.values_list('pk', 'author_id', 'created_at'),
+        lambda pk, author_id, at: dict(user_id=author_id, post_id=pk, created_at=at),
+    ),
+    'post_vote': (
+        lambda: HelpfulVote.objects.filter(post__isnull=False).exclude(user_id=F('post__author_id'))
+        .values_list('user_id', 'post_id', 'post__author_id', 'created_at'),
+        lambda voter_id, post_id, author_id, at: dict(user_id=author_id, actor_id=voter_id, post_id=post_id,
+                                                      created_at=at),
+    ),
+    'comment_vote': (
+        lambda: HelpfulVote.objects.filter(comment__isnull=False).exclude(user_id=F('comment__author_id'))
+        .values_list('user_id', 'comment_id', 'comment__author_id', 'created_at'),
+        lambda voter_id, comment_id, author_id, at: dict(user_id=author_id, actor_id=voter_id,
+                                                         comment_id=comment_id, created_at=at),
+    ),
+    'accepted_answer': (
+        lambda: Comment.objects.filter(is_accepted_answer=True).values_list('pk', 'post_id', 'author_id', 'created_at'),
+        lambda pk, post_id, author_id, at: dict(user_id=author_id, comment_id=pk, post_id=post_id, created_at=at),
+    ),
+    'mentorship_completed': (
+        lambda: MentorshipRequest.objects.filter(status='completed')
+        .values_list('pk', 'mentor_id', 'mentee_id', 'updated_at'),
+        lambda pk, mentor_id, mentee_id, at: dict(user_id=mentor_id, actor_id=mentee_id, mentorship_id=pk,
+                                                  created_at=at),
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = 'Recomputes every reputation_score from the ReputationEvent log, a chunk of profiles at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Profiles per UPDATE, and events per INSERT with --rebuild-log')
+        parser.add_argument('--rebuild-log', action='store_true',
+                            help='First replace the event log with one derived from posts, votes, accepted '
+                                 'answers and completed mentorships (run while the site is quiet)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report how many scores are out of date without fixing them')
+
+    def handle(self, *args, **options):
+        chunk_size = max(1, options['chunk_size'])
+        if options['rebuild_log'] and not options['dry_run']:
+            self.rebuild_log(chunk_size)
+
+        expected = _event_total()
+        drifted = total = 0
+        last_pk = 0
+        while True:
+            pks = list(UserProfile.objects.filter(pk__gt=last_pk).order_by('pk')
+                       .values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                break
+            chunk = UserProfile.objects.filter(pk__gte=pks[0], pk__lte=pks[-1])
+            stale = chunk.annotate(expected=expected).exclude(reputation_score=F('expected'))
+            if options['dry_run']:
+                drifted += stale.count()
+            else:
+                # One statement per chunk, so a vote landing meanwhile is either in the sum or applied after it
+                drifted += UserProfile.objects.filter(pk__in=stale.values('pk')).update(reputation_score=expected)
+            total += len(pks)
+            last_pk = pks[-1]
+
+        if options['dry_run']:
+            self.stdout.write(f'{drifted} of {total} reputation scores out of date')
+            return
+        # Reputation feeds mentor ranking
+        matching.bump_version()
+        self.stdout.write(self.style.SUCCESS(f'✅ Reputation recomputed: {drifted} of {total} scores changed'))
+
+    def rebuild_log(self, chunk_size):
+        with transaction.atomic():
+            ReputationEvent.objects.all().delete()
+            for kind, (rows, to_fields) in LOG_SOURCES.items():
+                created = 0
+                batch = []
+                for row in rows().order_by().iterator(chunk_size=chunk_size):
+                    batch.append(ReputationEvent(kind=kind, points=POINTS[kind], **to_fields(*row)))
+                    if len(batch) >= chunk_size:
+                        created += len(ReputationEvent.objects.bulk_create(batch))
+                        batch = []
+                created += len(ReputationEvent.objects.bulk_create(batch))
+                self.stdout.write(f'  {kind}: {created} events')
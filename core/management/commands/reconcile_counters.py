@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from core import versions
+from core.models import UserProfile, Hub, Post, Comment
+
+
+def _count_subquery(queryset, group_field):
+    """Correlated COUNT(*) subquery grouped on group_field, 0 when there are no rows"""
+    return Coalesce(Subquery(
+        queryset.order_by().values(group_field).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the stored post, comment and member counters from the source tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report how many rows have drifted without fixing them')
+
+    def handle(self, *args, **options):
+        targets = [
+            (Post, 'comment_count',
+             _count_subquery(Comment.objects.filter(post_id=OuterRef('pk')), 'post_id')),
+            (Hub, 'post_count',
+             _count_subquery(Post.objects.filter(hub_id=OuterRef('pk')), 'hub_id')),
+            (Hub, 'member_count',
+             _count_subquery(Hub.members.through.objects.filter(hub_id=OuterRef('pk')), 'hub_id')),
+            (UserProfile, 'post_count',
+             _count_subquery(Post.objects.filter(author_id=OuterRef('user_id')), 'author_id')),
+            (UserProfile, 'comment_count',
+             _count_subquery(Comment.objects.filter(author_id=OuterRef('user_id')), 'author_id')),
+        ]
+
+        with transaction.atomic():
+            for model, field, expected in targets:
+                drifted = model.objects.annotate(expected=expected).exclude(**{field: F('expected')})
+                if options['dry_run']:
+                    self.stdout.write(f'{model.__name__}.{field}: {drifted.count()} rows out of date')
+                    continue
+                fixed = model.objects.filter(pk__in=drifted.values('pk')).update(**{field: expected})
+                self.stdout.write(f'{model.__name__}.{field}: fixed {fixed} rows')
+
+        if not options['dry_run']:
+            # Cached pages may have been built from the drifted numbers
+            versions.bump(versions.EPOCH)
+            self.stdout.write(self.style.SUCCESS('✅ Counters reconciled'))
+
@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import ranking
+from core.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the stored hot and top scores of posts (see core/ranking.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='Only posts created in the last DAYS days (default: every post)')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        posts = Post.objects.all()
+        if options['days']:
+            posts = posts.filter(created_at__gte=timezone.now() - timedelta(days=options['days']))
+        changed = ranking.rescore(posts, chunk_size=max(1, options['chunk_size']))
+        self.stdout.write(self.style.SUCCESS(f'✅ Rescored posts: {changed} scores changed'))
@@ -0,0 +1,82 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+
+from core import tasks
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background tasks until stopped (SIGINT/SIGTERM finish the tasks in hand first)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.TASK_WORKER_CONCURRENCY,
+                            help='Tasks run at once, each on its own thread and database connection')
+        parser.add_argument('--poll-interval', type=float, default=settings.TASK_POLL_INTERVAL,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Run whatever is due, then exit instead of waiting for more')
+        parser.add_argument('--allow-sqlite', action='store_true',
+                            help='Work a SQLite queue, for web processes on this machine (e.g. local development)')
+
+    def handle(self, *args, **options):
+        if tasks.queue_is_local() and not options['allow_sqlite']:
+            raise CommandError(
+                'The task queue is a SQLite file, which web processes on other machines cannot write to, '
+                'so this worker would never see their tasks. Set DATABASE_URL to the database they use, '
+                'or pass --allow-sqlite if they run on this machine.')
+        self.verbosity = options['verbosity']
+        self.stop = threading.Event()
+        self.counts = {'done': 0, 'failed': 0}
+        self.counts_lock = threading.Lock()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: self.stop.set())
+
+        concurrency = max(1, options['concurrency'])
+        poll = options['poll_interval']
+        if not options['once']:
+            self.stdout.write(f'Worker started with {concurrency} threads, polling every {poll}s')
+
+        self.tick()
+        threads = [threading.Thread(target=self.work, args=(tasks.worker_id(index), poll, options['once']),
+                                    name=f'task-worker-{index}', daemon=True)
+                   for index in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        # Periodic tasks and lease expiry are the main thread's job
+        while not options['once'] and not self.stop.wait(poll):
+            self.tick()
+        for thread in threads:
+            thread.join()
+        connections.close_all()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Worker stopped: {self.counts['done']} tasks done, {self.counts['failed']} attempts failed"))
+
+    def tick(self):
+        close_old_connections()
+        expired = tasks.requeue_expired()
+        if expired:
+            self.stdout.write(f'  requeued {expired} tasks with expired leases')
+        tasks.enqueue_due_periodic()
+
+    def work(self, worker, poll, once):
+        try:
+            while not self.stop.is_set():
+                close_old_connections()
+                claimed = tasks.claim(worker)
+                if not claimed:
+                    if once:
+                        break
+                    self.stop.wait(poll)
+                    continue
+                for task in claimed:
+                    outcome = 'done' if tasks.run(task) else 'failed'
+                    with self.counts_lock:
+                        self.counts[outcome] += 1
+                    if self.verbosity > 1:
+                        self.stdout.write(f'  {outcome}: {task.name} #{task.pk}')
+        finally:
+            connections.close_all()
@@ -3,6 +3,72 @@ from django.contrib.auth.models import User
 from core.models import UserProfile, Hub, Post, Comment, MentorshipRequest, Skill, Badge
 import random
 
+# Vocabulary shared with generate_dataset, which builds larger datasets from it
+SKILLS = [
+    ('Python', 'technical'), ('JavaScript', 'technical'), ('Data Science', 'technical'),
+    ('Public Speaking', 'leadership'), ('Project Management', 'leadership'),
+    ('Graphic Design', 'creative'), ('Writing', 'creative'), ('Video Editing', 'creative'),
+    ('Marketing', 'business'), ('Fundraising', 'business'), ('Legal Research', 'advocacy'),
+    ('Community Organizing', 'advocacy'), ('Mentorship', 'leadership'),
+]
+
+BADGES = [
+    ('Caregiver', 'Recognized for balancing caregiving responsibilities', '👶'),
+    ('Community Organizer', 'Active in community advocacy and organizing', '🤝'),
+    ('Mentor', 'Dedicated to helping others grow', '🌟'),
+    ('First-Gen Professional', 'Breaking barriers in their field', '🚀'),
+    ('Career Changer', 'Successfully pivoted careers', '🔄'),
+]
+
+HUBS = [
+    ('STEM Careers', '💻', 'For women in science, technology, engineering, and mathematics'),
+    ('Entrepreneurship', '🚀', 'Start, scale, and succeed in your own venture'),
+    ('Health & Wellness', '💪', 'Physical and mental health support and advice'),
+    ('Legal Rights', '⚖️', 'Know your rights and navigate legal systems'),
+    ('Caregiving', '👶', 'Support for caregivers and work-life balance'),
+    ('Creative Arts', '🎨', 'Express yourself through art, writing, and design'),
+    ('Leadership', '⭐', 'Develop leadership skills and advance your career'),
+]
+
+POST_TEMPLATES = [
+    ('question', 'How do I negotiate salary as a first-time employee?',
+     'I just got my first job offer and I\'m nervous about negotiating. Any tips on how to approach this conversation?'),
+    ('tutorial', 'Step-by-step guide to building your first portfolio website',
+     'Here\'s how I built my portfolio from scratch using free tools. Step 1: Choose a platform (GitHub Pages is free). Step 2: Pick a template...'),
+    ('story', 'My journey from teacher to software engineer',
+     'Three years ago, I was teaching high school. Today, I\'m a full-time developer. Here\'s what I learned along the way...'),
+    ('resource', 'Free online courses for data science beginners',
+     'I\'ve compiled a list of the best free resources to start learning data science: 1) Python basics on Codecademy...'),
+    ('playbook', 'Complete guide to applying for scholarships',
+     'Step 1: Research opportunities early. Step 2: Gather all required documents. Step 3: Write compelling essays...'),
+    ('question', 'Best practices for work-life balance with young children?',
+     'I\'m struggling to manage my career and motherhood. How do you all do it?'),
+    ('tutorial', 'Creating effective LinkedIn profiles that get noticed',
+     'Your LinkedIn is your digital first impression. Here\'s how to optimize every section...'),
+    ('story', 'How I started my nonprofit with zero funding',
+     'Everyone said I needed investors. I proved them wrong. Here\'s the bootstrapping story...'),
+    ('resource', 'Mental health resources for women entrepreneurs',
+     'Running a business is stressful. Here are therapists, apps, and communities that helped me stay grounded...'),
+    ('question', 'Should I pivot my career at 35?',
+     'I\'m in finance but dream of being a designer. Is it too late to change careers?'),
+]
+
+COMMENT_TEMPLATES = [
+    'This is so helpful, thank you!',
+    'I had the same question - following!',
+    'Have you tried talking to a career coach? That helped me.',
+    'Great resource list. Bookmarking this!',
+    'I went through this exact situation. Happy to chat if you want to DM.',
+    'Check out XYZ resource - it was a game changer for me.',
+    'This is exactly what I needed to hear today.',
+]
+
+LOCATIONS = ['New York, NY', 'San Francisco, CA', 'Chicago, IL', 'Austin, TX', 'Remote']
+
+MENTORSHIP_TOPICS = ['Career transition', 'Technical skills', 'Leadership', 'Work-life balance']
+
+MENTORSHIP_MESSAGE = 'Hi! I would love to learn from your experience. Would you be open to a monthly call?'
+
 
 class Command(BaseCommand):
     help = 'Seeds database with sample data for Astra'
@@ -11,32 +77,16 @@ class Command(BaseCommand):
         self.stdout.write('🌱 Seeding database...')
 
         # Create skills
-        skills_data = [
-            ('Python', 'technical'), ('JavaScript', 'technical'), ('Data Science', 'technical'),
-            ('Public Speaking', 'leadership'), ('Project Management', 'leadership'),
-            ('Graphic Design', 'creative'), ('Writing', 'creative'), ('Video Editing', 'creative'),
-            ('Marketing', 'business'), ('Fundraising', 'business'), ('Legal Research', 'advocacy'),
-            ('Community Organizing', 'advocacy'), ('Mentorship', 'leadership'),
-        ]
-
         skills = []
-        for name, category in skills_data:
+        for name, category in SKILLS:
             skill, _ = Skill.objects.get_or_create(name=name, defaults={'category': category})
             skills.append(skill)
 
         self.stdout.write(f'✅ Created {len(skills)} skills')
 
         # Create badges
-        badges_data = [
-            ('Caregiver', 'Recognized for balancing caregiving responsibilities', '👶'),
-            ('Community Organizer', 'Active in community advocacy and organizing', '🤝'),
-            ('Mentor', 'Dedicated to helping others grow', '🌟'),
-            ('First-Gen Professional', 'Breaking barriers in their field', '🚀'),
-            ('Career Changer', 'Successfully pivoted careers', '🔄'),
-        ]
-
         badges = []
-        for name, desc, icon in badges_data:
+        for name, desc, icon in BADGES:
             badge, _ = Badge.objects.get_or_create(name=name, defaults={'description': desc, 'icon': icon})
             badges.append(badge)
 
@@ -97,10 +147,8 @@ class Command(BaseCommand):
                 user=user,
                 defaults={
                     'bio': f'Passionate about learning and growth. {first} is here to connect and share knowledge.',
-                    'location': random.choice(
-                        ['New York, NY', 'San Francisco, CA', 'Chicago, IL', 'Austin, TX', 'Remote']),
+                    'location': random.choice(LOCATIONS),
                     'is_mentor': is_mentor,
-                    'reputation_score': random.randint(50, 500),
                 }
             )
 
@@ -116,18 +164,8 @@ class Command(BaseCommand):
         self.stdout.write(f'✅ Created {len(users)} sample users')
 
         # Create hubs
-        hubs_data = [
-            ('STEM Careers', '💻', 'For women in science, technology, engineering, and mathematics'),
-            ('Entrepreneurship', '🚀', 'Start, scale, and succeed in your own venture'),
-            ('Health & Wellness', '💪', 'Physical and mental health support and advice'),
-            ('Legal Rights', '⚖️', 'Know your rights and navigate legal systems'),
-            ('Caregiving', '👶', 'Support for caregivers and work-life balance'),
-            ('Creative Arts', '🎨', 'Express yourself through art, writing, and design'),
-            ('Leadership', '⭐', 'Develop leadership skills and advance your career'),
-        ]
-
         hubs = []
-        for name, icon, desc in hubs_data:
+        for name, icon, desc in HUBS:
             hub, _ = Hub.objects.get_or_create(
                 name=name,
                 defaults={'icon': icon, 'description': desc}
@@ -139,31 +177,8 @@ class Command(BaseCommand):
         self.stdout.write(f'✅ Created {len(hubs)} hubs')
 
         # Create posts
-        post_templates = [
-            ('question', 'How do I negotiate salary as a first-time employee?',
-             'I just got my first job offer and I\'m nervous about negotiating. Any tips on how to approach this conversation?'),
-            ('tutorial', 'Step-by-step guide to building your first portfolio website',
-             'Here\'s how I built my portfolio from scratch using free tools. Step 1: Choose a platform (GitHub Pages is free). Step 2: Pick a template...'),
-            ('story', 'My journey from teacher to software engineer',
-             'Three years ago, I was teaching high school. Today, I\'m a full-time developer. Here\'s what I learned along the way...'),
-            ('resource', 'Free online courses for data science beginners',
-             'I\'ve compiled a list of the best free resources to start learning data science: 1) Python basics on Codecademy...'),
-            ('playbook', 'Complete guide to applying for scholarships',
-             'Step 1: Research opportunities early. Step 2: Gather all required documents. Step 3: Write compelling essays...'),
-            ('question', 'Best practices for work-life balance with young children?',
-             'I\'m struggling to manage my career and motherhood. How do you all do it?'),
-            ('tutorial', 'Creating effective LinkedIn profiles that get noticed',
-             'Your LinkedIn is your digital first impression. Here\'s how to optimize every section...'),
-            ('story', 'How I started my nonprofit with zero funding',
-             'Everyone said I needed investors. I proved them wrong. Here\'s the bootstrapping story...'),
-            ('resource', 'Mental health resources for women entrepreneurs',
-             'Running a business is stressful. Here are therapists, apps, and communities that helped me stay grounded...'),
-            ('question', 'Should I pivot my career at 35?',
-             'I\'m in finance but dream of being a designer. Is it too late to change careers?'),
-        ]
-
         posts = []
-        for post_type, title, content in post_templates:
+        for post_type, title, content in POST_TEMPLATES:
             for _ in range(3):  # Create 3 variations of each
                 post = Post.objects.create(
                     author=random.choice(users),
@@ -179,16 +194,6 @@ class Command(BaseCommand):
         self.stdout.write(f'✅ Created {len(posts)} posts')
 
         # Create comments
-        comment_templates = [
-            'This is so helpful, thank you!',
-            'I had the same question - following!',
-            'Have you tried talking to a career coach? That helped me.',
-            'Great resource list. Bookmarking this!',
-            'I went through this exact situation. Happy to chat if you want to DM.',
-            'Check out XYZ resource - it was a game changer for me.',
-            'This is exactly what I needed to hear today.',
-        ]
-
         comments_created = 0
         for post in random.sample(posts, min(50, len(posts))):  # Add comments to 50 random posts
             num_comments = random.randint(1, 5)
@@ -196,7 +201,7 @@ class Command(BaseCommand):
                 Comment.objects.create(
                     post=post,
                     author=random.choice(users),
-                    content=random.choice(comment_templates),
+                    content=random.choice(COMMENT_TEMPLATES),
                     helpful_count=random.randint(0, 20),
                     is_accepted_answer=(random.random() < 0.2 and post.post_type == 'question'),
                 )
@@ -214,8 +219,8 @@ class Command(BaseCommand):
                 MentorshipRequest.objects.create(
                     mentee=mentee,
                     mentor=random.choice(mentors),
-                    topic=random.choice(['Career transition', 'Technical skills', 'Leadership', 'Work-life balance']),
-                    message='Hi! I would love to learn from your experience. Would you be open to a monthly call?',
+                    topic=random.choice(MENTORSHIP_TOPICS),
+                    message=MENTORSHIP_MESSAGE,
                     status=random.choice(['pending', 'accepted', 'declined', 'completed']),
                 )
                 requests_created += 1
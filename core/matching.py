@@ -0,0 +1,408 @@
+"""
+Mentor matching.
+
+Each process keeps an in-memory index of mentor profiles: posting lists from
+skill, hub and location to mentor user ids, plus each mentor's reputation and
+current load (pending + accepted requests). Ranking a mentee walks only the
+posting lists for the mentee's own skills, hubs and location, so top-k is a
+few dictionary lookups rather than a query per mentor.
+
+Writes that change what the index reads about a mentor (their profile's
+is_mentor, location and reputation_score, their skills, hubs and open
+requests) update the index in place through signal receivers, after the
+write commits. Each update bumps the 'matching' ChangeVersion row, which every
+process sees, so other processes notice on their next read. With a shared
+cache the update also records which mentors it touched under that version
+(for MATCHING_CHANGES_TTL seconds), and they catch up by reloading just those
+mentors. A process that has fallen more than MAX_CATCH_UP versions behind, or
+finds a change record missing (expired, or never shared), rebuilds its copy
+instead.
+
+mentor_request() serves the mentor list: every mentor, optionally narrowed to
+one skill or location, ranked for the viewer and paginated.
+"""
+
+import heapq
+import math
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from . import memberships, versions
+from .models import Hub, UserProfile, MentorshipRequest, Skill, ChangeVersion
+
+# ChangeVersion key of the index
+VERSION_KEY = 'matching'
+CHANGES_KEY = 'matching:changes:{}'
+# Versions a process reloads mentor by mentor before it rebuilds instead
+MAX_CATCH_UP = 100
+
+# How much each signal is worth in a mentor's score
+WEIGHTS = {
+    'skill': 3.0,        # per skill the mentor shares with the mentee
+    'hub': 1.5,          # per hub they are both members of
+    'location': 1.0,     # same location
+    'reputation': 2.0,   # times log-scaled reputation, 0..1
+    'load': 0.75,        # subtracted per open (pending or accepted) request
+}
+
+OPEN_STATUSES = ('pending', 'accepted')
+
+
+@dataclass
+class MentorEntry:
+    user_id: int
+    location: str
+    reputation: int
+    load: int
+    skills: frozenset
+    hubs: frozenset
+
+
+@dataclass
+class Match:
+    user_id: int
+    score: float
+    shared_skill_ids: list = field(default_factory=list)
+    shared_hub_ids: list = field(default_factory=list)
+    same_location: bool = False
+    load: int = 0
+
+
+def _location_key(location):
+    return (location or '').strip().lower()
+
+
+def _mentee_profile(user):
+    """(skill ids, hub ids, location key) for the user we are matching for"""
+    if user is None or not user.is_authenticated:
+        return frozenset(), frozenset(), ''
+    profile = UserProfile.objects.filter(user=user).only('pk', 'location').first()
+    if profile is None:
+        return frozenset(), frozenset(), ''
+    skills = frozenset(UserProfile.skills.through.objects.filter(
+        userprofile_id=profile.pk).values_list('skill_id', flat=True))
+    hubs = memberships.hub_ids(user)
+    return skills, hubs, _location_key(profile.location)
+
+
+class MentorIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.version = None
+        self.mentors = {}
+        self.by_skill = defaultdict(set)
+        self.by_hub = defaultdict(set)
+        self.by_location = defaultdict(set)
+        self._max_reputation = 0
+        self._by_base = None
+
+    # -- building ----------------------------------------------------------
+
+    @staticmethod
+    def _load(user_ids=None):
+        """Fetch MentorEntry rows for all mentors (or just user_ids) in four queries"""
+        profiles = UserProfile.objects.filter(is_mentor=True)
+        if user_ids is not None:
+            profiles = profiles.filter(user_id__in=user_ids)
+        rows = list(profiles.values_list('pk', 'user_id', 'location', 'reputation_score'))
+        if not rows:
+            return []
+        profile_ids = [pk for pk, _, _, _ in rows]
+        mentor_ids = [user_id for _, user_id, _, _ in rows]
+
+        skills, hubs = defaultdict(set), defaultdict(set)
+        for profile_id, skill_id in UserProfile.skills.through.objects.filter(
+                userprofile_id__in=profile_ids).values_list('userprofile_id', 'skill_id'):
+            skills[profile_id].add(skill_id)
+        for user_id, hub_id in Hub.members.through.objects.filter(
+                user_id__in=mentor_ids).values_list('user_id', 'hub_id'):
+            hubs[user_id].add(hub_id)
+        loads = dict(MentorshipRequest.objects.filter(
+            mentor_id__in=mentor_ids, status__in=OPEN_STATUSES
+        ).order_by().values_list('mentor_id').annotate(total=Count('pk')))
+
+        return [
+            MentorEntry(user_id, _location_key(location), reputation, loads.get(user_id, 0),
+                        frozenset(skills[pk]), frozenset(hubs[user_id]))
+            for pk, user_id, location, reputation in rows
+        ]
+
+    def _add(self, entry):
+        self.mentors[entry.user_id] = entry
+        for skill_id in entry.skills:
+            self.by_skill[skill_id].add(entry.user_id)
+        for hub_id in entry.hubs:
+            self.by_hub[hub_id].add(entry.user_id)
+        if entry.location:
+            self.by_location[entry.location].add(entry.user_id)
+        self._max_reputation = max(self._max_reputation, entry.reputation)
+
+    def _remove(self, user_id):
+        entry = self.mentors.pop(user_id, None)
+        if entry is None:
+            return
+        for skill_id in entry.skills:
+            self.by_skill[skill_id].discard(user_id)
+        for hub_id in entry.hubs:
+            self.by_hub[hub_id].discard(user_id)
+        if entry.location:
+            self.by_location[entry.location].discard(user_id)
+
+    def rebuild(self, version=None):
+        entries = self._load()
+        with self._lock:
+            self.mentors = {}
+            self.by_skill, self.by_hub, self.by_location = defaultdict(set), defaultdict(set), defaultdict(set)
+            self._max_reputation = 0
+            for entry in entries:
+                self._add(entry)
+            self._by_base = None
+            self.version = current_version() if version is None else version
+
+    def _reload(self, user_ids, entries):
+        for user_id in user_ids:
+            self._remove(user_id)
+            if user_id in entries:
+                self._add(entries[user_id])
+        self._by_base = None
+
+    def refresh(self, user_ids):
+        """Reload the given users' entries (dropping any that are no longer mentors)"""
+        entries = {entry.user_id: entry for entry in self._load(user_ids)}
+        new_version = bump_version(user_ids)
+        with self._lock:
+            if self.version is None:
+                return
+            self._reload(user_ids, entries)
+            # Stay current only if nobody else changed anything since our last read;
+            # otherwise the next read catches up on their changes
+            if new_version == self.version + 1:
+                self.version = new_version
+
+    def ensure_current(self):
+        version = current_version()
+        if self.version == version:
+            return
+        if self.version is None or self.version > version or version - self.version > MAX_CATCH_UP:
+            self.rebuild(version)
+            return
+        changes = cache.get_many([CHANGES_KEY.format(v) for v in range(self.version + 1, version + 1)])
+        if len(changes) < version - self.version:
+            # A full rebuild was asked for, or the record has expired
+            self.rebuild(version)
+            return
+        user_ids = list({user_id for changed in changes.values() for user_id in changed})
+        entries = {entry.user_id: entry for entry in self._load(user_ids)}
+        with self._lock:
+            self._reload(user_ids, entries)
+            self.version = version
+
+    def candidates(self, skill_id=None, location=''):
+        """Mentor user ids with skill_id and at the location key, or None for no filter"""
+        if skill_id is None and not location:
+            return None
+        with self._lock:
+            found = set(self.mentors)
+            if skill_id is not None:
+                found &= self.by_skill.get(skill_id, set())
+            if location:
+                found &= self.by_location.get(location, set())
+            return found
+
+    # -- scoring -----------------------------------------------------------
+
+    def _base_score(self, entry):
+        reputation = math.log1p(max(entry.reputation, 0)) / math.log1p(max(self._max_reputation, 1))
+        return WEIGHTS['reputation'] * reputation - WEIGHTS['load'] * entry.load
+
+    def _ranked_by_base(self):
+        if self._by_base is None:
+            self._by_base = sorted(self.mentors.values(), key=lambda entry: (-self._base_score(entry), entry.user_id))
+        return self._by_base
+
+    def top_matches(self, skills=frozenset(), hubs=frozenset(), location='', k=10, exclude=(), offset=0,
+                    candidates=None):
+        """
+        Best k Matches, after the first offset, for a mentee with the given
+        skill ids, hub ids and location key; only among candidates if given
+        """
+        wanted = offset + k
+        with self._lock:
+            shared_skills, shared_hubs = defaultdict(list), defaultdict(list)
+            for skill_id in skills:
+                for user_id in self.by_skill.get(skill_id, ()):
+                    shared_skills[user_id].append(skill_id)
+            for hub_id in hubs:
+                for user_id in self.by_hub.get(hub_id, ()):
+                    shared_hubs[user_id].append(hub_id)
+            nearby = self.by_location.get(location, set()) if location else set()
+
+            matches = []
+            for user_id in set(shared_skills) | set(shared_hubs) | nearby:
+                if user_id in exclude or (candidates is not None and user_id not in candidates):
+                    continue
+                entry = self.mentors[user_id]
+                score = (self._base_score(entry)
+                         + WEIGHTS['skill'] * len(shared_skills[user_id])
+                         + WEIGHTS['hub'] * len(shared_hubs[user_id])
+                         + (WEIGHTS['location'] if user_id in nearby else 0))
+                matches.append(Match(user_id, score, shared_skills[user_id], shared_hubs[user_id],
+                                     user_id in nearby, entry.load))
+
+            # Mentors with nothing in common are ranked on reputation and load alone
+            seen = {match.user_id for match in matches} | set(exclude)
+            filled = 0
+            for entry in self._ranked_by_base():
+                if filled >= wanted:
+                    break
+                if entry.user_id not in seen and (candidates is None or entry.user_id in candidates):
+                    matches.append(Match(entry.user_id, self._base_score(entry), load=entry.load))
+                    filled += 1
+
+        return heapq.nlargest(wanted, matches, key=lambda match: (match.score, -match.user_id))[offset:]
+
+
+def current_version():
+    return ChangeVersion.objects.filter(key=VERSION_KEY).values_list('version', flat=True).first() or 0
+
+
+def bump_version(user_ids=None):
+    """
+    Start a new index version: other processes reload just user_ids' entries,
+    or rebuild the whole index when user_ids is None
+    """
+    with transaction.atomic():
+        versions.bump(VERSION_KEY)
+        # The bump holds the row until we commit, so this is our version
+        version = current_version()
+    if user_ids is not None and settings.MATCHING_CHANGES_TTL:
+        cache.set(CHANGES_KEY.format(version), list(user_ids), timeout=settings.MATCHING_CHANGES_TTL)
+    return version
+
+
+_index = MentorIndex()
+
+
+def get_index():
+    _index.ensure_current()
+    return _index
+
+
+def top_matches(user, k=10, offset=0, candidates=None, index=None):
+    """Rank mentors for user (anonymous users get reputation/load order); never includes user"""
+    skills, hubs, location = _mentee_profile(user)
+    exclude = {user.pk} if user is not None and user.is_authenticated else set()
+    return (index or get_index()).top_matches(skills, hubs, location, k=k, exclude=exclude, offset=offset,
+                                              candidates=candidates)
+
+
+@dataclass
+class MentorPage:
+    matches: list
+    total: int
+    page: int
+    page_size: int
+    skill: Skill = None
+    location: str = ''
+
+    @property
+    def has_next(self):
+        return self.page * self.page_size < self.total
+
+    @property
+    def has_previous(self):
+        return self.page > 1
+
+
+def mentor_request(request):
+    """Rank the mentors described by ?skill=<id>, ?location= and ?page= for request.user"""
+    skill_id = request.GET.get('skill', '')
+    skill = Skill.objects.filter(pk=int(skill_id)).first() if skill_id.isdigit() else None
+    location = request.GET.get('location', '').strip()
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+    page_size = settings.MENTOR_PAGE_SIZE
+
+    index = get_index()
+    candidates = index.candidates(skill.pk if skill else None, _location_key(location))
+    if skill_id and skill is None:
+        candidates = set()
+    pool = set(index.mentors) if candidates is None else candidates
+    total = len(pool - {request.user.pk})
+    matches = top_matches(request.user, k=page_size, offset=(page - 1) * page_size, candidates=candidates,
+                          index=index)
+    return MentorPage(matches, total, page, page_size, skill, location)
+
+
+def _refresh(user_ids):
+    user_ids = list(user_ids)
+    if user_ids:
+        # Once the write commits, so neither this process nor others load the old rows
+        transaction.on_commit(lambda: _index.refresh(user_ids))
+
+
+def mentor_changed(user_id):
+    """Refresh user_id's entry if they are a mentor, e.g. after their reputation_score changed"""
+    if user_id in _index.mentors or UserProfile.objects.filter(user_id=user_id, is_mentor=True).exists():
+        _refresh([user_id])
+
+
+@receiver(post_save, sender=UserProfile)
+def profile_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not set(update_fields) & set(UserProfile.MATCHING_FIELDS):
+        return
+    # Edits that leave the indexed fields alone (bio, photo, visibility) don't touch the index
+    current = tuple(getattr(instance, name) for name in UserProfile.MATCHING_FIELDS)
+    changed = instance.is_mentor if created else getattr(instance, '_loaded_matching', None) != current
+    instance._loaded_matching = current
+    if changed:
+        _refresh([instance.user_id])
+
+
+@receiver(post_delete, sender=UserProfile)
+def profile_deleted(sender, instance, **kwargs):
+    if instance.is_mentor or instance.user_id in _index.mentors:
+        _refresh([instance.user_id])
+
+
+@receiver(post_save, sender=MentorshipRequest)
+@receiver(post_delete, sender=MentorshipRequest)
+def mentorship_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _refresh([instance.mentor_id])
+
+
+@receiver(m2m_changed, sender=UserProfile.skills.through)
+def skills_changed(sender, instance, action, reverse, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # skill.users.add(...): several profiles at once, rare enough to rebuild
+        bump_version()
+    elif instance.is_mentor:
+        _refresh([instance.user_id])
+
+
+@receiver(m2m_changed, sender=Hub.members.through)
+def hub_members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        if instance.pk in _index.mentors or UserProfile.objects.filter(user=instance, is_mentor=True).exists():
+            _refresh([instance.pk])
+    elif action == 'post_clear':
+        bump_version()
+    else:
+        _refresh(UserProfile.objects.filter(user_id__in=pk_set, is_mentor=True).values_list('user_id', flat=True))
@@ -0,0 +1,131 @@
+"""
+Hub membership sets in the cache.
+
+Each user's joined hub ids are cached, so membership checks and set
+operations (is_member, shared_hubs) are lookups in Python sets instead of
+queries. Entries are keyed by a per-user token that the m2m_changed receiver
+replaces after the change commits, the same way core/fragments.py versions
+profiles: a reader that loaded the old rows can only store them under the old
+token, which nobody asks for again. Member counts need no cache; they are
+stored on Hub (see the counters in core/models.py).
+
+The tokens only invalidate anything if every process sees them, so this
+needs a shared cache (REDIS_URL). With the per-process default,
+MEMBERSHIP_CACHE_TTL is 0 and the sets are read from the database each time;
+otherwise a join handled by one worker would go unseen by the others.
+
+toggle() decides between join and leave from the database while holding a
+lock on the user's row, so two concurrent toggles by one user run one after
+the other and leave a consistent state.
+"""
+
+import time
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+
+from .models import Hub
+
+
+def _token_key(pk):
+    return f'membership:version:user:{pk}'
+
+
+def _tokens(pks):
+    """Current tokens for pks; missing ones get a fresh token, never an old one"""
+    keys = {pk: _token_key(pk) for pk in pks}
+    found = cache.get_many(keys.values())
+    for key in keys.values():
+        if key not in found:
+            cache.add(key, time.time_ns(), timeout=None)
+            found[key] = cache.get(key)
+    return {pk: found[key] for pk, key in keys.items()}
+
+
+def _cached(pks, load):
+    """{pk: value} from the cache, calling load(missing pks) -> {pk: value} once for the rest"""
+    pks = set(pks)
+    if not pks:
+        return {}
+    if not settings.MEMBERSHIP_CACHE_TTL:
+        return load(pks)
+    keys = {pk: f'membership:user:{pk}:{token}' for pk, token in _tokens(pks).items()}
+    found = cache.get_many(keys.values())
+    values = {pk: found[key] for pk, key in keys.items() if key in found}
+    missing = pks - values.keys()
+    if missing:
+        loaded = load(missing)
+        cache.set_many({keys[pk]: loaded[pk] for pk in missing}, timeout=settings.MEMBERSHIP_CACHE_TTL)
+        values.update(loaded)
+    return values
+
+
+def _load_hub_ids(user_ids):
+    hub_ids = {user_id: set() for user_id in user_ids}
+    for user_id, hub_id in Hub.members.through.objects.filter(user_id__in=user_ids).values_list('user_id', 'hub_id'):
+        hub_ids[user_id].add(hub_id)
+    return {user_id: frozenset(ids) for user_id, ids in hub_ids.items()}
+
+
+def hub_ids_for_users(user_ids):
+    """{user_id: frozenset of joined hub ids}"""
+    return _cached(user_ids, _load_hub_ids)
+
+
+def hub_ids(user):
+    """Frozenset of the hub ids user has joined (empty for anonymous users)"""
+    if not user.is_authenticated:
+        return frozenset()
+    return hub_ids_for_users([user.pk])[user.pk]
+
+
+def is_member(user, hub_id):
+    return hub_id in hub_ids(user)
+
+
+def shared_hubs(user, other):
+    """Frozenset of the hub ids both users have joined"""
+    if not user.is_authenticated or not other.is_authenticated:
+        return frozenset()
+    sets = hub_ids_for_users([user.pk, other.pk])
+    return sets[user.pk] & sets[other.pk]
+
+
+def toggle(user, hub):
+    """Join hub if user isn't a member, otherwise leave it; returns True if user is now a member"""
+    with transaction.atomic():
+        # Serializes this user's toggles; other users' joins don't wait
+        list(User.objects.select_for_update().filter(pk=user.pk).values_list('pk'))
+        if Hub.members.through.objects.filter(hub_id=hub.pk, user_id=user.pk).exists():
+            hub.members.remove(user)
+            return False
+        hub.members.add(user)
+        return True
+
+
+def bump(user_ids):
+    """Invalidate the cached hub sets of user_ids"""
+    token = time.time_ns()
+    cache.set_many({_token_key(pk): token for pk in user_ids}, timeout=None)
+
+
+@receiver(m2m_changed, sender=Hub.members.through)
+def hub_members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        related = instance.joined_hubs if reverse else instance.members
+        instance._membership_cleared_ids = list(related.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    changed_ids = instance._membership_cleared_ids if action == 'post_clear' else list(pk_set or [])
+    if not changed_ids:
+        return
+    user_ids = [instance.pk] if reverse else changed_ids
+    # After commit, so a read in between can't cache the old rows under the new token
+    transaction.on_commit(partial(bump, user_ids))
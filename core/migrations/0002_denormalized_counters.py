@@ -0,0 +1,65 @@
+# Generated by Django 5.0 on 2026-10-18 17:00
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _count(queryset, group_field):
+    return Coalesce(Subquery(
+        queryset.order_by().values(group_field).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def populate_counters(apps, schema_editor):
+    Hub = apps.get_model('core', 'Hub')
+    Post = apps.get_model('core', 'Post')
+    Comment = apps.get_model('core', 'Comment')
+    UserProfile = apps.get_model('core', 'UserProfile')
+    Membership = Hub.members.through
+
+    Post.objects.update(comment_count=_count(Comment.objects.filter(post_id=OuterRef('pk')), 'post_id'))
+    Hub.objects.update(
+        post_count=_count(Post.objects.filter(hub_id=OuterRef('pk')), 'hub_id'),
+        member_count=_count(Membership.objects.filter(hub_id=OuterRef('pk')), 'hub_id'),
+    )
+    UserProfile.objects.update(
+        post_count=_count(Post.objects.filter(author_id=OuterRef('user_id')), 'author_id'),
+        comment_count=_count(Comment.objects.filter(author_id=OuterRef('user_id')), 'author_id'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hub',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='hub',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations
+
+CREATE_INDEX = """
+CREATE VIRTUAL TABLE IF NOT EXISTS core_search_index USING fts5(
+    title,
+    body,
+    doc_type UNINDEXED,
+    doc_id UNINDEXED,
+    post_id UNINDEXED,
+    hub_id UNINDEXED,
+    post_type UNINDEXED,
+    tokenize = 'porter unicode61 remove_diacritics 2'
+)
+"""
+
+POPULATE_INDEX = [
+    "INSERT INTO core_search_index (rowid, title, body, doc_type, doc_id, post_id, hub_id, post_type) "
+    "SELECT id * 2, title, content, 'post', id, id, hub_id, post_type FROM core_post",
+    "INSERT INTO core_search_index (rowid, title, body, doc_type, doc_id, post_id, hub_id, post_type) "
+    "SELECT c.id * 2 + 1, '', c.content, 'comment', c.id, c.post_id, p.hub_id, p.post_type "
+    "FROM core_comment c JOIN core_post p ON p.id = c.post_id",
+]
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 only exists on SQLite; other databases use a different SEARCH_BACKEND
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_INDEX)
+    for statement in POPULATE_INDEX:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS core_search_index")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_home_timeline'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0 on 2026-10-18 17:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_date', models.DateField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('metric', models.CharField(choices=[('signups', 'Signups'), ('posts', 'Posts'), ('comments', 'Comments'), ('votes', 'Helpful votes'), ('mentorship_requests', 'Mentorship requests')], max_length=30)),
+                ('count', models.IntegerField(default=0)),
+                ('hub', models.ForeignKey(blank=True, help_text='Empty for the platform-wide total', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='core.hub')),
+            ],
+            options={
+                'ordering': ['date'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('hub__isnull', False)), fields=('metric', 'hub', 'date'), name='rollup_unique_hub_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('hub__isnull', True)), fields=('metric', 'date'), name='rollup_unique_total_day'),
+        ),
+    ]
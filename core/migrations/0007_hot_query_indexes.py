@@ -0,0 +1,39 @@
+# Generated by Django 5.0 on 2026-10-18 17:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_change_versions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-is_accepted_answer', '-helpful_count', '-created_at'], name='comment_post_ranked_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mentorshiprequest',
+            index=models.Index(fields=['mentor', '-created_at'], name='mentorship_mentor_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mentorshiprequest',
+            index=models.Index(fields=['mentee', '-created_at'], name='mentorship_mentee_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mentorshiprequest',
+            index=models.Index(fields=['mentor', 'status'], name='mentorship_mentor_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['hub', '-created_at', '-id'], name='post_hub_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='post_author_recent_idx'),
+        ),
+    ]
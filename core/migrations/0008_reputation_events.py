@@ -0,0 +1,107 @@
+# Generated by Django 5.0 on 2026-10-18 17:34
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+# core.reputation.POINTS at the time of this migration
+POINTS = {'post': 2, 'post_vote': 5, 'comment_vote': 2, 'accepted_answer': 15, 'mentorship_completed': 20}
+
+
+def backfill_reputation(apps, schema_editor):
+    """Derive the event log from existing data and replace the seeded scores with its sums"""
+    Post = apps.get_model('core', 'Post')
+    Comment = apps.get_model('core', 'Comment')
+    HelpfulVote = apps.get_model('core', 'HelpfulVote')
+    MentorshipRequest = apps.get_model('core', 'MentorshipRequest')
+    ReputationEvent = apps.get_model('core', 'ReputationEvent')
+    UserProfile = apps.get_model('core', 'UserProfile')
+
+    sources = [
+        ('post', Post.objects.values_list('author_id', 'created_at', 'pk'), 'post_id', None),
+        ('post_vote', HelpfulVote.objects.filter(post__isnull=False).exclude(user_id=F('post__author_id'))
+         .values_list('post__author_id', 'created_at', 'post_id', 'user_id'), 'post_id', 'actor_id'),
+        ('comment_vote', HelpfulVote.objects.filter(comment__isnull=False).exclude(user_id=F('comment__author_id'))
+         .values_list('comment__author_id', 'created_at', 'comment_id', 'user_id'), 'comment_id', 'actor_id'),
+        ('accepted_answer', Comment.objects.filter(is_accepted_answer=True)
+         .values_list('author_id', 'created_at', 'pk'), 'comment_id', None),
+        ('mentorship_completed', MentorshipRequest.objects.filter(status='completed')
+         .values_list('mentor_id', 'updated_at', 'pk', 'mentee_id'), 'mentorship_id', 'actor_id'),
+    ]
+    for kind, rows, ref_field, actor_field in sources:
+        batch = []
+        for user_id, created_at, ref_id, *actor in rows.order_by().iterator(chunk_size=2000):
+            event = ReputationEvent(user_id=user_id, kind=kind, points=POINTS[kind], created_at=created_at,
+                                    **{ref_field: ref_id})
+            if actor_field:
+                setattr(event, actor_field, actor[0])
+            batch.append(event)
+            if len(batch) >= 2000:
+                ReputationEvent.objects.bulk_create(batch)
+                batch = []
+        ReputationEvent.objects.bulk_create(batch)
+
+    UserProfile.objects.update(reputation_score=Coalesce(Subquery(
+        ReputationEvent.objects.filter(user_id=OuterRef('user_id')).order_by()
+        .values('user_id').annotate(total=Sum('points')).values('total')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_hot_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReputationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('post', 'Wrote a post'), ('post_vote', 'Post voted helpful'), ('comment_vote', 'Comment voted helpful'), ('accepted_answer', 'Answer accepted'), ('mentorship_completed', 'Mentorship completed')], max_length=30)),
+                ('points', models.IntegerField(help_text='Negative for an undo (retracted vote, unaccepted answer...)')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['-reputation_score', 'id'], name='profile_reputation_idx'),
+        ),
+        migrations.AddField(
+            model_name='reputationevent',
+            name='actor',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='reputationevent',
+            name='comment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.comment'),
+        ),
+        migrations.AddField(
+            model_name='reputationevent',
+            name='mentorship',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.mentorshiprequest'),
+        ),
+        migrations.AddField(
+            model_name='reputationevent',
+            name='post',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.post'),
+        ),
+        migrations.AddField(
+            model_name='reputationevent',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reputation_events', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='reputationevent',
+            index=models.Index(fields=['user', '-created_at'], name='reputation_user_recent_idx'),
+        ),
+        migrations.RunPython(backfill_reputation, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.0 on 2026-10-18 17:47
+
+import math
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+# core.ranking's formula with the settings at the time of this migration
+HOT_WEIGHTS = {'helpful': 1.0, 'comment': 0.5, 'accepted_answer': 3.0}
+HOT_HALF_LIFE_HOURS = 24
+
+
+def score_posts(apps, schema_editor):
+    Post = apps.get_model('core', 'Post')
+    Comment = apps.get_model('core', 'Comment')
+    accepted = Comment.objects.filter(post_id=OuterRef('pk'), is_accepted_answer=True)
+    batch = []
+    for pk, helpful_count, comment_count, has_accepted, created_at in Post.objects.annotate(
+            accepted=Exists(accepted)).values_list(
+            'pk', 'helpful_count', 'comment_count', 'accepted', 'created_at').iterator(chunk_size=2000):
+        top = (HOT_WEIGHTS['helpful'] * max(helpful_count, 0) + HOT_WEIGHTS['comment'] * comment_count
+               + (HOT_WEIGHTS['accepted_answer'] if has_accepted else 0))
+        hot = math.log2(1 + top) + created_at.timestamp() / (HOT_HALF_LIFE_HOURS * 3600)
+        batch.append(Post(pk=pk, hot_score=hot, top_score=top))
+        if len(batch) >= 2000:
+            Post.objects.bulk_update(batch, ['hot_score', 'top_score'])
+            batch = []
+    Post.objects.bulk_update(batch, ['hot_score', 'top_score'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_avatar_hash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='hot_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='top_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-hot_score', '-id'], name='post_hot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['hub', '-hot_score', '-id'], name='post_hub_hot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-top_score', '-id'], name='post_top_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['hub', '-top_score', '-id'], name='post_hub_top_idx'),
+        ),
+        migrations.RunPython(score_posts, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,11 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.utils.text import slugify
-from django.db.models import Count
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
 
 
 class Skill(models.Model):
@@ -45,28 +49,42 @@ class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     bio = models.TextField(max_length=500, blank=True)
     profile_image = models.ImageField(upload_to='profiles/', blank=True, null=True)
+    # SHA-256 of the uploaded photo; names its cleaned copy and avatar renditions (see core/images.py)
+    avatar_hash = models.CharField(max_length=64, blank=True, editable=False)
     location = models.CharField(max_length=100, blank=True)
     visibility_mode = models.CharField(max_length=20, choices=VISIBILITY_CHOICES, default='public')
     is_mentor = models.BooleanField(default=False)
     skills = models.ManyToManyField(Skill, blank=True, related_name='users')
     equity_badges = models.ManyToManyField(Badge, blank=True, related_name='users')
     reputation_score = models.IntegerField(default=0)
+    post_count = models.PositiveIntegerField(default=0, editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"{self.user.username}'s profile"
 
+    # The columns core/matching.py indexes mentors by
+    MATCHING_FIELDS = ('is_mentor', 'location', 'reputation_score')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # So the mentor index is only refreshed when something it reads changes
+        instance._loaded_matching = tuple(instance.__dict__.get(name) for name in cls.MATCHING_FIELDS)
+        return instance
+
     def get_display_name(self):
         """Return pseudonym if visibility is pseudonymous"""
         if self.visibility_mode == 'pseudonymous':
             return f"User{self.user.id}"
         return self.user.get_full_name() or self.user.username
 
-    def post_count(self):
-        return self.user.posts.count()
-
-    def comment_count(self):
-        return self.user.comments.count()
+    class Meta:
+        indexes = [
+            # Leaderboard top-k and rank lookups
+            models.Index(fields=['-reputation_score', 'id'], name='profile_reputation_idx'),
+        ]
 
 
 class Hub(models.Model):
@@ -78,6 +96,8 @@ class Hub(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     moderators = models.ManyToManyField(UserProfile, blank=True, related_name='moderated_hubs')
     members = models.ManyToManyField(User, blank=True, related_name='joined_hubs')
+    member_count = models.PositiveIntegerField(default=0, editable=False)
+    post_count = models.PositiveIntegerField(default=0, editable=False)
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -87,12 +107,6 @@ class Hub(models.Model):
     def __str__(self):
         return self.name
 
-    def member_count(self):
-        return self.members.count()
-
-    def post_count(self):
-        return self.posts.count()
-
     class Meta:
         ordering = ['-created_at']
 
@@ -115,23 +129,41 @@ class Post(models.Model):
     video_url = models.URLField(blank=True, help_text="Optional YouTube/Vimeo link")
     is_anonymous = models.BooleanField(default=False)
     helpful_count = models.IntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    # Feed ranking scores, kept up to date by core/ranking.py
+    hot_score = models.FloatField(default=0, editable=False)
+    top_score = models.FloatField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the parents we loaded with so counter hooks can tell a move from an edit
+        remember_parents(instance)
+        return instance
+
     def get_author_display(self):
         """Return 'Anonymous' if post is anonymous"""
         if self.is_anonymous:
             return "Anonymous"
         return self.author.profile.get_display_name()
 
-    def comment_count(self):
-        return self.comments.count()
-
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Hub feeds and profile pages, newest first as paginate_keyset reads them
+            models.Index(fields=['hub', '-created_at', '-id'], name='post_hub_recent_idx'),
+            models.Index(fields=['author', '-created_at', '-id'], name='post_author_recent_idx'),
+            # Hot and Top tabs, site-wide and per hub
+            models.Index(fields=['-hot_score', '-id'], name='post_hot_idx'),
+            models.Index(fields=['hub', '-hot_score', '-id'], name='post_hub_hot_idx'),
+            models.Index(fields=['-top_score', '-id'], name='post_top_idx'),
+            models.Index(fields=['hub', '-top_score', '-id'], name='post_hub_top_idx'),
+        ]
 
 
 class Comment(models.Model):
@@ -146,8 +178,20 @@ class Comment(models.Model):
     def __str__(self):
         return f"Comment by {self.author.username} on {self.post.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # So reputation hooks can tell when an answer is accepted or unaccepted
+        instance._loaded_is_accepted_answer = instance.__dict__.get('is_accepted_answer')
+        remember_parents(instance)
+        return instance
+
     class Meta:
         ordering = ['-is_accepted_answer', '-helpful_count', '-created_at']
+        indexes = [
+            models.Index(fields=['post', '-is_accepted_answer', '-helpful_count', '-created_at'],
+                         name='comment_post_ranked_idx'),
+        ]
 
 
 class MentorshipRequest(models.Model):
@@ -170,8 +214,21 @@ class MentorshipRequest(models.Model):
     def __str__(self):
         return f"{self.mentee.username} → {self.mentor.username}: {self.topic}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # So reputation hooks can tell when a mentorship is completed
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['mentor', '-created_at'], name='mentorship_mentor_recent_idx'),
+            models.Index(fields=['mentee', '-created_at'], name='mentorship_mentee_recent_idx'),
+            # Open requests per mentor (matching load)
+            models.Index(fields=['mentor', 'status'], name='mentorship_mentor_status_idx'),
+        ]
 
 
 class HelpfulVote(models.Model):
@@ -183,3 +240,296 @@ class HelpfulVote(models.Model):
 
     class Meta:
         unique_together = [['user', 'post'], ['user', 'comment']]
+
+
+class HomeTimeline(models.Model):
+    """Marks a user whose home feed has been materialized into TimelineEntry rows"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='home_timeline')
+    built_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user.username}'s timeline"
+
+
+class TimelineEntry(models.Model):
+    """A post fanned out to one member's home feed when it was written"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    hub = models.ForeignKey(Hub, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(help_text="Copy of the post's created_at, used as the feed sort key")
+
+    class Meta:
+        unique_together = [['user', 'post']]
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'], name='timeline_user_recent_idx'),
+            models.Index(fields=['user', 'hub'], name='timeline_user_hub_idx'),
+        ]
+
+
+class DailyRollup(models.Model):
+    """Per-day count of new signups, posts, comments, votes or mentorship requests"""
+    METRIC_CHOICES = [
+        ('signups', 'Signups'),
+        ('posts', 'Posts'),
+        ('comments', 'Comments'),
+        ('votes', 'Helpful votes'),
+        ('mentorship_requests', 'Mentorship requests'),
+    ]
+
+    date = models.DateField()
+    metric = models.CharField(max_length=30, choices=METRIC_CHOICES)
+    hub = models.ForeignKey(Hub, on_delete=models.CASCADE, null=True, blank=True, related_name='daily_rollups',
+                            help_text="Empty for the platform-wide total")
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.date} {self.metric} ({self.hub or 'all hubs'}): {self.count}"
+
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['metric', 'hub', 'date'], name='rollup_unique_hub_day',
+                                    condition=models.Q(hub__isnull=False)),
+            models.UniqueConstraint(fields=['metric', 'date'], name='rollup_unique_total_day',
+                                    condition=models.Q(hub__isnull=True)),
+        ]
+
+
+class RollupCheckpoint(models.Model):
+    """Progress marker so backfill_rollups can resume where it stopped"""
+    name = models.CharField(max_length=50, unique=True)
+    last_date = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_date}"
+
+
+class ChangeVersion(models.Model):
+    """Counter bumped whenever the data behind a key ('hubs', 'hub:<id>', 'post:<id>', ...) changes"""
+    key = models.CharField(max_length=100, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.key} v{self.version}"
+
+
+class ReputationEvent(models.Model):
+    """Append-only log of reputation changes; a profile's reputation_score is the sum of its points"""
+    KIND_CHOICES = [
+        ('post', 'Wrote a post'),
+        ('post_vote', 'Post voted helpful'),
+        ('comment_vote', 'Comment voted helpful'),
+        ('accepted_answer', 'Answer accepted'),
+        ('mentorship_completed', 'Mentorship completed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reputation_events')
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    points = models.IntegerField(help_text="Negative for an undo (retracted vote, unaccepted answer...)")
+    actor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    post = models.ForeignKey(Post, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    comment = models.ForeignKey(Comment, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    mentorship = models.ForeignKey(MentorshipRequest, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='+')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.user.username} {self.points:+d} ({self.kind})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='reputation_user_recent_idx'),
+        ]
+
+
+class Task(models.Model):
+    """A deferred call to a function registered with core.tasks.task, run by `manage.py run_worker`"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict, blank=True)
+    priority = models.SmallIntegerField(default=0, help_text="Higher runs first")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+    class Meta:
+        ordering = ['-priority', 'run_at', 'id']
+        indexes = [
+            # Claiming walks the queued rows in run order; lease expiry scans the running ones
+            models.Index(fields=['status', '-priority', 'run_at', 'id'], name='task_claim_idx'),
+        ]
+
+
+class TaskSchedule(models.Model):
+    """Next due time of each periodic task in TASK_SCHEDULE, shared by all workers"""
+    name = models.CharField(max_length=200, unique=True)
+    next_run_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} at {self.next_run_at}"
+
+
+class LiveEvent(models.Model):
+    """An event published with the database backend of core/events.py, read by every process's poller"""
+    channel = models.CharField(max_length=100)
+    kind = models.CharField(max_length=50)
+    data = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.kind} on {self.channel} #{self.pk}"
+
+    class Meta:
+        indexes = [
+            # Replaying what a reconnecting client missed on its channels
+            models.Index(fields=['channel', 'id'], name='liveevent_channel_idx'),
+            models.Index(fields=['created_at'], name='liveevent_created_idx'),
+        ]
+
+# Denormalized counters
+#
+# Post.comment_count, Hub.member_count/post_count and UserProfile.post_count/
+# comment_count are stored columns so list pages don't run a COUNT per row.
+# The receivers below keep them in step with every save and delete, including
+# a post moved to another hub or author and a comment moved to another post or
+# author. Anything that skips signals (bulk_create, QuerySet.update(), raw
+# SQL) should be followed by `python manage.py reconcile_counters`.
+
+# Counted model -> {foreign key attname: (parent model, its lookup, counter)}
+COUNTED_PARENTS = {
+    Post: {
+        'hub_id': (Hub, 'pk', 'post_count'),
+        'author_id': (UserProfile, 'user_id', 'post_count'),
+    },
+    Comment: {
+        'post_id': (Post, 'pk', 'comment_count'),
+        'author_id': (UserProfile, 'user_id', 'comment_count'),
+    },
+}
+
+
+def remember_parents(instance):
+    """Note the parent keys instance was loaded or last saved with"""
+    instance._loaded_parents = {
+        attname: instance.__dict__.get(attname) for attname in COUNTED_PARENTS[instance._meta.concrete_model]
+    }
+
+
+def adjust_counter(queryset, field, delta):
+    """Atomically add delta to a counter column without letting it go negative"""
+    if delta > 0:
+        queryset.update(**{field: F(field) + delta})
+    elif delta < 0:
+        queryset.filter(**{f'{field}__gte': -delta}).update(**{field: F(field) + delta})
+
+
+def adjust_parent_counters(instance, delta, parents=None):
+    """Add delta to the counters of instance's parents (or of the given {attname: pk})"""
+    for attname, (model, lookup, field) in COUNTED_PARENTS[instance._meta.concrete_model].items():
+        pk = getattr(instance, attname) if parents is None else parents.get(attname)
+        if pk is not None:
+            adjust_counter(model.objects.filter(**{lookup: pk}), field, delta)
+
+
+def refresh_member_counts(hub_ids):
+    """Recount Hub.member_count for the given hubs in a single UPDATE"""
+    memberships = Hub.members.through.objects.filter(hub_id=OuterRef('pk')).order_by()
+    Hub.objects.filter(pk__in=hub_ids).update(member_count=Coalesce(
+        Subquery(memberships.values('hub_id').annotate(total=Count('pk')).values('total')), 0
+    ))
+
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=Comment)
+def counted_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Find the parents an existing row is moving away from, before it is written"""
+    instance._moved_parents = {}
+    if raw or instance.pk is None:
+        return
+    attnames = [
+        attname for attname in COUNTED_PARENTS[sender]
+        if update_fields is None or attname in update_fields or attname.removesuffix('_id') in update_fields
+    ]
+    if not attnames:
+        return
+    stored = getattr(instance, '_loaded_parents', {})
+    if any(stored.get(attname) is None for attname in attnames):
+        # Not loaded with these columns (e.g. built by hand or with .only()); ask the database
+        stored = sender._base_manager.filter(pk=instance.pk).values(*attnames).first() or {}
+    instance._moved_parents = {
+        attname: stored[attname] for attname in attnames
+        if stored.get(attname) is not None and stored[attname] != getattr(instance, attname)
+    }
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        adjust_parent_counters(instance, 1)
+    else:
+        moved = getattr(instance, '_moved_parents', {})
+        adjust_parent_counters(instance, -1, moved)
+        adjust_parent_counters(instance, 1, {attname: getattr(instance, attname) for attname in moved})
+        instance._moved_from_hub_id = moved.get('hub_id')
+    remember_parents(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    adjust_parent_counters(instance, -1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        adjust_parent_counters(instance, 1)
+    else:
+        moved = getattr(instance, '_moved_parents', {})
+        adjust_parent_counters(instance, -1, moved)
+        adjust_parent_counters(instance, 1, {attname: getattr(instance, attname) for attname in moved})
+    remember_parents(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    adjust_parent_counters(instance, -1)
+
+
+@receiver(m2m_changed, sender=Hub.members.through)
+def hub_members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # user.joined_hubs.clear() doesn't tell post_clear which hubs were affected
+        instance._cleared_hub_ids = list(instance.joined_hubs.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        hub_ids = [instance.pk]
+    elif action == 'post_clear':
+        hub_ids = getattr(instance, '_cleared_hub_ids', [])
+    else:
+        hub_ids = pk_set or []
+    if hub_ids:
+        refresh_member_counts(hub_ids)
@@ -0,0 +1,192 @@
+"""
+Per-request SQL profiling.
+
+Every database connection gets an execute wrapper when it opens. It does
+nothing unless the current context has a QueryRecorder, which
+SQLProfilerMiddleware sets for SQL_PROFILER_SAMPLE_RATE of requests. Being a
+context variable, the recorder follows the request into the threads async
+views run their queries on. It records the query count, the time spent in
+the database, and how often each query shape ran (the SQL with parameters and
+IN lists collapsed). A shape that runs
+SQL_PROFILER_REPEAT_THRESHOLD times or more in one request is almost always
+an N+1 loop.
+
+Sampled responses get a Server-Timing header (visible in the browser's
+network panel). Requests slower than SQL_PROFILER_SLOW_MS or with repeated
+shapes go into a fixed-size ring buffer per process, shown to staff at
+/analytics/queries/. Unsampled requests cost a random() call plus a context
+variable lookup per query.
+"""
+
+import contextvars
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize(sql):
+    """The query's shape: literals and IN lists collapsed, so loop iterations compare equal"""
+    sql = _LITERALS.sub('?', sql)
+    sql = _IN_LIST.sub('(...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """execute_wrapper that counts and times every query"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            self.shapes[sql] += 1
+
+    def repeated(self):
+        """[(shape, times)] for shapes run at least SQL_PROFILER_REPEAT_THRESHOLD times, worst first"""
+        shapes = Counter()
+        for sql, times in self.shapes.items():
+            shapes[normalize(sql)] += times
+        return [(shape, times) for shape, times in shapes.most_common()
+                if times >= settings.SQL_PROFILER_REPEAT_THRESHOLD]
+
+
+_recorder = contextvars.ContextVar('sql_profiler_recorder', default=None)
+
+
+def _execute(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_wrapper(sender, connection, **kwargs):
+    # Wrappers live on the connection object, which outlives reconnects
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute)
+
+
+@dataclass
+class RequestProfile:
+    method: str
+    path: str
+    view: str
+    status: int
+    total_ms: float
+    db_ms: float
+    queries: int
+    repeated: list = field(default_factory=list)
+    at: object = None
+
+
+_slow = None
+_slow_lock = threading.Lock()
+
+
+def _buffer():
+    global _slow
+    if _slow is None:
+        _slow = deque(maxlen=settings.SQL_PROFILER_BUFFER_SIZE)
+    return _slow
+
+
+def _remember(profile):
+    with _slow_lock:
+        _buffer().append(profile)
+
+
+def slow_requests():
+    """Profiles in this process's ring buffer, slowest first"""
+    with _slow_lock:
+        profiles = list(_buffer())
+    return sorted(profiles, key=lambda profile: profile.total_ms, reverse=True)
+
+
+def clear():
+    with _slow_lock:
+        _buffer().clear()
+
+
+class SQLProfilerMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+        recorder, started = QueryRecorder(), time.perf_counter()
+        token = _recorder.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self._finish(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+        recorder, started = QueryRecorder(), time.perf_counter()
+        token = _recorder.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self._finish(request, response, recorder, started)
+
+    @staticmethod
+    def _sampled():
+        rate = settings.SQL_PROFILER_SAMPLE_RATE
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def _finish(self, request, response, recorder, started):
+        total_ms = (time.perf_counter() - started) * 1000
+        db_ms = recorder.seconds * 1000
+        repeated = recorder.repeated()
+
+        timings = [f'db;dur={db_ms:.1f};desc="{recorder.count} queries"', f'total;dur={total_ms:.1f}']
+        if repeated:
+            timings.append(f'repeat;desc="{len(repeated)} repeated query shapes"')
+        response.headers['Server-Timing'] = ', '.join(timings)
+
+        if total_ms >= settings.SQL_PROFILER_SLOW_MS or repeated:
+            match = request.resolver_match
+            _remember(RequestProfile(
+                method=request.method, path=request.get_full_path(),
+                view=match.view_name if match else '', status=response.status_code,
+                total_ms=round(total_ms, 1), db_ms=round(db_ms, 1), queries=recorder.count,
+                repeated=repeated, at=timezone.now(),
+            ))
+        for shape, times in repeated:
+            logger.warning('Query ran %d times in %s %s: %s', times, request.method, request.path, shape[:300])
+        return response
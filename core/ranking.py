@@ -0,0 +1,147 @@
+"""
+Hot and top rankings for post feeds.
+
+Every post stores two scores, each covered by an index that gives a ranked
+feed its order, so a page reads the index from the top like the New feed:
+
+    top_score  engagement: weighted helpful votes, comments and an accepted
+               answer (HOT_WEIGHTS)
+    hot_score  log2(1 + engagement) + created_at / HOT_HALF_LIFE_HOURS
+
+Adding age to the log is the same ordering as engagement * 2^(-age / half
+life), so a post needs twice the engagement of one posted a half-life later
+to rank level with it. Because the decay is anchored at the creation time,
+scores don't have to be rewritten as time passes; they change only when the
+engagement does. Votes and comments refresh their post's scores in the same
+transaction. The rescore_recent task re-derives the scores of recent posts
+in bulk every hour, which also picks up rows written without signals. After
+changing the weights or half-life, run `python manage.py rescore_posts`.
+
+The Top tab only counts posts created since the start of the day
+TOP_WINDOW_DAYS ago. top_score isn't windowed, so its index can't skip older
+posts: a Top page walks the index past every older post that outscores it.
+The window moves once a day, at local midnight, and window_bucket() names it
+so cached pages and conditional-GET validators change with it.
+"""
+
+import math
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Post, Comment
+from .tasks import task
+
+# sort -> (tab label, keyset pagination keys)
+SORTS = {
+    'hot': ('Hot', ('hot_score', 'id')),
+    'top': ('Top this week', ('top_score', 'id')),
+    'new': ('New', ('created_at', 'id')),
+}
+DEFAULT_SORT = 'new'
+
+
+def engagement(helpful_count, comment_count, accepted):
+    weights = settings.HOT_WEIGHTS
+    return (weights['helpful'] * max(helpful_count, 0) + weights['comment'] * comment_count
+            + (weights['accepted_answer'] if accepted else 0))
+
+
+def hot_score(engagement_score, created_at):
+    return math.log2(1 + engagement_score) + created_at.timestamp() / (settings.HOT_HALF_LIFE_HOURS * 3600)
+
+
+def refresh(post_ids):
+    """Recompute the stored scores of post_ids from their current counters; returns how many changed"""
+    accepted = Comment.objects.filter(post_id=OuterRef('pk'), is_accepted_answer=True)
+    rows = Post.objects.filter(pk__in=post_ids).annotate(accepted=Exists(accepted)).values_list(
+        'pk', 'helpful_count', 'comment_count', 'accepted', 'created_at', 'hot_score', 'top_score')
+    changed = []
+    for pk, helpful_count, comment_count, has_accepted, created_at, old_hot, old_top in rows:
+        top = engagement(helpful_count, comment_count, has_accepted)
+        hot = hot_score(top, created_at)
+        if (hot, top) != (old_hot, old_top):
+            changed.append(Post(pk=pk, hot_score=hot, top_score=top))
+    # bulk_update, not save(): no signals, and updated_at (which versions the post's cache) stays put
+    Post.objects.bulk_update(changed, ['hot_score', 'top_score'], batch_size=500)
+    return len(changed)
+
+
+def rescore(queryset, chunk_size=2000):
+    """refresh() every post in queryset, a chunk of primary keys at a time; returns how many changed"""
+    changed = 0
+    last_pk = 0
+    while True:
+        pks = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return changed
+        changed += refresh(pks)
+        last_pk = pks[-1]
+
+
+def get_sort(request):
+    sort = request.GET.get('sort', DEFAULT_SORT)
+    return sort if sort in SORTS else DEFAULT_SORT
+
+
+def _midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def window_bucket(sort):
+    """The day the Top window ends, or None for sorts without a window"""
+    return timezone.localdate() if sort == 'top' else None
+
+
+def window_moved_at(sort):
+    """When the sort's window last moved (today's local midnight), or None for sorts without one"""
+    day = window_bucket(sort)
+    return _midnight(day) if day else None
+
+
+def window_start():
+    """Start of today's Top window: local midnight TOP_WINDOW_DAYS ago"""
+    return _midnight(timezone.localdate() - timedelta(days=settings.TOP_WINDOW_DAYS))
+
+
+def sorted_posts(queryset, sort):
+    """(queryset, keys) for paginate_keyset to list queryset in the given sort order"""
+    if sort == 'top':
+        queryset = queryset.filter(created_at__gte=window_start())
+    return queryset, SORTS[sort][1]
+
+
+def tabs(sort):
+    """[(sort, label, active)] for the feed tab bar"""
+    return [(key, label, key == sort) for key, (label, _) in SORTS.items()]
+
+
+@task(priority=-5)
+def rescore_recent():
+    cutoff = timezone.now() - timedelta(days=settings.HOT_RESCORE_DAYS)
+    return rescore(Post.objects.filter(created_at__gte=cutoff))
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        return
+    top = engagement(instance.helpful_count, instance.comment_count, False)
+    instance.top_score, instance.hot_score = top, hot_score(top, instance.created_at)
+    Post.objects.filter(pk=instance.pk).update(top_score=instance.top_score, hot_score=instance.hot_score)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, raw=False, **kwargs):
+    # New comments and accepted-answer flips both change the post's engagement
+    if not raw:
+        refresh([instance.post_id])
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    refresh([instance.post_id])
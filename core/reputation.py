@@ -0,0 +1,129 @@
+"""
+Reputation from an append-only event log.
+
+Everything that earns reputation appends a ReputationEvent with its points
+and adds the same points to UserProfile.reputation_score with an F()
+update, in one transaction. Undoing something (retracting a vote,
+unaccepting an answer) appends a negative event instead of deleting one, so
+reputation_score always equals the sum of the user's events.
+`python manage.py recompute_reputation` rebuilds the scores from the log,
+and --rebuild-log first regenerates the log from the source tables.
+
+Votes cast with VOTE_WRITE_BEHIND are credited through core/buffers.py
+instead: a flush appends one event per author, voter and target with the net
+points, and updates each author's score once.
+
+Reputation stays when a post or comment is deleted. Its events keep their
+points and just lose the link.
+"""
+
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import buffers, matching
+from .models import Post, Comment, MentorshipRequest, ReputationEvent, UserProfile
+
+# Points per event kind
+POINTS = {
+    'post': 2,
+    'post_vote': 5,
+    'comment_vote': 2,
+    'accepted_answer': 15,
+    'mentorship_completed': 20,
+}
+
+
+def record(user_id, kind, sign=1, **refs):
+    """Append an event worth sign * POINTS[kind] and apply it to the user's score"""
+    points = sign * POINTS[kind]
+    with transaction.atomic():
+        ReputationEvent.objects.create(user_id=user_id, kind=kind, points=points, **refs)
+        UserProfile.objects.filter(user_id=user_id).update(reputation_score=F('reputation_score') + points)
+        # The update skips post_save; mentors are ranked partly on reputation
+        matching.mentor_changed(user_id)
+
+
+def record_vote(voter, sign, post=None, comment=None, buffered=False):
+    """Credit (sign=1) or debit (sign=-1) the author of a voted post or comment"""
+    kind, obj = ('post', post) if post is not None else ('comment', comment)
+    if obj.author_id == voter.pk:
+        return
+    if buffered:
+        buffers.add('reputation', f'{kind}_vote', obj.author_id, voter.pk, kind, obj.pk, delta=sign)
+    else:
+        record(obj.author_id, f'{kind}_vote', sign, actor=voter, **{kind: obj})
+
+
+@buffers.applier('reputation')
+def apply_buffered(deltas):
+    """Write {(kind, user_id, actor_id, target_kind, target_pk): sign} as events and score updates"""
+    # Whatever was deleted since the vote just loses its link, as it would have anyway
+    targets = defaultdict(set)
+    for _, _, _, target_kind, target_pk in deltas:
+        targets[target_kind].add(target_pk)
+    existing = {
+        'post': set(Post.objects.filter(pk__in=targets['post']).values_list('pk', flat=True)),
+        'comment': set(Comment.objects.filter(pk__in=targets['comment']).values_list('pk', flat=True)),
+    }
+    user_ids = {user_id for _, user_id, _, _, _ in deltas} | {actor_id for _, _, actor_id, _, _ in deltas}
+    users = set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+
+    events, scores = [], defaultdict(int)
+    for (kind, user_id, actor_id, target_kind, target_pk), sign in deltas.items():
+        if user_id not in users:
+            continue
+        points = sign * POINTS[kind]
+        events.append(ReputationEvent(
+            user_id=user_id, kind=kind, points=points, actor_id=actor_id if actor_id in users else None,
+            **{f'{target_kind}_id': target_pk if target_pk in existing[target_kind] else None},
+        ))
+        scores[user_id] += points
+    ReputationEvent.objects.bulk_create(events)
+    for user_id, points in scores.items():
+        if points:
+            UserProfile.objects.filter(user_id=user_id).update(reputation_score=F('reputation_score') + points)
+            matching.mentor_changed(user_id)
+
+
+def leaderboard(limit):
+    """Top profiles by reputation, read straight off profile_reputation_idx"""
+    return UserProfile.objects.select_related('user').order_by('-reputation_score', 'id')[:limit]
+
+
+def rank(profile):
+    """1-based leaderboard position of profile"""
+    return UserProfile.objects.filter(reputation_score__gt=profile.reputation_score).count() + 1
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        record(instance.author_id, 'post', post=instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    was_accepted = bool(getattr(instance, '_loaded_is_accepted_answer', False))
+    if instance.is_accepted_answer != was_accepted:
+        record(instance.author_id, 'accepted_answer', 1 if instance.is_accepted_answer else -1,
+               comment=instance, post_id=instance.post_id)
+    instance._loaded_is_accepted_answer = instance.is_accepted_answer
+
+
+@receiver(post_save, sender=MentorshipRequest)
+def mentorship_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    was_completed = getattr(instance, '_loaded_status', None) == 'completed'
+    is_completed = instance.status == 'completed'
+    if is_completed != was_completed:
+        record(instance.mentor_id, 'mentorship_completed', 1 if is_completed else -1,
+               actor_id=instance.mentee_id, mentorship=instance)
+    instance._loaded_status = instance.status
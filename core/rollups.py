@@ -0,0 +1,166 @@
+"""
+Daily rollups behind the growth charts.
+
+Every signup, post, comment, helpful vote and mentorship request adds one to
+the DailyRollup row for its day (and hub, where it has one), so a growth
+series is a read of at most one row per day instead of a GROUP BY over the
+source tables. The platform-wide row for today is written by everyone, so the
+increments go through core/buffers.py rather than the writer's transaction:
+a flush writes each row's summed delta once and bumps the 'rollups' version.
+`python manage.py backfill_rollups` rebuilds the rows from history and can
+resume after an interruption.
+"""
+
+from datetime import date, datetime, time, timedelta
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Coalesce, TruncDate
+from django.db.models.signals import post_save, pre_delete, post_delete
+from django.utils import timezone
+
+from . import buffers, versions
+from .models import Hub, Post, Comment, HelpfulVote, MentorshipRequest, DailyRollup
+
+# metric -> (model, timestamp field, hub lookup or None)
+SOURCES = {
+    'signups': (User, 'date_joined', None),
+    'posts': (Post, 'created_at', 'hub_id'),
+    'comments': (Comment, 'created_at', 'post__hub_id'),
+    'votes': (HelpfulVote, 'created_at', ('post__hub_id', 'comment__post__hub_id')),
+    'mentorship_requests': (MentorshipRequest, 'created_at', None),
+}
+
+
+def day_start(day):
+    """Aware datetime for local midnight at the start of day"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _bump_row(metric, day, hub_id, delta):
+    rows = DailyRollup.objects.filter(metric=metric, date=day, hub_id=hub_id)
+    if rows.update(count=F('count') + delta) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            DailyRollup.objects.create(metric=metric, date=day, hub_id=hub_id, count=delta)
+    except IntegrityError:
+        # Another writer created the row first
+        rows.update(count=F('count') + delta)
+
+
+def record(metric, when, hub_id=None, delta=1):
+    """Buffer delta for the platform-wide row for when's local date, and for the hub's row if given"""
+    day = timezone.localdate(when).isoformat()
+    buffers.add('rollup', metric, day, None, delta=delta)
+    if hub_id is not None:
+        buffers.add('rollup', metric, day, hub_id, delta=delta)
+
+
+@buffers.applier('rollup')
+def apply_buffered(deltas):
+    """Write {(metric, day, hub_id): delta} to the rollup rows"""
+    # A hub deleted since the write took its rows with it
+    hub_ids = {hub_id for _, _, hub_id in deltas if hub_id is not None}
+    hubs = set(Hub.objects.filter(pk__in=hub_ids).values_list('pk', flat=True))
+    for (metric, day, hub_id), delta in deltas.items():
+        if hub_id is None or hub_id in hubs:
+            _bump_row(metric, date.fromisoformat(day), hub_id, delta)
+    versions.bump('rollups')
+
+
+def _vote_hub_id(vote):
+    if vote.post_id:
+        return Post.objects.filter(pk=vote.post_id).values_list('hub_id', flat=True).first()
+    return Comment.objects.filter(pk=vote.comment_id).values_list('post__hub_id', flat=True).first()
+
+
+def _hub_id(metric, instance):
+    if metric == 'posts':
+        return instance.hub_id
+    if metric == 'comments':
+        return Post.objects.filter(pk=instance.post_id).values_list('hub_id', flat=True).first()
+    if metric == 'votes':
+        return _vote_hub_id(instance)
+    return None
+
+
+def _make_receivers(metric, model, timestamp_field):
+    def on_save(sender, instance, created, raw=False, **kwargs):
+        if created and not raw:
+            record(metric, getattr(instance, timestamp_field), _hub_id(metric, instance))
+
+    def before_delete(sender, instance, **kwargs):
+        # Cascades remove the parent post before post_delete fires, so look the hub up now
+        instance._rollup_hub_id = _hub_id(metric, instance)
+
+    def on_delete(sender, instance, **kwargs):
+        record(metric, getattr(instance, timestamp_field), getattr(instance, '_rollup_hub_id', None), delta=-1)
+
+    post_save.connect(on_save, sender=model, weak=False, dispatch_uid=f'rollup-save-{metric}')
+    pre_delete.connect(before_delete, sender=model, weak=False, dispatch_uid=f'rollup-pre-delete-{metric}')
+    post_delete.connect(on_delete, sender=model, weak=False, dispatch_uid=f'rollup-delete-{metric}')
+
+
+for _metric, (_model, _field, _) in SOURCES.items():
+    _make_receivers(_metric, _model, _field)
+
+
+def rebuild_days(metric, first_day, last_day):
+    """Recompute metric's rows for first_day..last_day (inclusive) from the source table"""
+    model, timestamp_field, hub_lookup = SOURCES[metric]
+    if isinstance(hub_lookup, tuple):
+        hub_expr = Coalesce(*hub_lookup)
+    elif hub_lookup:
+        hub_expr = F(hub_lookup)
+    else:
+        hub_expr = None
+
+    rows = model.objects.filter(**{
+        f'{timestamp_field}__gte': day_start(first_day),
+        f'{timestamp_field}__lt': day_start(last_day + timedelta(days=1)),
+    }).order_by().annotate(day=TruncDate(timestamp_field, tzinfo=timezone.get_current_timezone()))
+    if hub_expr is not None:
+        grouped = rows.annotate(hub_key=hub_expr).values('day', 'hub_key').annotate(total=Count('pk'))
+    else:
+        grouped = rows.values('day').annotate(total=Count('pk'))
+
+    totals, per_hub = {}, []
+    for row in grouped:
+        totals[row['day']] = totals.get(row['day'], 0) + row['total']
+        if row.get('hub_key') is not None:
+            per_hub.append(DailyRollup(metric=metric, date=row['day'], hub_id=row['hub_key'], count=row['total']))
+
+    with transaction.atomic():
+        DailyRollup.objects.filter(metric=metric, date__gte=first_day, date__lte=last_day).delete()
+        DailyRollup.objects.bulk_create(
+            [DailyRollup(metric=metric, date=day, count=total) for day, total in totals.items()] + per_hub,
+            batch_size=1000,
+        )
+
+
+def earliest_day():
+    """Local date of the oldest row across all rollup sources, or None if there is no data"""
+    firsts = [
+        model.objects.order_by(timestamp_field).values_list(timestamp_field, flat=True).first()
+        for model, timestamp_field, _ in SOURCES.values()
+    ]
+    firsts = [timezone.localdate(value) for value in firsts if value is not None]
+    return min(firsts) if firsts else None
+
+
+def multi_series(metrics, days, hub=None, end=None):
+    """{metric: [{'date', 'count'}]} for the last `days` days up to end (today), zero-filled, in one query"""
+    end = end or timezone.localdate()
+    start = end - timedelta(days=days - 1)
+    counts = {
+        (metric, date): count for metric, date, count in DailyRollup.objects.filter(
+            metric__in=metrics, hub=hub, date__gte=start, date__lte=end
+        ).values_list('metric', 'date', 'count')
+    }
+    dates = [start + timedelta(days=offset) for offset in range(days)]
+    return {
+        metric: [{'date': str(day), 'count': counts.get((metric, day), 0)} for day in dates]
+        for metric in metrics
+    }
@@ -0,0 +1,478 @@
+"""
+Full-text search over post titles, post bodies and comments.
+
+The backend follows the default database unless SEARCH_BACKEND names one:
+
+    SQLite      SQLiteFTS5Backend keeps an FTS5 index (core_search_index) next
+                to the ORM tables and ranks matches with BM25.
+    PostgreSQL  PostgresSearchBackend ranks with ts_rank over the tables
+                themselves, so there is no index to keep.
+    others      DatabaseSearchBackend, an unranked LIKE fallback.
+
+An indexing backend whose table is missing (its migration only runs on
+SQLite) is replaced by the LIKE fallback, with a warning, rather than failing
+every save and delete.
+
+Saved posts and comments are (re)indexed by a background task (core/tasks.py)
+queued in the same transaction as the write; deletes leave the index at once.
+`python manage.py rebuild_search_index` repopulates it from scratch.
+"""
+
+import logging
+import re
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+from django.utils.text import Truncator
+
+from .models import Hub, Post, Comment
+from .pagination import get_page_size
+from .tasks import task
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MARK_START, MARK_END = '\x02', '\x03'
+
+
+@dataclass
+class SearchResult:
+    kind: str          # 'post' or 'comment'
+    post: Post
+    comment: Comment = None
+    snippet: str = ''
+    score: float = 0.0
+
+    @property
+    def author_display(self):
+        """Author name as the reader is allowed to see it (anonymous/pseudonymous aware)"""
+        if self.comment is not None:
+            return self.comment.author.profile.get_display_name()
+        return self.post.get_author_display()
+
+    def as_dict(self):
+        return {
+            'type': self.kind,
+            'post_id': self.post.pk,
+            'comment_id': self.comment.pk if self.comment else None,
+            'title': self.post.title,
+            'hub': self.post.hub.slug,
+            'post_type': self.post.post_type,
+            'author': self.author_display,
+            'snippet': self.snippet,
+            'score': round(self.score, 4),
+        }
+
+
+def _highlight(text):
+    """Escape snippet text and turn the backend's sentinel markers into <mark> tags"""
+    return escape(text).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+def _hydrate(hits):
+    """Turn [(kind, doc_id, snippet, score)] into SearchResults, preserving rank order"""
+    post_ids = [doc_id for kind, doc_id, _, _ in hits if kind == 'post']
+    comment_ids = [doc_id for kind, doc_id, _, _ in hits if kind == 'comment']
+    posts = Post.objects.select_related('author__profile', 'hub').in_bulk(post_ids)
+    comments = Comment.objects.select_related(
+        'author__profile', 'post__author__profile', 'post__hub').in_bulk(comment_ids)
+
+    results = []
+    for kind, doc_id, snippet, score in hits:
+        if kind == 'post' and doc_id in posts:
+            results.append(SearchResult('post', posts[doc_id], snippet=snippet, score=score))
+        elif kind == 'comment' and doc_id in comments:
+            comment = comments[doc_id]
+            results.append(SearchResult('comment', comment.post, comment, snippet, score))
+    return results
+
+
+class BaseSearchBackend:
+    """Interface every search backend implements"""
+    # Whether saves and deletes have an index to update
+    keeps_index = False
+
+    def available(self):
+        """Whether this backend can run against the default database"""
+        return True
+
+    def index_post(self, post):
+        raise NotImplementedError
+
+    def index_comment(self, comment):
+        raise NotImplementedError
+
+    def remove_post(self, post_id):
+        raise NotImplementedError
+
+    def remove_comment(self, comment_id):
+        raise NotImplementedError
+
+    def rebuild(self):
+        """Drop and repopulate the whole index; returns the number of documents"""
+        raise NotImplementedError
+
+    def search(self, query, hub_id=None, post_type=None, offset=0, limit=20):
+        """Return (results, total) for a ranked, filtered page of matches"""
+        raise NotImplementedError
+
+    def post_filter(self, query):
+        """A Q selecting every post whose own title or body matches, unranked and unbounded (for the admin)"""
+        raise NotImplementedError
+
+
+class SQLiteFTS5Backend(BaseSearchBackend):
+    """
+    FTS5 virtual table keyed by rowid = 2 * id (+1 for comments) so updates
+    and deletes are rowid lookups rather than scans of UNINDEXED columns.
+    """
+    table = 'core_search_index'
+    keeps_index = True
+    # BM25 column weights: a hit in a title counts for more than one in a body
+    weights = (10.0, 1.0)
+
+    def available(self):
+        return connection.vendor == 'sqlite' and self.table in connection.introspection.table_names()
+
+    @staticmethod
+    def _rowid(kind, doc_id):
+        return doc_id * 2 + (1 if kind == 'comment' else 0)
+
+    def _upsert(self, cursor, kind, doc_id, post_id, hub_id, post_type, title, body):
+        rowid = self._rowid(kind, doc_id)
+        cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [rowid])
+        cursor.execute(
+            f'INSERT INTO {self.table} (rowid, title, body, doc_type, doc_id, post_id, hub_id, post_type) '
+            f'VALUES (%s, %s, %s, %s, %s, %s, %s, %s)',
+            [rowid, title, body, kind, doc_id, post_id, hub_id, post_type],
+        )
+
+    def index_post(self, post):
+        with connection.cursor() as cursor:
+            self._upsert(cursor, 'post', post.pk, post.pk, post.hub_id, post.post_type, post.title, post.content)
+            # Comments carry their post's hub and type for filtering; keep them in step
+            comment_rowids = [self._rowid('comment', pk) for pk in post.comments.values_list('pk', flat=True)]
+            if comment_rowids:
+                placeholders = ', '.join(['%s'] * len(comment_rowids))
+                cursor.execute(
+                    f'UPDATE {self.table} SET hub_id = %s, post_type = %s WHERE rowid IN ({placeholders})',
+                    [post.hub_id, post.post_type, *comment_rowids],
+                )
+
+    def index_comment(self, comment):
+        post = comment.post
+        with connection.cursor() as cursor:
+            self._upsert(cursor, 'comment', comment.pk, post.pk, post.hub_id, post.post_type, '', comment.content)
+
+    def remove_post(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [self._rowid('post', post_id)])
+
+    def remove_comment(self, comment_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [self._rowid('comment', comment_id)])
+
+    def rebuild(self):
+        post_table, comment_table = Post._meta.db_table, Comment._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f"INSERT INTO {self.table} (rowid, title, body, doc_type, doc_id, post_id, hub_id, post_type) "
+                f"SELECT id * 2, title, content, 'post', id, id, hub_id, post_type FROM {post_table}"
+            )
+            cursor.execute(
+                f"INSERT INTO {self.table} (rowid, title, body, doc_type, doc_id, post_id, hub_id, post_type) "
+                f"SELECT c.id * 2 + 1, '', c.content, 'comment', c.id, c.post_id, p.hub_id, p.post_type "
+                f"FROM {comment_table} c JOIN {post_table} p ON p.id = c.post_id"
+            )
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+            cursor.execute(f'SELECT count(*) FROM {self.table}')
+            return cursor.fetchone()[0]
+
+    @staticmethod
+    def to_match_expression(query):
+        """
+        Quote each word so user input can't inject FTS5 syntax. The last word
+        also matches as a prefix for search-as-you-type; prefix terms skip the
+        porter stemmer, so the stemmed form is OR-ed in as well.
+        """
+        tokens = TOKEN_RE.findall(query)
+        if not tokens:
+            return None
+        quoted = [f'"{token}"' for token in tokens]
+        quoted[-1] = f'({quoted[-1]} OR {quoted[-1]}*)'
+        return ' AND '.join(quoted)
+
+    def search(self, query, hub_id=None, post_type=None, offset=0, limit=20):
+        match = self.to_match_expression(query)
+        if match is None:
+            return [], 0
+
+        where, params = [f'{self.table} MATCH %s'], [match]
+        if hub_id is not None:
+            where.append('hub_id = %s')
+            params.append(hub_id)
+        if post_type:
+            where.append('post_type = %s')
+            params.append(post_type)
+        where_sql = ' AND '.join(where)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {self.table} WHERE {where_sql}', params)
+            total = cursor.fetchone()[0]
+            cursor.execute(
+                f"SELECT doc_type, doc_id, "
+                f"snippet({self.table}, -1, %s, %s, '…', 16), "
+                f"bm25({self.table}, %s, %s) AS rank "
+                f"FROM {self.table} WHERE {where_sql} ORDER BY rank LIMIT %s OFFSET %s",
+                [MARK_START, MARK_END, *self.weights, *params, limit, offset],
+            )
+            # bm25() is lower-is-better; flip the sign so callers see higher-is-better
+            hits = [(kind, int(doc_id), _highlight(snippet), -rank)
+                    for kind, doc_id, snippet, rank in cursor.fetchall()]
+        return _hydrate(hits), total
+
+    def post_filter(self, query):
+        match = self.to_match_expression(query)
+        if match is None:
+            return Q(pk__in=[])
+        return Q(pk__in=RawSQL(f"SELECT doc_id FROM {self.table} WHERE {self.table} MATCH %s AND doc_type = 'post'",
+                               [match]))
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Unranked LIKE-based fallback for databases without a full-text index"""
+
+    def index_post(self, post):
+        pass
+
+    def index_comment(self, comment):
+        pass
+
+    def remove_post(self, post_id):
+        pass
+
+    def remove_comment(self, comment_id):
+        pass
+
+    def rebuild(self):
+        return 0
+
+    def post_filter(self, query):
+        tokens = TOKEN_RE.findall(query)
+        if not tokens:
+            return Q(pk__in=[])
+        condition = Q()
+        for token in tokens:
+            condition &= Q(title__icontains=token) | Q(content__icontains=token)
+        return condition
+
+    def search(self, query, hub_id=None, post_type=None, offset=0, limit=20):
+        if not TOKEN_RE.search(query):
+            return [], 0
+        posts = Post.objects.filter(self.post_filter(query))
+        if hub_id is not None:
+            posts = posts.filter(hub_id=hub_id)
+        if post_type:
+            posts = posts.filter(post_type=post_type)
+        total = posts.count()
+        hits = [('post', pk, _highlight(Truncator(content).words(30)), 0.0)
+                for pk, content in posts.values_list('pk', 'content')[offset:offset + limit]]
+        return _hydrate(hits), total
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    PostgreSQL full-text search straight over the post and comment tables:
+    to_tsquery on the words (the last as a prefix), ts_rank with titles
+    weighted above bodies, ts_headline for the snippets of the page shown.
+    """
+    config = 'english'
+
+    def available(self):
+        return connection.vendor == 'postgresql'
+
+    def index_post(self, post):
+        pass
+
+    def index_comment(self, comment):
+        pass
+
+    def remove_post(self, post_id):
+        pass
+
+    def remove_comment(self, comment_id):
+        pass
+
+    def rebuild(self):
+        return 0
+
+    def to_tsquery(self, query):
+        """Words ANDed together, the last also matching as a prefix (word tokens need no quoting)"""
+        tokens = TOKEN_RE.findall(query)
+        if not tokens:
+            return None
+        return ' & '.join(tokens[:-1] + [f'{tokens[-1]}:*'])
+
+    def _post_vector(self):
+        from django.contrib.postgres.search import SearchVector
+
+        return (SearchVector('title', weight='A', config=self.config)
+                + SearchVector('content', weight='B', config=self.config))
+
+    def post_filter(self, query):
+        from django.contrib.postgres.search import SearchQuery
+
+        terms = self.to_tsquery(query)
+        if terms is None:
+            return Q(pk__in=[])
+        search_query = SearchQuery(terms, config=self.config, search_type='raw')
+        return Q(pk__in=Post.objects.annotate(document=self._post_vector()).filter(document=search_query).values('pk'))
+
+    def search(self, query, hub_id=None, post_type=None, offset=0, limit=20):
+        from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+
+        terms = self.to_tsquery(query)
+        if terms is None:
+            return [], 0
+        search_query = SearchQuery(terms, config=self.config, search_type='raw')
+        post_vector = self._post_vector()
+        comment_vector = SearchVector('content', weight='B', config=self.config)
+
+        posts = Post.objects.annotate(document=post_vector).filter(document=search_query)
+        comments = Comment.objects.annotate(document=comment_vector).filter(document=search_query)
+        if hub_id is not None:
+            posts, comments = posts.filter(hub_id=hub_id), comments.filter(post__hub_id=hub_id)
+        if post_type:
+            posts, comments = posts.filter(post_type=post_type), comments.filter(post__post_type=post_type)
+        total = posts.count() + comments.count()
+
+        ranked = posts.order_by().annotate(kind=Value('post'), rank=SearchRank(post_vector, search_query)) \
+            .values_list('kind', 'pk', 'rank').union(
+                comments.order_by().annotate(kind=Value('comment'), rank=SearchRank(comment_vector, search_query))
+                .values_list('kind', 'pk', 'rank'), all=True,
+            ).order_by('-rank', 'kind', 'pk')[offset:offset + limit]
+        page = list(ranked)
+
+        headline = SearchHeadline('content', search_query, config=self.config,
+                                  start_sel=MARK_START, stop_sel=MARK_END, max_words=30, min_words=15)
+        snippets = {}
+        for model, kind in ((Post, 'post'), (Comment, 'comment')):
+            doc_ids = [pk for hit_kind, pk, _ in page if hit_kind == kind]
+            if doc_ids:
+                rows = model.objects.filter(pk__in=doc_ids).annotate(snippet=headline).values_list('pk', 'snippet')
+                snippets.update(((kind, pk), snippet) for pk, snippet in rows)
+        hits = [(kind, pk, _highlight(snippets.get((kind, pk), '')), rank) for kind, pk, rank in page]
+        return _hydrate(hits), total
+
+
+# Used when SEARCH_BACKEND is empty: the backend for the default database's vendor
+VENDOR_BACKENDS = {
+    'sqlite': 'core.search.SQLiteFTS5Backend',
+    'postgresql': 'core.search.PostgresSearchBackend',
+}
+FALLBACK_BACKEND = 'core.search.DatabaseSearchBackend'
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        path = settings.SEARCH_BACKEND or VENDOR_BACKENDS.get(connection.vendor, FALLBACK_BACKEND)
+        backend = import_string(path)()
+        if not backend.available():
+            logger.warning('Search backend %s is unavailable on this database; using %s', path, FALLBACK_BACKEND)
+            backend = import_string(FALLBACK_BACKEND)()
+        _backend = backend
+    return _backend
+
+
+def search(query, hub_id=None, post_type=None, offset=0, limit=20):
+    return get_backend().search(query, hub_id=hub_id, post_type=post_type, offset=offset, limit=limit)
+
+
+@dataclass
+class SearchPage:
+    query: str
+    results: list
+    total: int
+    page: int
+    page_size: int
+    hub: Hub = None
+    post_type: str = ''
+
+    @property
+    def has_next(self):
+        return self.page * self.page_size < self.total
+
+    @property
+    def has_previous(self):
+        return self.page > 1
+
+
+def search_request(request):
+    """Run the search described by ?q=, ?hub=<slug>, ?type=, ?page= and ?page_size="""
+    query = request.GET.get('q', '').strip()
+    hub = Hub.objects.filter(slug=request.GET.get('hub')).first() if request.GET.get('hub') else None
+    post_type = request.GET.get('type', '')
+    if post_type not in dict(Post.POST_TYPE_CHOICES):
+        post_type = ''
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+    page_size = get_page_size(request, settings.SEARCH_PAGE_SIZE)
+
+    results, total = [], 0
+    if query:
+        results, total = search(query, hub_id=hub.pk if hub else None, post_type=post_type,
+                                offset=(page - 1) * page_size, limit=page_size)
+    return SearchPage(query, results, total, page, page_size, hub, post_type)
+
+
+@task()
+def index_post(post_id):
+    post = Post.objects.filter(pk=post_id).first()
+    if post is not None:
+        get_backend().index_post(post)
+
+
+@task()
+def index_comment(comment_id):
+    comment = Comment.objects.select_related('post').filter(pk=comment_id).first()
+    if comment is not None:
+        get_backend().index_comment(comment)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, raw=False, **kwargs):
+    if not raw and get_backend().keeps_index:
+        index_post.enqueue(post_id=instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    backend = get_backend()
+    if backend.keeps_index:
+        backend.remove_post(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, raw=False, **kwargs):
+    if not raw and get_backend().keeps_index:
+        index_comment.enqueue(comment_id=instance.pk)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    backend = get_backend()
+    if backend.keeps_index:
+        backend.remove_comment(instance.pk)
@@ -0,0 +1,218 @@
+"""
+Platform statistics snapshot shared by the analytics dashboard and the stats API.
+
+The snapshot is computed in a handful of grouped queries and cached. Writes
+that change any of the numbers bump a version key; a stale snapshot keeps being
+served while exactly one worker (whoever wins the refresh lock) recomputes it,
+so several staff dashboards polling at once cost one recompute, not one each.
+With no snapshot at all (a cold cache), the callers that lose the lock wait
+up to STATS_COLD_WAIT seconds for the winner's instead of all computing one.
+"""
+
+import asyncio
+import hashlib
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .async_utils import gather_queries, shared
+from .models import Hub, Post, Comment, UserProfile, MentorshipRequest, Skill
+
+SNAPSHOT_KEY = 'stats:platform:snapshot'
+VERSION_KEY = 'stats:platform:version'
+LOCK_KEY = 'stats:platform:refresh-lock'
+# Seconds between looks at the cache while another caller builds a cold snapshot
+COLD_POLL_INTERVAL = 0.05
+
+
+def _mentorship_counts():
+    status_counts = dict(
+        MentorshipRequest.objects.order_by().values_list('status').annotate(total=Count('id'))
+    )
+    return {status: status_counts.get(status, 0) for status, _ in MentorshipRequest.STATUS_CHOICES}
+
+
+def _top_skills():
+    top_skills = Skill.objects.annotate(
+        user_count=Count('users')
+    ).filter(user_count__gt=0).order_by('-user_count')[:10]
+    return [{'skill': skill.name, 'users': skill.user_count} for skill in top_skills]
+
+
+def _post_types():
+    return list(Post.objects.order_by().values('post_type').annotate(count=Count('id')).order_by('-count'))
+
+
+# Independent queries behind the snapshot, so the async path can run them side by side
+SNAPSHOT_QUERIES = {
+    'total_users': User.objects.count,
+    'total_posts': Post.objects.count,
+    'total_comments': Comment.objects.count,
+    'total_hubs': Hub.objects.count,
+    'total_mentors': lambda: UserProfile.objects.filter(is_mentor=True).count(),
+    'mentorship': _mentorship_counts,
+    'hub_breakdown': lambda: list(Hub.objects.values('name', 'icon', 'member_count', 'post_count')),
+    'post_types': _post_types,
+    'top_skills': _top_skills,
+}
+
+
+def _assemble(results):
+    snapshot = dict(results)
+    snapshot['total_mentorship_requests'] = sum(snapshot['mentorship'].values())
+    snapshot['computed_at'] = timezone.now().isoformat()
+    return snapshot
+
+
+def compute_platform_snapshot():
+    """Run the aggregate queries behind the dashboard and return a JSON-ready dict"""
+    return _assemble((name, query()) for name, query in SNAPSHOT_QUERIES.items())
+
+
+async def acompute_platform_snapshot():
+    """compute_platform_snapshot with the aggregates running concurrently"""
+    values = await gather_queries(*SNAPSHOT_QUERIES.values())
+    return _assemble(zip(SNAPSHOT_QUERIES, values))
+
+
+def current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def bump_version():
+    """Mark the cached snapshot as out of date"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, 1, timeout=None)
+
+
+def _entry(version, data):
+    return {'version': version, 'built': time.time(), 'data': data}
+
+
+def _is_fresh(entry, version):
+    age = time.time() - entry['built']
+    outdated = entry['version'] != version and age >= settings.STATS_MIN_REFRESH
+    return age < settings.STATS_CACHE_TTL and not outdated
+
+
+def get_platform_snapshot():
+    """
+    Return the cached snapshot, recomputing it when it is older than
+    STATS_CACHE_TTL or a write has bumped the version (but not more than once
+    every STATS_MIN_REFRESH seconds). While one caller recomputes, everyone
+    else gets the previous snapshot, or waits for the new one if there is none.
+    """
+    version = current_version()
+    entry = cache.get(SNAPSHOT_KEY)
+    if entry is not None and _is_fresh(entry, version):
+        return entry['data']
+    if not cache.add(LOCK_KEY, 1, timeout=settings.STATS_REFRESH_LOCK_TIMEOUT):
+        if entry is None:
+            entry = _wait_for_snapshot()
+        if entry is not None:
+            return entry['data']
+        # The lock holder is taking too long (or died); don't keep the page waiting
+        return _refresh(version)
+    try:
+        return _refresh(version)
+    finally:
+        cache.delete(LOCK_KEY)
+
+
+def _refresh(version):
+    data = compute_platform_snapshot()
+    cache.set(SNAPSHOT_KEY, _entry(version, data), timeout=settings.STATS_CACHE_MAX_STALE)
+    return data
+
+
+def _wait_for_snapshot():
+    """The snapshot another caller is building, or None if it isn't there within STATS_COLD_WAIT"""
+    deadline = time.monotonic() + settings.STATS_COLD_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(COLD_POLL_INTERVAL)
+        entry = cache.get(SNAPSHOT_KEY)
+        if entry is not None:
+            return entry
+    return None
+
+
+def snapshot_validators(*extra):
+    """
+    (etag, last_modified) for a response built from the cached snapshot, or
+    None when it is missing or due for a refresh (the view rebuilds it then).
+    """
+    entry = cache.get(SNAPSHOT_KEY)
+    if entry is None or not _is_fresh(entry, current_version()):
+        return None
+    tag = '|'.join(map(str, (entry['version'], entry['built'], *extra)))
+    etag = '"%s"' % hashlib.md5(tag.encode(), usedforsecurity=False).hexdigest()
+    return etag, datetime.fromtimestamp(entry['built'], tz=dt_timezone.utc)
+
+
+async def aget_platform_snapshot():
+    """get_platform_snapshot for async views; views in one API batch share a single read"""
+    return await shared('platform_snapshot', _aget_platform_snapshot)
+
+
+async def _aget_platform_snapshot():
+    version = await sync_to_async(current_version)()
+    entry = await cache.aget(SNAPSHOT_KEY)
+    if entry is not None and _is_fresh(entry, version):
+        return entry['data']
+    if not await cache.aadd(LOCK_KEY, 1, timeout=settings.STATS_REFRESH_LOCK_TIMEOUT):
+        if entry is None:
+            entry = await _await_snapshot()
+        if entry is not None:
+            return entry['data']
+        return await _arefresh(version)
+    try:
+        return await _arefresh(version)
+    finally:
+        await cache.adelete(LOCK_KEY)
+
+
+async def _arefresh(version):
+    data = await acompute_platform_snapshot()
+    await cache.aset(SNAPSHOT_KEY, _entry(version, data), timeout=settings.STATS_CACHE_MAX_STALE)
+    return data
+
+
+async def _await_snapshot():
+    deadline = time.monotonic() + settings.STATS_COLD_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(COLD_POLL_INTERVAL)
+        entry = await cache.aget(SNAPSHOT_KEY)
+        if entry is not None:
+            return entry
+    return None
+
+
+def _bump_on_change(sender, **kwargs):
+    if not kwargs.get('raw'):
+        bump_version()
+
+
+for _model in (User, UserProfile, Hub, Post, Comment, MentorshipRequest):
+    post_save.connect(_bump_on_change, sender=_model, dispatch_uid=f'stats-save-{_model.__name__}')
+    post_delete.connect(_bump_on_change, sender=_model, dispatch_uid=f'stats-delete-{_model.__name__}')
+
+
+@receiver(m2m_changed, sender=Hub.members.through)
+@receiver(m2m_changed, sender=UserProfile.skills.through)
+def m2m_changed_bump(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_version()
@@ -0,0 +1,190 @@
+"""
+Background tasks stored in the database.
+
+Functions decorated with @task can be deferred with `func.enqueue(**kwargs)`,
+which inserts a Task row in the caller's transaction: the task exists exactly
+when the write that asked for it commits, and no broker is needed.
+`python manage.py run_worker` claims queued rows (highest priority, then
+oldest run_at), runs them and marks them done. A claim is a lease: the row is
+marked running until TASK_LEASE_SECONDS from now, and a worker that dies
+leaves it to be claimed again when the lease runs out. Tasks can therefore
+run more than once and must be idempotent; keyword arguments must be JSON.
+
+Failures are retried with exponential backoff (TASK_RETRY_DELAY doubled per
+attempt) until max_attempts, then left as 'failed' with the traceback for
+the admin. Periodic tasks are listed in TASK_SCHEDULE; their next due time is
+kept in TaskSchedule so that only one worker enqueues each run.
+
+With TASKS_EAGER on, enqueue() runs the function inline instead, which is
+what the code did before there was a queue. It is on by default unless
+DATABASE_URL is set: a SQLite queue is only seen by processes on the same
+machine, so a worker elsewhere (another Render service) would never run the
+tasks. run_worker and `manage.py check` refuse that setup. With no worker to
+queue the periodic tasks either, each process checks TASK_SCHEDULE after a
+request finishes, at most every TASK_EAGER_SCHEDULE_CHECK seconds, and runs
+the due ones inline.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Task, TaskSchedule
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def task(name=None, priority=0, max_attempts=None):
+    """Register a function as a task; adds func.enqueue(**kwargs) and func.task_name"""
+    def register(func):
+        task_name = name or f'{func.__module__}.{func.__name__}'
+        _registry[task_name] = func
+        func.task_name = task_name
+        func.enqueue = lambda **kwargs: enqueue(task_name, kwargs, priority=priority, max_attempts=max_attempts)
+        return func
+    return register
+
+
+def enqueue(name, kwargs=None, priority=0, delay=None, max_attempts=None):
+    """Queue a registered task to run after delay (a timedelta); returns the Task, or None if run eagerly"""
+    if name not in _registry:
+        raise KeyError(f'Unknown task {name!r}')
+    kwargs = kwargs or {}
+    if settings.TASKS_EAGER:
+        _registry[name](**kwargs)
+        return None
+    return Task.objects.create(
+        name=name, kwargs=kwargs, priority=priority,
+        run_at=timezone.now() + (delay or timedelta()),
+        max_attempts=max_attempts or settings.TASK_MAX_ATTEMPTS,
+    )
+
+
+def queue_is_local():
+    """Whether the queue lives in a SQLite file, which only processes on this machine can see"""
+    return connections[router.db_for_write(Task)].vendor == 'sqlite'
+
+
+def worker_id(index=0):
+    return f'{socket.gethostname()}:{os.getpid()}:{index}'
+
+
+def claim(worker, limit=1):
+    """Lease up to limit due tasks to worker and return them"""
+    now = timezone.now()
+    with transaction.atomic():
+        # Postgres skips rows other workers hold; SQLite's BEGIN IMMEDIATE
+        # (core/backends/sqlite3) serializes the whole claim instead
+        pks = list(
+            Task.objects.select_for_update(skip_locked=True)
+            .filter(status='queued', run_at__lte=now)
+            .order_by('-priority', 'run_at', 'id')
+            .values_list('pk', flat=True)[:limit]
+        )
+        if not pks:
+            return []
+        Task.objects.filter(pk__in=pks).update(
+            status='running', locked_by=worker, attempts=F('attempts') + 1,
+            locked_until=now + timedelta(seconds=settings.TASK_LEASE_SECONDS),
+        )
+    return list(Task.objects.filter(pk__in=pks, locked_by=worker).order_by('-priority', 'run_at', 'id'))
+
+
+def run(claimed):
+    """Run a claimed task and record the outcome; returns True if it succeeded"""
+    func = _registry.get(claimed.name)
+    try:
+        if func is None:
+            raise KeyError(f'Unknown task {claimed.name!r}')
+        func(**claimed.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        retry = func is not None and claimed.attempts < claimed.max_attempts
+        logger.warning('Task %s #%s failed (attempt %d/%d)', claimed.name, claimed.pk,
+                       claimed.attempts, claimed.max_attempts, exc_info=True)
+        changes = {'status': 'queued', 'locked_by': '', 'locked_until': None, 'last_error': error}
+        if retry:
+            changes['run_at'] = timezone.now() + timedelta(
+                seconds=settings.TASK_RETRY_DELAY * 2 ** (claimed.attempts - 1))
+        else:
+            changes.update(status='failed', finished_at=timezone.now())
+        # The lease may have expired and passed to another worker; leave its row alone then
+        Task.objects.filter(pk=claimed.pk, locked_by=claimed.locked_by).update(**changes)
+        return False
+    Task.objects.filter(pk=claimed.pk, locked_by=claimed.locked_by).update(
+        status='done', locked_by='', locked_until=None, finished_at=timezone.now())
+    return True
+
+
+def requeue_expired():
+    """Return tasks whose worker's lease ran out to the queue; returns how many"""
+    return Task.objects.filter(status='running', locked_until__lt=timezone.now()).update(
+        status='queued', locked_by='', locked_until=None)
+
+
+def enqueue_due_periodic():
+    """Queue each TASK_SCHEDULE entry that is due; returns the names queued"""
+    now = timezone.now()
+    schedule = settings.TASK_SCHEDULE
+    TaskSchedule.objects.bulk_create(
+        [TaskSchedule(name=name, next_run_at=now) for name in schedule], ignore_conflicts=True)
+
+    queued = []
+    for entry in TaskSchedule.objects.filter(name__in=list(schedule), next_run_at__lte=now):
+        # Compare-and-set on next_run_at: whichever worker moves it forward enqueues this run
+        won = TaskSchedule.objects.filter(pk=entry.pk, next_run_at=entry.next_run_at).update(
+            next_run_at=now + timedelta(seconds=schedule[entry.name]))
+        if won:
+            enqueue(entry.name)
+            queued.append(entry.name)
+    return queued
+
+
+_eager_lock = threading.Lock()
+_next_eager_check = None
+
+
+@receiver(request_finished)
+def run_due_periodic_eagerly(sender, **kwargs):
+    """With TASKS_EAGER, run the due periodic tasks after a request, as no worker will"""
+    global _next_eager_check
+    interval = settings.TASK_EAGER_SCHEDULE_CHECK
+    # One request per process does the check; the others don't wait for it
+    if not settings.TASKS_EAGER or not interval or not _eager_lock.acquire(blocking=False):
+        return
+    try:
+        now = time.monotonic()
+        if _next_eager_check is None:
+            # Counted from the first request rather than run on it, so short-lived
+            # processes (a benchmark, a test run) don't run the whole schedule
+            _next_eager_check = now + interval
+        if now < _next_eager_check:
+            return
+        _next_eager_check = now + interval
+        try:
+            enqueue_due_periodic()
+        except Exception:
+            logger.exception('Running due periodic tasks failed')
+    finally:
+        _eager_lock.release()
+
+
+@task(priority=-10)
+def purge_finished():
+    """Delete done tasks older than TASK_RETENTION_DAYS; failed ones stay for inspection"""
+    cutoff = timezone.now() - timedelta(days=settings.TASK_RETENTION_DAYS)
+    deleted, _ = Task.objects.filter(status='done', finished_at__lt=cutoff).delete()
+    return deleted
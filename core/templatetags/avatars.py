@@ -0,0 +1,35 @@
+from django import template
+from django.conf import settings
+from django.utils.html import format_html
+
+from core import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def avatar(profile, width, css_class=''):
+    """
+    A profile photo displayed width CSS pixels wide, from the smallest
+    renditions that cover it (WebP where the browser supports it):
+
+        {% avatar mentor 100 'rounded-circle mentor-avatar' %}
+
+    Photos not yet processed by build_avatars fall back to the stored file.
+    """
+    if not profile.profile_image:
+        return ''
+    if not profile.avatar_hash:
+        return format_html('<img src="{}" alt="Profile" class="{}" width="{}" height="{}">',
+                           profile.profile_image.url, css_class, width, width)
+
+    digest = profile.avatar_hash
+    fallback_size = next((size for size in settings.AVATAR_SIZES if size >= width), settings.AVATAR_SIZES[-1])
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}px">'
+        '<img src="{}" srcset="{}" sizes="{}px" alt="Profile" class="{}" width="{}" height="{}" loading="lazy">'
+        '</picture>',
+        images.srcset(digest, 'webp'), width,
+        images.url(images.rendition_name(digest, fallback_size, 'jpeg')), images.srcset(digest, 'jpeg'), width,
+        css_class, width, width,
+    )
@@ -0,0 +1,73 @@
+from django import template
+
+from core import fragments
+
+register = template.Library()
+
+# Stands in for an {% uncached %} block in the cached HTML
+HOLE = '<!--fragment-hole:{}-->'
+
+
+class FragmentNode(template.Node):
+    def __init__(self, nodelist, name, args):
+        self.nodelist = nodelist
+        self.name = name
+        self.args = args
+        self.holes = nodelist.get_nodes_by_type(UncachedNode)
+        for number, hole in enumerate(self.holes):
+            hole.marker = HOLE.format(number)
+
+    def render(self, context):
+        args = [arg.resolve(context) for arg in self.args]
+
+        def render_cached():
+            with context.push(_fragment_holes=True):
+                return self.nodelist.render(context)
+
+        html = fragments.get_or_render(self.name, args, render_cached)
+        for hole in self.holes:
+            html = html.replace(hole.marker, hole.nodelist.render(context))
+        return html
+
+
+class UncachedNode(template.Node):
+    def __init__(self, nodelist):
+        self.nodelist = nodelist
+        self.marker = None
+
+    def render(self, context):
+        if self.marker is not None and context.get('_fragment_holes'):
+            return self.marker
+        return self.nodelist.render(context)
+
+
+@register.tag('fragment')
+def do_fragment(parser, token):
+    """
+    Cache the enclosed block, keyed on the arguments (see core/fragments.py):
+
+        {% fragment 'post_card' post post.get_author_display %} ... {% endfragment %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError("'fragment' tag requires a fragment name")
+    name = bits[1].strip('\'"')
+    if name not in fragments.FRAGMENTS:
+        raise template.TemplateSyntaxError(f"Unknown fragment {name!r}; add it to core.fragments.FRAGMENTS")
+    nodelist = parser.parse(('endfragment',))
+    parser.delete_first_token()
+    return FragmentNode(nodelist, name, [parser.compile_filter(bit) for bit in bits[2:]])
+
+
+@register.tag('uncached')
+def do_uncached(parser, token):
+    """
+    Inside a fragment, render the enclosed block on every request instead of
+    caching it. It sees the context around the fragment, so keep it out of
+    loops inside the fragment:
+
+        {% uncached %}{{ post.created_at|timesince }}{% enduncached %}
+    """
+    nodelist = parser.parse(('enduncached',))
+    parser.delete_first_token()
+    return UncachedNode(nodelist)
@@ -0,0 +1,27 @@
+from urllib.parse import urlencode
+
+from django import template
+from django.conf import settings
+from django.urls import reverse
+
+from core import live
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def event_stream_url(context, kind, pk=None):
+    """
+    The event stream URL for one channel of a page (see core/live.py), to be
+    used inside a script with escapejs:
+
+        {% event_stream_url 'post' post.pk as stream_url %}
+
+    When EVENTS_URL sends the page to another process, the viewer's channels
+    carry their signed token, as their session cookie stays behind.
+    """
+    query = {'channel': kind if pk is None else f'{kind}:{pk}'}
+    user = context['request'].user
+    if settings.EVENTS_URL and kind in live.USER_CHANNELS and user.is_authenticated:
+        query['token'] = live.events_token(user)
+    return f'{settings.EVENTS_URL or reverse("core:event_stream")}?{urlencode(query)}'
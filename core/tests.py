@@ -1,3 +1,1550 @@
-from django.test import TestCase
+import asyncio
+import contextvars
+import csv
+import io
+import json
+import shutil
+import tempfile
+import threading
+from contextlib import aclosing
+from datetime import datetime, timedelta
+from functools import partial
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.template import Context, Template
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    async_utils, buffers, db, events, fragments, images, live, matching, memberships, profiling, ranking, rollups,
+    search, stats, tasks, timeline, voting,
+)
+from .forms import UserProfileForm
+from .models import (
+    Hub, Post, Comment, UserProfile, TimelineEntry, ReputationEvent, ChangeVersion, DailyRollup,
+    RollupCheckpoint, Skill, MentorshipRequest, Task, LiveEvent,
+)
+from .pagination import InvalidCursor, encode_cursor, paginate_keyset
+
+
+def make_user(username, **profile):
+    user = User.objects.create_user(username, first_name=username.title())
+    UserProfile.objects.create(user=user, **profile)
+    return user
+
+
+def make_hub(name):
+    return Hub.objects.create(name=name, description=f'{name} hub')
+
+
+def make_post(hub, author, title='A post', content='Some content', **fields):
+    return Post.objects.create(hub=hub, author=author, title=title, content=content, **fields)
+
+
+class AstraTestCase(TestCase):
+    def setUp(self):
+        # Snapshots, versions and buffers in the cache would leak between tests
+        cache.clear()
+        # A counter buffer without its timer thread, so only the test flushes it
+        patcher = mock.patch.object(buffers, '_buffer', buffers.MemoryCounterBuffer())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class CounterTests(AstraTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user('author')
+        self.other_author = make_user('other')
+        self.hub = make_hub('Careers')
+        self.other_hub = make_hub('Design')
+
+    def counts(self):
+        hubs = dict(Hub.objects.values_list('pk', 'post_count'))
+        profiles = {pk: (posts, comments) for pk, posts, comments in
+                    UserProfile.objects.values_list('user_id', 'post_count', 'comment_count')}
+        return hubs, profiles
+
+    def test_creates_and_deletes_keep_counters_in_step(self):
+        post = make_post(self.hub, self.author)
+        comment = Comment.objects.create(post=post, author=self.other_author, content='Hi')
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.counts(), (
+            {self.hub.pk: 1, self.other_hub.pk: 0},
+            {self.author.pk: (1, 0), self.other_author.pk: (0, 1)},
+        ))
+        comment.delete()
+        post.delete()
+        self.assertEqual(self.counts(), (
+            {self.hub.pk: 0, self.other_hub.pk: 0},
+            {self.author.pk: (0, 0), self.other_author.pk: (0, 0)},
+        ))
+
+    def test_moving_to_another_parent_moves_the_count(self):
+        post = make_post(self.hub, self.author)
+        target = make_post(self.hub, self.author)
+        comment = Comment.objects.create(post=post, author=self.author, content='Hi')
+
+        post.hub, post.author = self.other_hub, self.other_author
+        post.save()
+        comment = Comment.objects.get(pk=comment.pk)
+        comment.post = target
+        comment.save(update_fields=['post'])
+
+        self.assertEqual(self.counts(), (
+            {self.hub.pk: 1, self.other_hub.pk: 1},
+            {self.author.pk: (1, 1), self.other_author.pk: (1, 0)},
+        ))
+        self.assertEqual(dict(Post.objects.values_list('pk', 'comment_count')), {post.pk: 0, target.pk: 1})
+
+    def test_hand_built_instances_are_compared_with_the_stored_row(self):
+        post = make_post(self.hub, self.author)
+        Post(pk=post.pk, hub=self.other_hub, author=self.author, title=post.title, content=post.content,
+             created_at=post.created_at).save()
+        self.assertEqual(self.counts()[0], {self.hub.pk: 0, self.other_hub.pk: 1})
+
+    def test_counters_never_go_negative(self):
+        post = make_post(self.hub, self.author)
+        Hub.objects.update(post_count=0)
+        post.delete()
+        self.assertEqual(Hub.objects.get(pk=self.hub.pk).post_count, 0)
+
+    def test_membership_changes_recount_members(self):
+        self.hub.members.add(self.author, self.other_author)
+        self.author.joined_hubs.add(self.other_hub)
+        self.author.joined_hubs.clear()
+        self.assertEqual(dict(Hub.objects.values_list('pk', 'member_count')), {self.hub.pk: 1, self.other_hub.pk: 0})
+
+    def test_reconcile_counters_repairs_drift(self):
+        make_post(self.hub, self.author)
+        Hub.objects.update(post_count=7, member_count=3)
+        UserProfile.objects.update(post_count=0)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertEqual(self.counts(), (
+            {self.hub.pk: 1, self.other_hub.pk: 0},
+            {self.author.pk: (1, 0), self.other_author.pk: (0, 0)},
+        ))
+        self.assertFalse(Hub.objects.exclude(member_count=0).exists())
+
+
+class KeysetPaginationTests(AstraTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user('author')
+        self.hub = make_hub('Careers')
+        self.posts = [make_post(self.hub, self.author, f'Post {i}') for i in range(7)]
+
+    def test_next_cursors_walk_every_post_once_newest_first(self):
+        seen, cursor = [], None
+        while True:
+            page = paginate_keyset(Post.objects.all(), cursor, page_size=3)
+            seen += [post.pk for post in page]
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        expected = [post.pk for post in sorted(self.posts, key=lambda post: (post.created_at, post.pk), reverse=True)]
+        self.assertEqual(seen, expected)
+
+    def test_prev_cursor_returns_the_previous_page(self):
+        first = paginate_keyset(Post.objects.all(), page_size=3)
+        second = paginate_keyset(Post.objects.all(), first.next_cursor, page_size=3)
+        self.assertTrue(second.has_previous)
+        back = paginate_keyset(Post.objects.all(), second.prev_cursor, page_size=3)
+        self.assertEqual([post.pk for post in back], [post.pk for post in first])
+        self.assertFalse(back.has_previous)
+        self.assertTrue(back.has_next)
+
+    def test_rows_sharing_a_timestamp_are_neither_skipped_nor_repeated(self):
+        Post.objects.update(created_at=timezone.now())
+        seen, cursor = [], None
+        for _ in range(5):
+            page = paginate_keyset(Post.objects.all(), cursor, page_size=2)
+            seen += [post.pk for post in page]
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(sorted(seen), sorted(post.pk for post in self.posts))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_invalid_cursors(self):
+        for cursor in ('not-a-cursor', encode_cursor('sideways', ['2024-01-01T00:00:00+00:00', 1]),
+                       encode_cursor('next', [1]), encode_cursor('next', ['yesterday', 1])):
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                paginate_keyset(Post.objects.all(), cursor, page_size=3)
+
+    def test_hub_page_falls_back_to_the_first_page_on_an_invalid_cursor(self):
+        self.client.force_login(self.author)
+        response = self.client.get(reverse('core:hub_detail', args=[self.hub.slug]), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, self.posts[-1].title)
+
+
+class TimelineTests(AstraTestCase):
+    def setUp(self):
+        super().setUp()
+        self.reader = make_user('reader')
+        self.author = make_user('author')
+        self.joined = make_hub('Joined')
+        self.other = make_hub('Other')
+        self.joined.members.add(self.reader)
+
+    def test_home_page_is_none_until_materialized(self):
+        make_post(self.joined, self.author)
+        self.assertIsNone(timeline.home_page(self.reader))
+
+    def test_materialize_backfills_joined_hubs_only(self):
+        mine = make_post(self.joined, self.author)
+        make_post(self.other, self.author)
+        self.assertTrue(timeline.materialize(self.reader))
+        self.assertFalse(timeline.materialize(self.reader))
+        self.assertEqual([post.pk for post in timeline.home_page(self.reader)], [mine.pk])
+
+    def test_new_posts_fan_out_to_materialized_members(self):
+        make_post(self.joined, self.author, 'Old')
+        timeline.materialize(self.reader)
+        new = make_post(self.joined, self.author, 'New')
+        make_post(self.other, self.author, 'Elsewhere')
+        page = timeline.home_page(self.reader)
+        self.assertEqual(page.items[0].pk, new.pk)
+        self.assertEqual(len(page), 2)
+
+    def test_joining_backfills_and_leaving_trims(self):
+        timeline.materialize(self.reader)
+        elsewhere = make_post(self.other, self.author)
+        self.other.members.add(self.reader)
+        self.assertIn(elsewhere.pk, [post.pk for post in timeline.home_page(self.reader)])
+        self.other.members.remove(self.reader)
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader, hub=self.other).exists())
+
+    def test_moving_a_post_moves_it_between_timelines(self):
+        timeline.materialize(self.reader)
+        post = make_post(self.other, self.author)
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader, post=post).exists())
+        post.hub = self.joined
+        post.save()
+        self.assertTrue(TimelineEntry.objects.filter(user=self.reader, post=post).exists())
+
+    @override_settings(TIMELINE_MAX_ENTRIES=3)
+    def test_timelines_keep_only_the_newest_entries(self):
+        posts = [make_post(self.joined, self.author, f'Post {i}') for i in range(5)]
+        timeline.materialize(self.reader)
+        self.assertEqual(TimelineEntry.objects.filter(user=self.reader).count(), 3)
+        posts.append(make_post(self.joined, self.author, 'Newest'))
+        self.assertEqual(timeline.prune_timelines(), 1)
+        kept = TimelineEntry.objects.filter(user=self.reader).values_list('post_id', flat=True)
+        self.assertEqual(set(kept), {post.pk for post in posts[-3:]})
+
+    def test_home_view_reads_the_timeline(self):
+        post = make_post(self.joined, self.author, 'On the timeline')
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('core:home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, post.title)
+        self.assertTrue(TimelineEntry.objects.filter(user=self.reader, post=post).exists())
+
+
+class VoteTests(AstraTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user('author')
+        self.voter = make_user('voter')
+        self.post = make_post(make_hub('Careers'), self.author)
+
+    def state(self):
+        return (
+            Post.objects.get(pk=self.post.pk).helpful_count,
+            UserProfile.objects.get(user=self.author).reputation_score,
+            ReputationEvent.objects.filter(kind='post_vote').count(),
+            ChangeVersion.objects.filter(key=f'post:{self.post.pk}').values_list('version', flat=True).first(),
+        )
+
+    def vote(self, func, user=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return func(user or self.voter, post=self.post)
+
+    def test_votes_are_idempotent(self):
+        self.assertTrue(self.vote(voting.cast_vote))
+        self.assertFalse(self.vote(voting.cast_vote))
+        helpful, reputation, events, _ = self.state()
+        self.assertEqual((helpful, reputation, events), (1, 2 + 5, 1))
+        self.assertTrue(self.vote(voting.retract_vote))
+        self.assertFalse(self.vote(voting.retract_vote))
+        self.assertEqual(self.state()[:3], (0, 2, 2))
+
+    def test_voting_on_your_own_post_earns_nothing(self):
+        self.vote(voting.cast_vote, self.author)
+        self.assertEqual(self.state()[:3], (1, 2, 0))
+
+    @override_settings(VOTE_WRITE_BEHIND=True)
+    def test_write_behind_votes_only_insert_the_vote_row(self):
+        buffers.flush_counters()
+        before = self.state()
+        with CaptureQueriesContext(connection) as queries:
+            self.vote(voting.cast_vote)
+        self.assertEqual(self.state(), before)
+        written = {query['sql'].split()[0] + ' ' + query['sql'].split()[2] for query in queries
+                   if query['sql'].startswith(('INSERT', 'UPDATE'))}
+        self.assertEqual(written, {'INSERT "core_helpfulvote"'})
+
+        # helpful_count, reputation, and the platform and hub 'votes' rollups
+        self.assertEqual(buffers.flush_counters(), 4)
+        helpful, reputation, events, version = self.state()
+        self.assertEqual((helpful, reputation, events), (1, 2 + 5, 1))
+        self.assertNotEqual(version, before[3])
+        self.assertEqual(DailyRollup.objects.filter(metric='votes', hub=None).get().count, 1)
+        event = ReputationEvent.objects.get(kind='post_vote')
+        self.assertEqual((event.actor_id, event.post_id), (self.voter.pk, self.post.pk))
+
+    @override_settings(VOTE_WRITE_BEHIND=True)
+    def test_write_behind_nets_out_a_burst(self):
+        voters = [make_user(f'voter{i}') for i in range(3)]
+        for voter in voters:
+            self.vote(voting.cast_vote, voter)
+        self.vote(voting.retract_vote, voters[0])
+        buffers.flush_counters()
+        self.assertEqual(self.state()[:3], (2, 2 + 2 * 5, 2))
+
+    @override_settings(VOTE_WRITE_BEHIND=True)
+    def test_write_behind_keeps_the_events_of_deleted_targets(self):
+        self.vote(voting.cast_vote)
+        Post.objects.filter(pk=self.post.pk).delete()
+        buffers.flush_counters()
+        self.assertIsNone(ReputationEvent.objects.get(kind='post_vote').post_id)
+        self.assertEqual(UserProfile.objects.get(user=self.author).reputation_score, 2 + 5)
+
+    @override_settings(VOTE_WRITE_BEHIND=True, COUNTER_FLUSH_THRESHOLD=2)
+    def test_memory_buffer_flushes_at_the_threshold(self):
+        self.vote(voting.cast_vote)
+        self.assertEqual(self.state()[:3], (1, 2 + 5, 1))
+
+    @override_settings(VOTE_WRITE_BEHIND=True)
+    def test_a_failed_flush_keeps_its_deltas(self):
+        self.vote(voting.cast_vote)
+        with mock.patch.dict(buffers._appliers, {'reputation': mock.Mock(side_effect=RuntimeError)}):
+            with self.assertRaises(RuntimeError):
+                buffers.flush_counters()
+        self.assertEqual(self.state()[0], 0)
+        buffers.flush_counters()
+        self.assertEqual(self.state()[:3], (1, 2 + 5, 1))
+
+
+@override_settings(COUNTER_BUFFER_BACKEND='cache')
+class CacheCounterBufferTests(AstraTestCase):
+    def setUp(self):
+        super().setUp()
+        self.buffer = buffers.CacheCounterBuffer()
+        # Hold off the flush that the first write of an interval triggers
+        cache.set(self.buffer.due_key, 1, 60)
+        self.applied = []
+        patcher = mock.patch.dict(buffers._appliers, {'test': self.applied.append})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_deltas_are_summed_per_key(self):
+        for key, delta in [(('test', 'a', 1), 1), (('test', 'a', 1), 1), (('test', 'b', 2), -1)]:
+            self.buffer.add(key, delta)
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(self.applied, [{('a', 1): 2, ('b', 2): -1}])
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_keys_are_listed_again_after_a_flush(self):
+        self.buffer.add(('test', 'a', 1), 1)
+        self.buffer.flush()
+        self.buffer.add(('test', 'a', 1), 3)
+        self.buffer.flush()
+        self.assertEqual(self.applied, [{('a', 1): 1}, {('a', 1): 3}])
+
+    def test_a_failed_flush_leaves_the_deltas_for_the_next(self):
+        self.buffer.add(('test', 'a', 1), 1)
+        with mock.patch.dict(buffers._appliers, {'test': mock.Mock(side_effect=RuntimeError)}):
+            with self.assertRaises(RuntimeError):
+                self.buffer.flush()
+        self.buffer.add(('test', 'a', 1), 1)
+        self.buffer.flush()
+        self.assertEqual(self.applied, [{('a', 1): 2}])
+
+
+class SearchTests(AstraTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user('author')
+        self.hub = make_hub('Engineering')
+        self.in_title = make_post(self.hub, self.author, 'Learning Python', 'Where should I start?')
+        self.in_body = make_post(self.hub, self.author, 'Languages', 'I mostly write python at work.')
+        self.unrelated = make_post(self.hub, self.author, 'Negotiating salary', 'Any tips?')
+
+    def result_ids(self, query, **filters):
+        results, total = search.search(query, **filters)
+        return [(result.kind, result.post.pk) for result in results], total
+
+    def test_title_hits_rank_above_body_hits(self):
+        ids, total = self.result_ids('python')
+        self.assertEqual(total, 2)
+        self.assertEqual(ids, [('post', self.in_title.pk), ('post', self.in_body.pk)])
+
+    def test_last_word_matches_as_a_prefix(self):
+        ids, _ = self.result_ids('pyth')
+        self.assertEqual({post_id for _, post_id in ids}, {self.in_title.pk, self.in_body.pk})
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.result_ids('python" OR "salary'), self.result_ids('python salary'))
+
+    def test_comments_are_found_and_point_at_their_post(self):
+        comment = Comment.objects.create(post=self.unrelated, author=self.author, content='Ask for equity too')
+        results, _ = search.search('equity')
+        self.assertEqual([(result.kind, result.comment.pk, result.post.pk) for result in results],
+                         [('comment', comment.pk, self.unrelated.pk)])
+
+    def test_edits_reindex(self):
+        self.unrelated.title = 'Python salaries'
+        self.unrelated.save()
+        ids, _ = self.result_ids('salaries')
+        self.assertEqual(ids, [('post', self.unrelated.pk)])
+
+    def test_deletes_leave_the_index(self):
+        comment = Comment.objects.create(post=self.unrelated, author=self.author, content='python too')
+        self.in_title.delete()
+        comment.delete()
+        ids, total = self.result_ids('python')
+        self.assertEqual((ids, total), ([('post', self.in_body.pk)], 1))
+
+    def test_filters_by_hub_and_type(self):
+        other = make_hub('Design')
+        make_post(other, self.author, 'Python for designers', post_type='resource')
+        _, in_hub = self.result_ids('python', hub_id=self.hub.pk)
+        _, resources = self.result_ids('python', post_type='resource')
+        self.assertEqual((in_hub, resources), (2, 1))
+
+    def test_post_filter_matches_posts_only_without_a_cap(self):
+        Comment.objects.create(post=self.unrelated, author=self.author, content='python everywhere')
+        matches = Post.objects.filter(search.get_backend().post_filter('python'))
+        self.assertEqual(set(matches.values_list('pk', flat=True)), {self.in_title.pk, self.in_body.pk})
+        self.assertFalse(Post.objects.filter(search.get_backend().post_filter('!!')).exists())
+
+    def test_admin_search_uses_the_index(self):
+        admin = User.objects.create_superuser('admin')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:core_post_changelist'), {'q': 'python'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+class PlatformStatsTests(AstraTestCase):
+    def setUp(self):
+        super().setUp()
+        make_post(make_hub('Careers'), make_user('author'))
+
+    def test_snapshot_is_served_from_the_cache(self):
+        first = stats.get_platform_snapshot()
+        self.assertEqual((first['total_posts'], first['total_users'], first['total_hubs']), (1, 1, 1))
+        self.assertIsNone(cache.get(stats.LOCK_KEY))
+        with self.assertNumQueries(0):
+            self.assertEqual(stats.get_platform_snapshot(), first)
+
+    @override_settings(STATS_MIN_REFRESH=0)
+    def test_writes_refresh_the_snapshot(self):
+        stats.get_platform_snapshot()
+        make_post(Hub.objects.get(), User.objects.get())
+        self.assertEqual(stats.get_platform_snapshot()['total_posts'], 2)
+
+    @override_settings(STATS_MIN_REFRESH=60)
+    def test_writes_refresh_at_most_every_min_refresh(self):
+        stats.get_platform_snapshot()
+        make_post(Hub.objects.get(), User.objects.get())
+        self.assertEqual(stats.get_platform_snapshot()['total_posts'], 1)
+
+    @override_settings(STATS_MIN_REFRESH=0)
+    def test_stale_snapshot_is_served_while_another_caller_refreshes(self):
+        stats.get_platform_snapshot()
+        make_post(Hub.objects.get(), User.objects.get())
+        cache.add(stats.LOCK_KEY, 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(stats.get_platform_snapshot()['total_posts'], 1)
+
+    @override_settings(STATS_COLD_WAIT=5)
+    def test_cold_callers_wait_for_the_lock_holder(self):
+        cache.add(stats.LOCK_KEY, 1)
+        entry = stats._entry(stats.current_version(), {'total_posts': 42})
+        holder = threading.Timer(0.1, cache.set, [stats.SNAPSHOT_KEY, entry])
+        holder.start()
+        self.addCleanup(holder.cancel)
+        with self.assertNumQueries(0):
+            self.assertEqual(stats.get_platform_snapshot(), {'total_posts': 42})
+
+    @override_settings(STATS_COLD_WAIT=0)
+    def test_cold_callers_compute_their_own_when_the_holder_is_gone(self):
+        cache.add(stats.LOCK_KEY, 1)
+        self.assertEqual(stats.get_platform_snapshot()['total_posts'], 1)
+
+
+class RollupTests(AstraTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = self.write(make_user, 'author')
+        self.hub = make_hub('Careers')
+        self.today = timezone.localdate()
+
+    def rows(self, metric):
+        return dict(DailyRollup.objects.filter(metric=metric).values_list('hub_id', 'count'))
+
+    def write(self, func, *args, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return func(*args, **kwargs)
+
+    def test_writes_are_buffered_until_a_flush(self):
+        post = self.write(make_post, self.hub, self.author)
+        self.write(Comment.objects.create, post=post, author=self.author, content='Hi')
+        self.assertFalse(DailyRollup.objects.exists())
+        self.assertFalse(ChangeVersion.objects.filter(key='rollups').exists())
+
+        buffers.flush_counters()
+        self.assertEqual(self.rows('posts'), {None: 1, self.hub.pk: 1})
+        self.assertEqual(self.rows('comments'), {None: 1, self.hub.pk: 1})
+        self.assertEqual(ChangeVersion.objects.get(key='rollups').version, 1)
+
+    def test_deletes_subtract_and_a_burst_nets_out(self):
+        kept = self.write(make_post, self.hub, self.author)
+        buffers.flush_counters()
+        self.write(kept.delete)
+        for _ in range(3):
+            self.write(make_post, self.hub, self.author)
+        buffers.flush_counters()
+        self.assertEqual(self.rows('posts'), {None: 3, self.hub.pk: 3})
+
+    def test_deltas_for_a_deleted_hub_are_dropped(self):
+        other = make_hub('Design')
+        self.write(make_post, other, self.author)
+        other.delete()
+        buffers.flush_counters()
+        self.assertEqual(self.rows('posts'), {None: 1})
+
+    def test_flushed_rows_match_a_rebuild(self):
+        for _ in range(2):
+            post = self.write(make_post, self.hub, self.author)
+            self.write(Comment.objects.create, post=post, author=self.author, content='Hi')
+        buffers.flush_counters()
+        flushed = {metric: self.rows(metric) for metric in rollups.SOURCES}
+        for metric in rollups.SOURCES:
+            rollups.rebuild_days(metric, self.today, self.today)
+        self.assertEqual({metric: self.rows(metric) for metric in rollups.SOURCES}, flushed)
+
+    def test_multi_series_is_zero_filled(self):
+        self.write(make_post, self.hub, self.author)
+        buffers.flush_counters()
+        series = rollups.multi_series(['posts', 'comments'], 3)
+        self.assertEqual([point['count'] for point in series['posts']], [0, 0, 1])
+        self.assertEqual(series['posts'][-1]['date'], str(self.today))
+        self.assertEqual([point['count'] for point in series['comments']], [0, 0, 0])
+
+    def test_backfill_resumes_from_its_checkpoint(self):
+        posts = [make_post(self.hub, self.author, f'Post {i}') for i in range(4)]
+        for days_ago, post in enumerate(posts):
+            Post.objects.filter(pk=post.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        call_command('backfill_rollups', chunk_days=2, stdout=StringIO())
+        self.assertEqual(RollupCheckpoint.objects.get().last_date, self.today)
+        platform = DailyRollup.objects.filter(metric='posts', hub=None)
+        self.assertEqual(sorted(platform.values_list('count', flat=True)), [1, 1, 1, 1])
+
+        # Resuming redoes the checkpoint day onwards and leaves earlier days alone
+        platform.update(count=9)
+        RollupCheckpoint.objects.update(last_date=self.today - timedelta(days=1))
+        call_command('backfill_rollups', stdout=StringIO())
+        counts = dict(platform.values_list('date', 'count'))
+        self.assertEqual(counts, {
+            self.today - timedelta(days=3): 9, self.today - timedelta(days=2): 9,
+            self.today - timedelta(days=1): 1, self.today: 1,
+        })
+
+        call_command('backfill_rollups', restart=True, stdout=StringIO())
+        self.assertEqual(sorted(platform.values_list('count', flat=True)), [1, 1, 1, 1])
+
+
+class ExportTests(AstraTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user('author')
+        self.hub = make_hub('Careers')
+        self.posts = [make_post(self.hub, self.author, f'Post {i}') for i in range(3)]
+
+    def download(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_portfolio_is_streamed_as_csv(self):
+        self.client.force_login(self.author)
+        response, body = self.download(reverse('core:export_portfolio', args=['author']))
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="author_portfolio.csv"')
+        rows = list(csv.reader(body.splitlines()))
+        self.assertEqual(rows[0], ['Type', 'Title', 'Hub', 'Date', 'Helpful Count', 'Comments'])
+        self.assertEqual(sorted(row[1] for row in rows[1:]), ['Post 0', 'Post 1', 'Post 2'])
+
+    def test_only_your_own_portfolio(self):
+        make_user('other')
+        self.client.force_login(self.author)
+        self.assertEqual(self.client.get(reverse('core:export_portfolio', args=['other'])).status_code, 302)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        staff = User.objects.create_user('staff', is_staff=True)
+        self.client.force_login(staff)
+        url = reverse('core:bulk_export', args=['posts', 'csv'])
+        with CaptureQueriesContext(connection) as few:
+            self.download(url)
+        for i in range(20):
+            make_post(self.hub, self.author, f'More {i}')
+        with CaptureQueriesContext(connection) as many:
+            self.download(url)
+        self.assertEqual(len(many), len(few))
+
+    @override_settings(EXPORT_CHUNK_BYTES=50)
+    def test_bulk_export_as_ndjson_in_chunks(self):
+        staff = User.objects.create_user('staff', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('core:bulk_export', args=['posts', 'ndjson']))
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 1)
+        rows = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], sorted(post.pk for post in self.posts))
+        self.assertEqual(rows[0]['hub'], self.hub.slug)
+
+    def test_bulk_export_is_staff_only_and_checks_its_arguments(self):
+        self.client.force_login(self.author)
+        self.assertEqual(self.client.get(reverse('core:bulk_export', args=['posts', 'csv'])).status_code, 302)
+        self.author.is_staff = True
+        self.author.save()
+        self.assertEqual(self.client.get(reverse('core:bulk_export', args=['users', 'csv'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('core:bulk_export', args=['posts', 'xml'])).status_code, 404)
+
+
+class MatchingTests(AstraTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(matching, '_index', matching.MentorIndex())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.python = Skill.objects.create(name='Python')
+        self.hub = make_hub('Careers')
+        self.mentee = make_user('mentee', location='Lagos')
+        self.mentee.profile.skills.add(self.python)
+        self.hub.members.add(self.mentee)
+
+        self.skilled = make_user('skilled', is_mentor=True)
+        self.skilled.profile.skills.add(self.python)
+        self.member = make_user('member', is_mentor=True)
+        self.hub.members.add(self.member)
+        self.local = make_user('local', is_mentor=True, location=' lagos')
+        self.unrelated = make_user('unrelated', is_mentor=True)
+
+    def ranking(self, user=None, **kwargs):
+        return [match.user_id for match in matching.top_matches(user or self.mentee, **kwargs)]
+
+    def write(self, func, *args, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return func(*args, **kwargs)
+
+    def test_mentors_are_ranked_on_what_they_share(self):
+        self.assertEqual(self.ranking(), [self.skilled.pk, self.member.pk, self.local.pk, self.unrelated.pk])
+        self.assertEqual(self.ranking(k=2, offset=1), [self.member.pk, self.local.pk])
+        self.assertNotIn(self.skilled.pk, self.ranking(self.skilled))
+
+    def test_open_requests_count_against_a_mentor(self):
+        self.ranking()
+        self.write(MentorshipRequest.objects.create, mentee=self.mentee, mentor=self.local, topic='CV', message='Hi')
+        self.write(MentorshipRequest.objects.create, mentee=self.mentee, mentor=self.local, topic='Jobs', message='Hi')
+        self.assertEqual(self.ranking()[-2:], [self.unrelated.pk, self.local.pk])
+
+    def test_profile_changes_reach_the_index_after_commit(self):
+        index = matching.get_index()
+        profile = self.unrelated.profile
+        profile.location = 'Accra'
+        self.write(profile.save)
+        self.assertEqual(index.candidates(location='accra'), {self.unrelated.pk})
+        profile.is_mentor = False
+        self.write(profile.save)
+        self.assertNotIn(self.unrelated.pk, matching.get_index().mentors)
+
+    def catch_up(self):
+        """Change a mentor here and return how another process's index catches up"""
+        other = matching.MentorIndex()
+        other.rebuild()
+        profile = self.unrelated.profile
+        profile.location = 'Accra'
+        self.write(profile.save)
+        self.assertEqual(ChangeVersion.objects.get(key=matching.VERSION_KEY).version, other.version + 1)
+        with mock.patch.object(other, 'rebuild', wraps=other.rebuild) as rebuild:
+            other.ensure_current()
+        self.assertEqual(other.candidates(location='accra'), {self.unrelated.pk})
+        self.assertEqual(other.version, matching.current_version())
+        return rebuild.called
+
+    @override_settings(MATCHING_CHANGES_TTL=0)
+    def test_other_processes_rebuild_without_a_shared_cache(self):
+        self.assertTrue(self.catch_up())
+
+    @override_settings(MATCHING_CHANGES_TTL=60)
+    def test_other_processes_reload_just_the_changed_mentors_with_a_shared_cache(self):
+        self.assertFalse(self.catch_up())
+
+    def test_mentor_page_filters_by_skill(self):
+        self.client.force_login(self.mentee)
+        response = self.client.get(reverse('core:mentor_list'), {'skill': self.python.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([mentor.user_id for mentor in response.context['mentors']], [self.skilled.pk])
+        self.assertEqual(response.context['page'].total, 1)
+
+
+class GatherQueriesTests(AstraTestCase):
+    @staticmethod
+    def probe(value):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT %s', [value])
+            return cursor.fetchone()[0], connection.connection
+
+    def test_results_come_back_in_order(self):
+        results = async_to_sync(async_utils.gather_queries)(*[partial(self.probe, i) for i in range(6)])
+        self.assertEqual([value for value, _ in results], list(range(6)))
+
+    def test_pool_threads_keep_their_connections(self):
+        connections_used = []
+        for _ in range(3):
+            results = async_to_sync(async_utils.gather_queries)(*[partial(self.probe, i) for i in range(6)])
+            connections_used += [raw for _, raw in results]
+        self.assertLessEqual(len({id(raw) for raw in connections_used}), settings.GATHER_QUERY_THREADS)
+
+
+class ConditionalGetTests(AstraTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user('author')
+        self.hub = make_hub('Careers')
+        self.post = make_post(self.hub, self.author)
+        self.url = reverse('core:post_detail', args=[self.post.pk])
+
+    def test_unchanged_post_page_is_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_comments_and_votes_change_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        Comment.objects.create(post=self.post, author=self.author, content='A new comment')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        voting.cast_vote(make_user('voter'), post=self.post)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @override_settings(VOTE_WRITE_BEHIND=True)
+    def test_buffered_votes_change_the_etag_when_flushed(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            voting.cast_vote(make_user('voter'), post=self.post)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        buffers.flush_counters()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_differs_per_user(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.force_login(self.author)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class FragmentCacheTests(AstraTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user('author')
+        self.post = make_post(make_hub('Careers'), self.author)
+
+    def test_post_keys_follow_its_counters(self):
+        key, timeout = fragments.make_key('post_card', [self.post])
+        self.assertEqual((key, timeout), (fragments.make_key('post_card', [self.post])[0], settings.FRAGMENT_CACHE_TTL))
+        self.post.comment_count += 1
+        self.assertNotEqual(key, fragments.make_key('post_card', [self.post])[0])
+
+    def counting_render(self):
+        renders = []
+
+        def render():
+            renders.append(1)
+            return f'<p>{len(renders)}</p>'
+        return render
+
+    @override_settings(FRAGMENT_PROFILE_CACHE_TTL=60)
+    def test_cached_fragments_are_reused_until_invalidated(self):
+        profile = self.author.profile
+        render = self.counting_render()
+        self.assertEqual(fragments.get_or_render('profile_sidebar', [profile], render), '<p>1</p>')
+        self.assertEqual(fragments.get_or_render('profile_sidebar', [profile], render), '<p>1</p>')
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.bio = 'Changed'
+            profile.save()
+        self.assertEqual(fragments.get_or_render('profile_sidebar', [profile], render), '<p>2</p>')
+
+    @override_settings(FRAGMENT_PROFILE_CACHE_TTL=0)
+    def test_profile_fragments_are_not_cached_without_a_shared_cache(self):
+        render = self.counting_render()
+        fragments.get_or_render('profile_sidebar', [self.author.profile], render)
+        self.assertEqual(fragments.get_or_render('profile_sidebar', [self.author.profile], render), '<p>2</p>')
+
+    def test_uncached_blocks_are_rendered_every_time(self):
+        template = Template(
+            "{% load fragment_cache %}{% fragment 'post_card' post %}<b>{{ title }}</b> "
+            "<i>{% uncached %}{{ when }}{% enduncached %}</i>{% endfragment %}"
+        )
+        first = template.render(Context({'post': self.post, 'title': 'A', 'when': '1 minute'}))
+        second = template.render(Context({'post': self.post, 'title': 'B', 'when': '2 minutes'}))
+        self.assertEqual((first, second), ('<b>A</b> <i>1 minute</i>', '<b>A</b> <i>2 minutes</i>'))
+
+    def test_stats_count_hits_and_misses(self):
+        for _ in range(3):
+            fragments.get_or_render('post_card', [self.post], lambda: '<p>card</p>')
+        card = next(stat for stat in fragments.stats() if stat.name == 'post_card')
+        self.assertEqual((card.hits, card.misses, card.bytes_served), (2, 1, 2 * len('<p>card</p>')))
+
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReadRoutingTests(AstraTestCase):
+    router = db.PrimaryReplicaRouter()
+
+    def serve(self, url, method='get', cookies=None, write=False):
+        """Run url through the routing middleware; returns (read aliases, response)"""
+        request = getattr(RequestFactory(), method)(url)
+        request.COOKIES.update(cookies or {})
+        middleware = db.DatabaseRoutingMiddleware(lambda request: HttpResponse())
+
+        def run():
+            middleware.process_request(request)
+            request.resolver_match = resolve(url)
+            middleware.process_view(request, None, (), {})
+            reads = [self.router.db_for_read(Post)]
+            if write:
+                self.router.db_for_write(Post)
+                reads.append(self.router.db_for_read(Post))
+            return reads, middleware.process_response(request, HttpResponse())
+        # Each request gets its own routing state, as it would under a server
+        return contextvars.copy_context().run(run)
+
+    def test_listed_routes_read_from_a_replica(self):
+        reads, response = self.serve(reverse('api:hubs_json'))
+        self.assertEqual(reads, ['replica1'])
+        self.assertNotIn(settings.DATABASE_PIN_COOKIE, response.cookies)
+        self.assertEqual(self.serve(reverse('core:home'))[0], ['default'])
+
+    def test_writes_pin_the_request_and_set_the_cookie(self):
+        reads, response = self.serve(reverse('api:hubs_json'), write=True)
+        self.assertEqual(reads, ['replica1', 'default'])
+        self.assertEqual(response.cookies[settings.DATABASE_PIN_COOKIE]['max-age'], settings.DATABASE_PIN_SECONDS)
+        _, response = self.serve(reverse('api:hubs_json'), method='post')
+        self.assertIn(settings.DATABASE_PIN_COOKIE, response.cookies)
+
+    def test_recent_writers_read_the_primary(self):
+        reads, _ = self.serve(reverse('api:hubs_json'), cookies={settings.DATABASE_PIN_COOKIE: '1'})
+        self.assertEqual(reads, ['default'])
+
+    def test_everything_reads_the_primary_without_replicas_or_outside_requests(self):
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+        with self.settings(DATABASE_REPLICAS=[]):
+            reads, response = self.serve(reverse('api:hubs_json'), write=True)
+        self.assertEqual(reads, ['default', 'default'])
+        self.assertNotIn(settings.DATABASE_PIN_COOKIE, response.cookies)
+
+
+class QueryPlanAuditTests(AstraTestCase):
+    def audit(self, *args, **options):
+        out = StringIO()
+        call_command('audit_query_plans', *args, stdout=out, **options)
+        return out.getvalue()
+
+    def test_hot_queries_use_indexes(self):
+        # The planner needs statistics from more than an empty table to prefer
+        # walking the ordering indexes over a range scan and a sort
+        authors = [make_user(f'author{i}') for i in range(20)]
+        hubs = [make_hub(f'Hub {i}') for i in range(5)]
+        now = timezone.now()
+        Post.objects.bulk_create(
+            Post(hub=hubs[i % 5], author=authors[i % 20], title=f'Post {i}', content='Content',
+                 created_at=now - timedelta(hours=i))
+            for i in range(500)
+        )
+        self.assertIn('query plans use indexes', self.audit(analyze=True))
+
+    def test_a_scan_or_sort_fails_the_audit(self):
+        unindexed = {'posts by title': lambda: Post.objects.order_by('title')}
+        with mock.patch.dict('core.management.commands.audit_query_plans.HOT_QUERIES', unindexed):
+            with self.assertRaisesMessage(CommandError, 'posts by title'):
+                self.audit(queries=['posts by title'])
+
+    def test_unknown_query_names(self):
+        with self.assertRaisesMessage(CommandError, 'Unknown queries: nope'):
+            self.audit(queries=['nope'])
+
+
+class SQLProfilerTests(AstraTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(profiling.clear)
+        self.post = make_post(make_hub('Careers'), make_user('author'))
+
+    @staticmethod
+    def middleware(get_response):
+        return profiling.SQLProfilerMiddleware(get_response)
+
+    def loop(self, request):
+        # The N+1 shape: one query per row
+        for pk in range(settings.SQL_PROFILER_REPEAT_THRESHOLD):
+            list(Post.objects.filter(pk=pk))
+        return HttpResponse()
+
+    def test_normalize_collapses_literals_and_in_lists(self):
+        self.assertEqual(
+            profiling.normalize("SELECT * FROM t WHERE a = 'x''y' AND b IN (%s, %s,  %s) AND c > 1.5"),
+            'SELECT * FROM t WHERE a = ? AND b IN (...) AND c > ?',
+        )
+
+    @override_settings(SQL_PROFILER_SAMPLE_RATE=1)
+    def test_sampled_requests_get_server_timing(self):
+        response = self.client.get(reverse('core:post_detail', args=[self.post.pk]))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", total;dur=[\d.]+$')
+
+    @override_settings(SQL_PROFILER_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_left_alone(self):
+        response = self.client.get(reverse('core:post_detail', args=[self.post.pk]))
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(SQL_PROFILER_SAMPLE_RATE=1, SQL_PROFILER_SLOW_MS=10 ** 6)
+    def test_repeated_shapes_are_kept_and_logged(self):
+        request = RequestFactory().get('/loop/?page=2')
+        with self.assertLogs('core.profiling', 'WARNING') as logs:
+            response = self.middleware(self.loop)(request)
+        self.assertIn('repeat;desc="1 repeated query shapes"', response['Server-Timing'])
+        [profile] = profiling.slow_requests()
+        self.assertEqual((profile.path, profile.queries), ('/loop/?page=2', settings.SQL_PROFILER_REPEAT_THRESHOLD))
+        [(shape, times)] = profile.repeated
+        self.assertIn('WHERE "core_post"."id" = %s', shape)
+        self.assertEqual(times, settings.SQL_PROFILER_REPEAT_THRESHOLD)
+        self.assertIn(f'Query ran {times} times in GET /loop/', logs.output[0])
+
+    @override_settings(SQL_PROFILER_SAMPLE_RATE=1, SQL_PROFILER_SLOW_MS=10 ** 6)
+    def test_fast_requests_without_repeats_are_not_kept(self):
+        self.middleware(lambda request: HttpResponse(Post.objects.count()))(RequestFactory().get('/'))
+        self.assertEqual(profiling.slow_requests(), [])
+
+    @override_settings(SQL_PROFILER_SAMPLE_RATE=1)
+    def test_recorder_follows_async_views_into_gathered_queries(self):
+        async def view(request):
+            await async_utils.gather_queries(*[partial(GatherQueriesTests.probe, i) for i in range(3)])
+            return HttpResponse()
+
+        response = async_to_sync(self.middleware(view))(RequestFactory().get('/'))
+        self.assertIn('desc="3 queries"', response['Server-Timing'])
+
+    def test_slow_requests_page_is_staff_only(self):
+        self.client.force_login(User.objects.get(username='author'))
+        self.assertEqual(self.client.get(reverse('core:sql_profile')).status_code, 302)
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        self.assertEqual(self.client.get(reverse('core:sql_profile')).status_code, 200)
+
+
+class ReputationTests(AstraTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user('author')
+        self.voter = make_user('voter')
+        self.post = make_post(make_hub('Careers'), self.author)
+
+    def score(self, user):
+        return UserProfile.objects.get(user=user).reputation_score
+
+    def test_events_are_applied_as_they_happen(self):
+        voting.cast_vote(self.voter, post=self.post)
+        comment = Comment.objects.create(post=self.post, author=self.voter, content='Answer')
+        comment.is_accepted_answer = True
+        comment.save()
+        self.assertEqual(self.score(self.author), 2 + 5)
+        self.assertEqual(self.score(self.voter), 15)
+
+    def test_undoing_appends_a_negative_event(self):
+        voting.cast_vote(self.voter, post=self.post)
+        voting.retract_vote(self.voter, post=self.post)
+        self.assertEqual(self.score(self.author), 2)
+        self.assertEqual(list(ReputationEvent.objects.filter(kind='post_vote').values_list('points', flat=True)
+                              .order_by('pk')), [5, -5])
+
+    def test_recompute_restores_scores_from_the_log(self):
+        voting.cast_vote(self.voter, post=self.post)
+        UserProfile.objects.update(reputation_score=999)
+        call_command('recompute_reputation', stdout=StringIO())
+        self.assertEqual((self.score(self.author), self.score(self.voter)), (7, 0))
+
+    def test_dry_run_only_reports(self):
+        UserProfile.objects.filter(user=self.author).update(reputation_score=999)
+        out = StringIO()
+        call_command('recompute_reputation', '--dry-run', stdout=out)
+        self.assertIn('1 of 2', out.getvalue())
+        self.assertEqual(self.score(self.author), 999)
+
+    def test_rebuild_log_derives_events_from_the_source_tables(self):
+        voting.cast_vote(self.voter, post=self.post)
+        ReputationEvent.objects.all().delete()
+        call_command('recompute_reputation', '--rebuild-log', '--chunk-size', '1', stdout=StringIO())
+        self.assertEqual(sorted(ReputationEvent.objects.values_list('kind', flat=True)), ['post', 'post_vote'])
+        self.assertEqual(self.score(self.author), 7)
+
+    @override_settings(VOTE_WRITE_BEHIND=True)
+    def test_buffered_votes_on_deleted_targets_keep_their_points(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            voting.cast_vote(self.voter, post=self.post)
+        self.post.delete()
+        buffers.flush_counters()
+        event = ReputationEvent.objects.get(kind='post_vote')
+        self.assertEqual((event.user_id, event.actor_id, event.post_id), (self.author.pk, self.voter.pk, None))
+        # The score still agrees with the log
+        call_command('recompute_reputation', stdout=StringIO())
+        self.assertEqual(self.score(self.author), 7)
+
+
+_calls = []
+
+
+@tasks.task(name='core.tests.record_call')
+def record_call(value):
+    _calls.append(value)
+
+
+@tasks.task(name='core.tests.tick')
+def tick():
+    _calls.append('tick')
+
+
+@tasks.task(name='core.tests.always_fails')
+def always_fails():
+    raise RuntimeError('boom')
+
+
+@override_settings(TASKS_EAGER=False, TASK_MAX_ATTEMPTS=2)
+class TaskQueueTests(AstraTestCase):
+    def setUp(self):
+        super().setUp()
+        _calls.clear()
+
+    def test_enqueue_runs_inline_when_eager(self):
+        with self.settings(TASKS_EAGER=True):
+            self.assertIsNone(record_call.enqueue(value=1))
+        self.assertEqual(_calls, [1])
+        self.assertFalse(Task.objects.exists())
+
+    def test_claims_by_priority_then_age(self):
+        low = tasks.enqueue('core.tests.record_call', {'value': 'low'}, priority=-1)
+        first = record_call.enqueue(value='first')
+        second = record_call.enqueue(value='second')
+        later = tasks.enqueue('core.tests.record_call', {'value': 'later'}, delay=timedelta(hours=1))
+        claimed = tasks.claim('worker', limit=10)
+        self.assertEqual([task.pk for task in claimed], [first.pk, second.pk, low.pk])
+        self.assertEqual(Task.objects.get(pk=later.pk).status, 'queued')
+
+    def test_a_claim_is_a_lease(self):
+        queued = record_call.enqueue(value=1)
+        claimed, = tasks.claim('worker-1')
+        self.assertEqual((claimed.pk, claimed.status, claimed.attempts), (queued.pk, 'running', 1))
+        self.assertGreater(claimed.locked_until, timezone.now())
+        self.assertEqual(tasks.claim('worker-2'), [])
+
+        # The worker died: once the lease runs out the task goes back to the queue
+        self.assertEqual(tasks.requeue_expired(), 0)
+        Task.objects.filter(pk=queued.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(tasks.requeue_expired(), 1)
+        reclaimed, = tasks.claim('worker-2')
+        self.assertEqual(reclaimed.attempts, 2)
+
+        # The first worker's late result doesn't touch the row it lost
+        tasks.run(claimed)
+        self.assertEqual(Task.objects.get(pk=queued.pk).status, 'running')
+        self.assertTrue(tasks.run(reclaimed))
+        self.assertEqual(Task.objects.get(pk=queued.pk).status, 'done')
+        self.assertEqual(_calls, [1, 1])
+
+    def test_failures_are_retried_with_backoff_then_failed(self):
+        queued = always_fails.enqueue()
+        claimed, = tasks.claim('worker')
+        with self.assertLogs('core.tasks', 'WARNING'):
+            self.assertFalse(tasks.run(claimed))
+        retried = Task.objects.get(pk=queued.pk)
+        self.assertEqual(retried.status, 'queued')
+        self.assertIn('RuntimeError: boom', retried.last_error)
+        self.assertGreater(retried.run_at, timezone.now() + timedelta(seconds=25))
+
+        Task.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        claimed, = tasks.claim('worker')
+        with self.assertLogs('core.tasks', 'WARNING'):
+            self.assertFalse(tasks.run(claimed))
+        self.assertEqual(Task.objects.get(pk=queued.pk).status, 'failed')
+
+    def test_periodic_tasks_are_queued_once_per_interval(self):
+        with self.settings(TASK_SCHEDULE={'core.tests.tick': 60}):
+            self.assertEqual(tasks.enqueue_due_periodic(), ['core.tests.tick'])
+            self.assertEqual(tasks.enqueue_due_periodic(), [])
+        self.assertEqual(Task.objects.filter(name='core.tests.tick').count(), 1)
+
+    @skipUnlessDBFeature('has_select_for_update_skip_locked')
+    def test_claims_skip_rows_other_workers_hold(self):
+        record_call.enqueue(value=1)
+        with CaptureQueriesContext(connection) as queries:
+            tasks.claim('worker')
+        self.assertTrue(any('SKIP LOCKED' in query['sql'] for query in queries))
+
+    @override_settings(TASKS_EAGER=True, TASK_SCHEDULE={'core.tests.tick': 60}, TASK_EAGER_SCHEDULE_CHECK=60)
+    def test_eager_mode_runs_due_periodic_tasks_after_requests(self):
+        with mock.patch.object(tasks, '_next_eager_check', None), mock.patch.object(tasks, 'time') as clock:
+            clock.monotonic.return_value = 1000
+            self.client.get(reverse('core:home'))
+            self.assertEqual(_calls, [])
+
+            clock.monotonic.return_value = 1060
+            self.client.get(reverse('core:home'))
+            self.assertEqual(_calls, ['tick'])
+
+            # Checked again, but not due until the schedule's interval has passed
+            clock.monotonic.return_value = 1120
+            self.client.get(reverse('core:home'))
+            self.assertEqual(_calls, ['tick'])
+        self.assertFalse(Task.objects.exists())
+
+    @override_settings(TASK_SCHEDULE={'core.tests.tick': 60}, TASK_EAGER_SCHEDULE_CHECK=60)
+    def test_requests_leave_periodic_tasks_to_the_worker(self):
+        with mock.patch.object(tasks, '_next_eager_check', 0):
+            self.client.get(reverse('core:home'))
+        self.assertEqual((_calls, Task.objects.count()), ([], 0))
+
+
+
+class ImageTests(AstraTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    @staticmethod
+    def upload(size=(800, 600), fmt='JPEG', mode='RGB', color='red', **save_options):
+        buffer = io.BytesIO()
+        Image.new(mode, size, color).save(buffer, fmt, **save_options)
+        return SimpleUploadedFile(f'photo.{fmt.lower()}', buffer.getvalue(), content_type=f'image/{fmt.lower()}')
+
+    @staticmethod
+    def open(content):
+        return Image.open(io.BytesIO(content))
+
+    def test_renditions_are_upright_squares_without_metadata(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotated 90° clockwise
+        exif[0x010F] = 'Camera maker'
+        processed = images.process(self.upload(exif=exif.tobytes()))
+
+        self.assertEqual(set(processed.files), {processed.original_name, *images.rendition_names(processed.digest)})
+        original = self.open(processed.files[processed.original_name])
+        self.assertEqual((original.format, original.size), ('JPEG', (600, 800)))
+        for size in settings.AVATAR_SIZES:
+            for fmt, (pillow_format, _, _) in images.FORMATS.items():
+                with self.subTest(size=size, fmt=fmt):
+                    rendition = self.open(processed.files[images.rendition_name(processed.digest, size, fmt)])
+                    self.assertEqual((rendition.format, rendition.size), (pillow_format, (size, size)))
+                    self.assertFalse(rendition.getexif())
+                    self.assertNotIn('icc_profile', rendition.info)
+
+    @override_settings(AVATAR_ORIGINAL_MAX=100)
+    def test_the_original_is_scaled_down(self):
+        processed = images.process(self.upload(size=(400, 200)))
+        self.assertEqual(self.open(processed.files[processed.original_name]).size, (100, 50))
+
+    def test_transparency_becomes_white_in_jpeg(self):
+        processed = images.process(self.upload(fmt='PNG', mode='RGBA', color=(0, 0, 0, 0)))
+        jpeg = self.open(processed.files[images.rendition_name(processed.digest, settings.AVATAR_SIZES[0], 'jpeg')])
+        self.assertGreater(min(jpeg.getpixel((10, 10))), 250)
+
+    @override_settings(AVATAR_MAX_PIXELS=800 * 600 - 1)
+    def test_images_over_the_pixel_limit_are_refused_before_decoding(self):
+        upload = self.upload()
+        with mock.patch.object(Image.Image, 'load') as load, self.assertRaises(ValidationError) as raised:
+            images.process(upload)
+        self.assertIn('too large', raised.exception.messages[0])
+        load.assert_not_called()
+
+    def test_files_that_are_not_images_are_refused(self):
+        with self.assertRaises(ValidationError):
+            images.process(SimpleUploadedFile('photo.jpg', b'not an image'))
+
+    def test_identical_uploads_share_their_files(self):
+        first, second = images.process(self.upload()), images.process(self.upload())
+        self.assertEqual(first.digest, second.digest)
+        images.save(first)
+        with mock.patch.object(default_storage, 'save') as save:
+            images.save(second)
+        save.assert_not_called()
+        self.assertTrue(images.has_renditions(first.digest))
+
+    def test_profile_form_saves_the_processed_image(self):
+        profile = UserProfile.objects.get(user=make_user('author'))
+        form = UserProfileForm({'visibility_mode': 'public'}, {'profile_image': self.upload()}, instance=profile)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        profile.refresh_from_db()
+        self.assertEqual(profile.profile_image.name, images.original_name(profile.avatar_hash))
+        self.assertTrue(images.has_renditions(profile.avatar_hash))
+
+        html = Template("{% load avatars %}{% avatar profile 100 %}").render(Context({'profile': profile}))
+        small = images.url(images.rendition_name(profile.avatar_hash, settings.AVATAR_SIZES[0], 'jpeg'))
+        self.assertIn(f'<img src="{small}"', html)
+        self.assertIn('type="image/webp"', html)
+
+    def test_bad_uploads_are_form_errors(self):
+        profile = UserProfile.objects.get(user=make_user('author'))
+        upload = SimpleUploadedFile('photo.jpg', b'not an image', content_type='image/jpeg')
+        form = UserProfileForm({'visibility_mode': 'public'}, {'profile_image': upload}, instance=profile)
+        self.assertIn('profile_image', form.errors)
+
+    def test_renditions_are_served_to_be_cached_forever(self):
+        processed = images.process(self.upload())
+        images.save(processed)
+        response = self.client.get(images.url(images.rendition_name(processed.digest, 160, 'webp')))
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/webp'))
+        self.assertIn('immutable', response['Cache-Control'])
+        response.close()
+        self.assertEqual(self.client.get(images.url(images.original_name('0' * 64))).status_code, 404)
+
+
+@override_settings(MEMBERSHIP_CACHE_TTL=60)
+class MembershipTests(AstraTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('member')
+        self.other = make_user('other')
+        self.hub = make_hub('Careers')
+        self.other_hub = make_hub('Design')
+
+    def change(self, func, *args):
+        with self.captureOnCommitCallbacks(execute=True):
+            func(*args)
+
+    def test_hub_sets_are_read_once(self):
+        self.change(self.hub.members.add, self.user)
+        self.assertEqual(memberships.hub_ids(self.user), {self.hub.pk})
+        with self.assertNumQueries(0):
+            self.assertTrue(memberships.is_member(self.user, self.hub.pk))
+            self.assertEqual(memberships.hub_ids_for_users([self.user.pk]), {self.user.pk: {self.hub.pk}})
+
+    @override_settings(MEMBERSHIP_CACHE_TTL=0)
+    def test_without_a_shared_cache_every_read_queries(self):
+        memberships.hub_ids(self.user)
+        with self.assertNumQueries(1):
+            memberships.hub_ids(self.user)
+
+    def test_changes_from_either_side_invalidate(self):
+        memberships.hub_ids(self.user)
+        self.change(self.hub.members.add, self.user)
+        self.assertEqual(memberships.hub_ids(self.user), {self.hub.pk})
+        self.change(self.user.joined_hubs.add, self.other_hub)
+        self.assertEqual(memberships.hub_ids(self.user), {self.hub.pk, self.other_hub.pk})
+        self.change(self.user.joined_hubs.remove, self.hub)
+        self.assertEqual(memberships.hub_ids(self.user), {self.other_hub.pk})
+        self.change(self.user.joined_hubs.clear)
+        self.assertEqual(memberships.hub_ids(self.user), frozenset())
+
+    def test_clearing_a_hub_invalidates_every_former_member(self):
+        self.change(self.hub.members.add, self.user, self.other)
+        self.assertEqual(memberships.shared_hubs(self.user, self.other), {self.hub.pk})
+        self.change(self.hub.members.clear)
+        self.assertEqual(memberships.hub_ids_for_users([self.user.pk, self.other.pk]),
+                         {self.user.pk: frozenset(), self.other.pk: frozenset()})
+
+    def test_invalidation_waits_for_the_commit(self):
+        memberships.hub_ids(self.user)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.hub.members.add(self.user)
+            # Uncommitted: readers keep the old set rather than caching this one for good
+            self.assertEqual(memberships.hub_ids(self.user), frozenset())
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(memberships.hub_ids(self.user), {self.hub.pk})
+
+    def test_toggle_joins_then_leaves(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(memberships.toggle(self.user, self.hub))
+        self.assertTrue(memberships.is_member(self.user, self.hub.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertFalse(memberships.toggle(self.user, self.hub))
+        self.assertFalse(memberships.is_member(self.user, self.hub.pk))
+
+    def test_join_view_shows_the_new_membership(self):
+        self.client.force_login(self.user)
+        url = reverse('core:hub_detail', args=[self.hub.slug])
+        self.assertFalse(self.client.get(url).context['is_member'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('core:join_hub', args=[self.hub.slug]))
+        self.assertTrue(self.client.get(url).context['is_member'])
+
+    def test_anonymous_users_have_no_hubs(self):
+        self.assertEqual(memberships.hub_ids(AnonymousUser()), frozenset())
+        self.assertEqual(memberships.shared_hubs(AnonymousUser(), self.user), frozenset())
+
+
+class RankingTests(AstraTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user('author')
+        self.hub = make_hub('Careers')
+        self.client.force_login(self.author)
+
+    def post(self, title, age=timedelta(), helpful=0):
+        post = make_post(self.hub, self.author, title)
+        # created_at is auto_now_add; backdate it and score the post again
+        Post.objects.filter(pk=post.pk).update(created_at=timezone.now() - age)
+        ranking.refresh([post.pk])
+        for i in range(helpful):
+            voting.cast_vote(make_user(f'{title.lower()}-voter-{i}'), post=post)
+        post.refresh_from_db()
+        return post
+
+    def feed(self, sort):
+        response = self.client.get(reverse('core:hub_detail', args=[self.hub.slug]), {'sort': sort})
+        return [post.title for post in response.context['posts']]
+
+    def test_hot_needs_twice_the_engagement_per_half_life_of_age(self):
+        half_life = timedelta(hours=settings.HOT_HALF_LIFE_HOURS)
+        self.post('Fresh', helpful=1)
+        self.post('Day old, more votes', age=half_life, helpful=4)
+        self.post('Day old, as many votes', age=half_life, helpful=1)
+        self.assertEqual(self.feed('hot'), ['Day old, more votes', 'Fresh', 'Day old, as many votes'])
+
+    def test_top_counts_engagement_within_the_window(self):
+        self.post('Quiet')
+        self.post('Popular', age=timedelta(days=1), helpful=2)
+        self.post('Popular long ago', age=timedelta(days=settings.TOP_WINDOW_DAYS + 1), helpful=5)
+        self.assertEqual(self.feed('top'), ['Popular', 'Quiet'])
+        self.assertEqual(self.feed('new'), ['Quiet', 'Popular', 'Popular long ago'])
+
+    def test_votes_comments_and_accepted_answers_refresh_the_scores(self):
+        post = self.post('Question', helpful=2)
+        self.assertEqual(post.top_score, ranking.engagement(2, 0, False))
+        comment = Comment.objects.create(post=post, author=self.author, content='Answer')
+        comment.is_accepted_answer = True
+        comment.save()
+        post.refresh_from_db()
+        self.assertEqual(post.top_score, ranking.engagement(2, 1, True))
+        self.assertEqual(post.hot_score, ranking.hot_score(post.top_score, post.created_at))
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.top_score, ranking.engagement(2, 0, False))
+
+    def test_rescore_recent_fixes_rows_written_without_signals(self):
+        recent = self.post('Recent')
+        old = self.post('Old', age=timedelta(days=settings.HOT_RESCORE_DAYS + 1))
+        Post.objects.update(helpful_count=3)
+        self.assertEqual(ranking.rescore_recent(), 1)
+        recent.refresh_from_db()
+        old.refresh_from_db()
+        self.assertEqual((recent.top_score, old.top_score), (ranking.engagement(3, 0, False), 0))
+        call_command('rescore_posts', stdout=StringIO())
+        old.refresh_from_db()
+        self.assertEqual(old.top_score, ranking.engagement(3, 0, False))
+
+    def test_rescoring_leaves_updated_at_alone(self):
+        post = self.post('Post')
+        Post.objects.filter(pk=post.pk).update(helpful_count=1, updated_at=post.updated_at)
+        ranking.refresh([post.pk])
+        self.assertEqual(Post.objects.get(pk=post.pk).updated_at, post.updated_at)
+
+    def test_the_top_window_moves_at_local_midnight(self):
+        today = timezone.localdate()
+        self.assertIsNone(ranking.window_bucket('hot'))
+        self.assertEqual(ranking.window_bucket('top'), today)
+        start = ranking.window_start()
+        self.assertEqual((timezone.localtime(start).date(), timezone.localtime(start).time()),
+                         (today - timedelta(days=settings.TOP_WINDOW_DAYS), datetime.min.time()))
+        with mock.patch('django.utils.timezone.localdate', return_value=today + timedelta(days=1)):
+            self.assertEqual(ranking.window_start() - start, timedelta(days=1))
+
+    def test_unknown_sorts_fall_back_to_new(self):
+        self.post('Only')
+        response = self.client.get(reverse('core:hub_detail', args=[self.hub.slug]), {'sort': 'sideways'})
+        self.assertEqual(response.context['sort'], ranking.DEFAULT_SORT)
+
+
+class LiveEventTests(AstraTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user('author')
+        self.mentor = make_user('mentor', is_mentor=True)
+        self.post = make_post(make_hub('Careers'), self.author)
+        self.channel = live.post_channel(self.post.pk)
+
+    def use_backend(self, backend_class):
+        backend = backend_class(events.broker)
+        patcher = mock.patch.object(events, '_backend', backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return backend
+
+    def published(self):
+        return list(LiveEvent.objects.order_by('pk').values_list('channel', 'kind'))
+
+    @override_settings(EVENTS_BACKEND='database')
+    def test_events_are_published_once_the_change_commits(self):
+        self.use_backend(events.DatabaseBackend)
+        with self.captureOnCommitCallbacks() as callbacks:
+            comment = Comment.objects.create(post=self.post, author=self.mentor, content='Welcome')
+            self.assertEqual(self.published(), [])
+        for callback in callbacks:
+            callback()
+        event = LiveEvent.objects.get()
+        self.assertEqual((event.channel, event.kind), (self.channel, 'comment'))
+        self.assertEqual((event.data['id'], event.data['author'], event.data['content']),
+                         (comment.pk, 'Mentor', 'Welcome'))
+
+    @override_settings(EVENTS_BACKEND='database')
+    def test_mentorship_changes_reach_both_users(self):
+        self.use_backend(events.DatabaseBackend)
+        with self.captureOnCommitCallbacks(execute=True):
+            request = MentorshipRequest.objects.create(mentee=self.author, mentor=self.mentor, topic='Careers',
+                                                       message='Hello')
+        with self.captureOnCommitCallbacks(execute=True):
+            request.status = 'accepted'
+            request.save()
+        self.assertEqual(self.published(), [
+            (live.mentorship_channel(self.mentor.pk), 'mentorship_request'),
+            (live.mentorship_channel(self.author.pk), 'mentorship'),
+            (live.mentorship_channel(self.mentor.pk), 'mentorship'),
+        ])
+
+    def test_a_failing_backend_does_not_fail_the_change(self):
+        backend = self.use_backend(events.MemoryBackend)
+        with mock.patch.object(backend, 'send', side_effect=RuntimeError('down')), \
+                self.assertLogs('core.events', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(post=self.post, author=self.mentor, content='Still saved')
+        self.assertTrue(Comment.objects.filter(content='Still saved').exists())
+
+    def test_purge_keeps_recent_events(self):
+        old = LiveEvent.objects.create(channel=self.channel, kind='comment')
+        recent = LiveEvent.objects.create(channel=self.channel, kind='comment')
+        LiveEvent.objects.filter(pk=old.pk).update(
+            created_at=timezone.now() - timedelta(seconds=settings.EVENTS_RETENTION_SECONDS + 1))
+        self.assertEqual(events.purge_events(), 1)
+        self.assertEqual(list(LiveEvent.objects.values_list('pk', flat=True)), [recent.pk])
+
+    def test_the_poller_dispatches_new_rows_to_followers(self):
+        backend = self.use_backend(events.DatabaseBackend)
+
+        async def follow():
+            subscription = events.broker.subscribe({self.channel})
+            try:
+                await sync_to_async(LiveEvent.objects.create)(channel='post:0', kind='comment')
+                # The first poll only finds where the log ends
+                self.assertEqual(await sync_to_async(backend.poll)(), 0)
+                await sync_to_async(LiveEvent.objects.create)(channel='post:0', kind='comment')
+                await sync_to_async(LiveEvent.objects.create)(channel=self.channel, kind='helpful')
+                self.assertEqual(await sync_to_async(backend.poll)(), 2)
+                return await subscription.get(1), subscription.queue.qsize()
+            finally:
+                events.broker.unsubscribe(subscription)
+
+        event, left = async_to_sync(follow)()
+        self.assertEqual((event.channel, event.kind, left), (self.channel, 'helpful', 0))
+        self.assertEqual(events.broker.channels(), set())
+
+    def test_reconnecting_streams_replay_what_they_missed(self):
+        backend = self.use_backend(events.MemoryBackend)
+        for kind in ('comment', 'helpful', 'comment'):
+            backend.send(self.channel, kind, {})
+        backend.send('post:0', 'comment', {})
+
+        async def reconnect():
+            received = []
+            async with aclosing(events.listen({self.channel}, last_event_id=1, duration=0.5)) as stream:
+                async for event in stream:
+                    if event is not None:
+                        received.append(event.id)
+                    if len(received) == 2:
+                        backend.send(self.channel, 'helpful', {})
+            return received
+
+        self.assertEqual(async_to_sync(reconnect)(), [2, 3, 5])
+
+    @override_settings(EVENTS_QUEUE_SIZE=2)
+    def test_streams_that_fall_behind_are_ended(self):
+        backend = self.use_backend(events.MemoryBackend)
+
+        async def fall_behind():
+            stream = events.listen({self.channel}, duration=5)
+            async with aclosing(stream):
+                first = asyncio.ensure_future(stream.__anext__())
+                await asyncio.sleep(0)
+                for _ in range(4):
+                    backend.send(self.channel, 'helpful', {})
+                received = [(await first).id]
+                # Ended at once rather than after the duration; the client reconnects and replays
+                async for event in stream:
+                    received.append(event.id)
+            return received
+
+        self.assertEqual(async_to_sync(fall_behind)(), [1])
+
+    def test_user_channels_need_a_login_or_a_token(self):
+        requested = ['mentorship', f'post:{self.post.pk}', 'post:x', 'hub:1']
+        self.assertEqual(live.channels_for(AnonymousUser(), requested), {self.channel})
+        self.assertEqual(live.channels_for(self.author, requested),
+                         {self.channel, live.mentorship_channel(self.author.pk)})
+        self.assertEqual(len(live.channels_for(AnonymousUser(), [f'post:{i}' for i in range(50)])),
+                         live.MAX_CHANNELS)
+
+    def test_tokens_sign_in_active_users_until_they_expire(self):
+        token = live.events_token(self.author)
+        self.assertEqual(live.token_user(token), self.author)
+        self.assertFalse(live.token_user(token[:-1] + 'x').is_authenticated)
+        with self.settings(EVENTS_TOKEN_MAX_AGE=-1):
+            self.assertFalse(live.token_user(token).is_authenticated)
+        User.objects.filter(pk=self.author.pk).update(is_active=False)
+        self.assertFalse(live.token_user(token).is_authenticated)
+
+    def test_streams_need_asgi(self):
+        response = self.client.get(reverse('core:event_stream'), {'channel': self.channel})
+        self.assertEqual(response.status_code, 204)
+
+    @override_settings(EVENTS_ALLOWED_ORIGINS=['https://pages.example.com'], EVENTS_STREAM_SECONDS=0)
+    async def test_only_allowed_origins_may_read_streams(self):
+        self.use_backend(events.MemoryBackend)
+        url = reverse('core:event_stream')
+        response = await self.async_client.get(url, {'channel': self.channel},
+                                               headers={'Origin': 'https://pages.example.com'})
+        self.assertEqual(response['Access-Control-Allow-Origin'], 'https://pages.example.com')
+        self.assertIn('Origin', response['Vary'])
+        response = await self.async_client.get(url, {'channel': self.channel},
+                                               headers={'Origin': 'https://elsewhere.example.com'})
+        self.assertNotIn('Access-Control-Allow-Origin', response)
+        response = await self.async_client.get(url, {'channel': 'mentorship'})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(EVENTS_ALLOWED_ORIGINS=['https://pages.example.com'])
+    def test_websockets_check_the_origin(self):
+        host = [(b'host', b'astra.example.com')]
+        for origin, allowed in ((None, True), (b'https://astra.example.com', True),
+                                (b'https://pages.example.com', True), (b'https://evil.example.com', False)):
+            with self.subTest(origin=origin):
+                headers = dict(host + ([(b'origin', origin)] if origin else []))
+                self.assertEqual(live._same_origin(headers), allowed)
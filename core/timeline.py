@@ -0,0 +1,175 @@
+"""
+Materialized home timelines (fan-out on write).
+
+When a post is created it is copied into TimelineEntry for every member of its
+hub who has a HomeTimeline. Reading the home feed is then a single range scan
+on (user, created_at, post) instead of a join across every joined hub.
+Users without a HomeTimeline are served by the live query and materialized on
+their first visit; joining or leaving a hub backfills or trims their entries.
+
+Fan-out and backfill run as background tasks (core/tasks.py), so creating a
+post in a big hub doesn't wait on thousands of inserts. Trimming stays inline:
+it is one indexed DELETE and a member who leaves shouldn't see the hub again.
+
+Each timeline keeps its TIMELINE_MAX_ENTRIES newest entries; the feed ends
+there. Backfills prune the timelines they filled, and the periodic
+prune_timelines task drops what fan-out pushed past the limit since its last
+run, so the table stays around users x TIMELINE_MAX_ENTRIES rows.
+"""
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+from django.db.models.signals import post_save, m2m_changed
+from django.dispatch import receiver
+
+from .models import Hub, Post, HomeTimeline, TimelineEntry
+from .pagination import paginate_keyset
+from .tasks import task
+
+TIMELINE_KEYS = ('created_at', 'post_id')
+
+
+def _entries_for_posts(user_ids, posts):
+    return [
+        TimelineEntry(user_id=user_id, post_id=post_id, hub_id=hub_id, created_at=created_at)
+        for user_id in user_ids
+        for post_id, hub_id, created_at in posts
+    ]
+
+
+def _materialized(user_ids):
+    return list(HomeTimeline.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True))
+
+
+def fan_out(post):
+    """Push a new post onto the timelines of its hub's materialized members"""
+    member_ids = Hub.members.through.objects.filter(
+        hub_id=post.hub_id, user__home_timeline__isnull=False
+    ).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        _entries_for_posts(member_ids, [(post.pk, post.hub_id, post.created_at)]),
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_ids, hub_ids):
+    """Copy the most recent posts of hub_ids into the timelines of user_ids"""
+    user_ids = _materialized(user_ids)
+    if not user_ids:
+        return
+    for hub_id in hub_ids:
+        recent = Post.objects.filter(hub_id=hub_id).order_by('-created_at', '-id').values_list(
+            'id', 'hub_id', 'created_at')[:settings.TIMELINE_MAX_ENTRIES]
+        TimelineEntry.objects.bulk_create(
+            _entries_for_posts(user_ids, list(recent)),
+            batch_size=settings.TIMELINE_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+    prune(user_ids)
+
+
+def prune(user_ids):
+    """Drop all but the TIMELINE_MAX_ENTRIES newest entries of each of user_ids' timelines; returns how many"""
+    user_ids, deleted = list(user_ids), 0
+    for start in range(0, len(user_ids), settings.TIMELINE_BATCH_SIZE):
+        ranked = TimelineEntry.objects.filter(user_id__in=user_ids[start:start + settings.TIMELINE_BATCH_SIZE])
+        stale = list(ranked.annotate(rank=Window(
+            RowNumber(), partition_by=F('user_id'), order_by=(F('created_at').desc(), F('post_id').desc()),
+        )).filter(rank__gt=settings.TIMELINE_MAX_ENTRIES).values_list('pk', flat=True))
+        for chunk in range(0, len(stale), settings.TIMELINE_BATCH_SIZE):
+            doomed = stale[chunk:chunk + settings.TIMELINE_BATCH_SIZE]
+            deleted += TimelineEntry.objects.filter(pk__in=doomed).delete()[0]
+    return deleted
+
+
+@task(priority=-5)
+def prune_timelines():
+    """prune() every timeline that fan-out has pushed past TIMELINE_MAX_ENTRIES"""
+    over = TimelineEntry.objects.order_by().values('user_id').annotate(
+        total=Count('pk')).filter(total__gt=settings.TIMELINE_MAX_ENTRIES).values_list('user_id', flat=True)
+    return prune(over)
+
+
+@task(priority=5)
+def fan_out_post(post_id):
+    post = Post.objects.filter(pk=post_id).first()
+    if post is not None:
+        fan_out(post)
+
+
+@task(priority=5)
+def backfill_members(user_ids, hub_ids):
+    """backfill() for whichever of user_ids are still members of each hub when the task runs"""
+    members = defaultdict(list)
+    for user_id, hub_id in Hub.members.through.objects.filter(
+            user_id__in=user_ids, hub_id__in=hub_ids).values_list('user_id', 'hub_id'):
+        members[hub_id].append(user_id)
+    for hub_id, member_ids in members.items():
+        backfill(member_ids, [hub_id])
+
+
+def trim(user_ids, hub_ids):
+    """Drop the posts of hub_ids from the timelines of user_ids"""
+    TimelineEntry.objects.filter(user_id__in=user_ids, hub_id__in=hub_ids).delete()
+
+
+def materialize(user):
+    """Build a user's timeline from their current hubs; a no-op if it already exists"""
+    with transaction.atomic():
+        _, created = HomeTimeline.objects.get_or_create(user=user)
+        if created:
+            backfill([user.pk], list(user.joined_hubs.values_list('pk', flat=True)))
+    return created
+
+
+def home_page(user, cursor=None, page_size=None):
+    """
+    Return a KeysetPage of Posts from the user's materialized timeline, or None
+    if the user hasn't been materialized yet (callers fall back to the live query).
+    """
+    if not HomeTimeline.objects.filter(user=user).exists():
+        return None
+
+    page = paginate_keyset(TimelineEntry.objects.filter(user=user), cursor, page_size, keys=TIMELINE_KEYS)
+    if not page.items and not TimelineEntry.objects.filter(user=user).exists():
+        return None
+
+    posts = Post.objects.select_related('author__profile', 'hub').in_bulk(
+        [entry.post_id for entry in page.items])
+    page.items = [posts[entry.post_id] for entry in page.items if entry.post_id in posts]
+    return page
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        fan_out_post.enqueue(post_id=instance.pk)
+    elif getattr(instance, '_moved_from_hub_id', None):
+        TimelineEntry.objects.filter(post=instance).delete()
+        fan_out_post.enqueue(post_id=instance.pk)
+
+
+@receiver(m2m_changed, sender=Hub.members.through)
+def hub_members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        related = instance.joined_hubs if reverse else instance.members
+        instance._timeline_cleared_ids = list(related.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    changed_ids = instance._timeline_cleared_ids if action == 'post_clear' else list(pk_set or [])
+    if not changed_ids:
+        return
+    user_ids, hub_ids = ([instance.pk], changed_ids) if reverse else (changed_ids, [instance.pk])
+    if action == 'post_add':
+        backfill_members.enqueue(user_ids=user_ids, hub_ids=hub_ids)
+    else:
+        trim(user_ids, hub_ids)
@@ -1,4 +1,4 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 app_name = 'core'
@@ -18,6 +18,9 @@ urlpatterns = [
     path('hub/<slug:slug>/', views.hub_detail, name='hub_detail'),
     path('hub/<slug:slug>/join/', views.join_hub, name='join_hub'),
 
+    # Search
+    path('search/', views.search_view, name='search'),
+
     # Posts
     path('post/<int:pk>/', views.post_detail, name='post_detail'),
     path('post/create/', views.post_create, name='post_create'),
@@ -27,17 +30,26 @@ urlpatterns = [
 
     # Comments
     path('post/<int:post_pk>/comment/', views.add_comment, name='add_comment'),
+    path('comment/<int:pk>/vote/', views.vote_comment_helpful, name='vote_comment_helpful'),
 
     # Profiles
     path('profile/<str:username>/', views.profile_view, name='profile_view'),
     path('profile/<str:username>/edit/', views.profile_edit, name='profile_edit'),
+    re_path(r'^avatars/(?P<name>[0-9a-f]{2}/[0-9a-f]{64}(?:-\d+)?\.(?:jpg|webp))$', views.avatar_file,
+            name='avatar_file'),
 
     # Mentorship
     path('mentors/', views.mentor_list, name='mentor_list'),
+    path('leaderboard/', views.leaderboard, name='leaderboard'),
     path('mentorship/request/<str:username>/', views.request_mentorship, name='request_mentorship'),
     path('mentorship/dashboard/', views.mentorship_dashboard, name='mentorship_dashboard'),
     path('mentorship/<int:pk>/update/', views.update_mentorship_status, name='update_mentorship_status'),
+
+    # Live updates
+    path('events/', views.event_stream, name='event_stream'),
 # Analytics
     path('analytics/', views.analytics_dashboard, name='analytics_dashboard'),
+    path('analytics/export/<str:dataset>.<str:fmt>', views.bulk_export, name='bulk_export'),
+    path('analytics/queries/', views.sql_profile, name='sql_profile'),
     path('profile/<str:username>/export/', views.export_portfolio, name='export_portfolio'),
 ]
\ No newline at end of file
@@ -0,0 +1,174 @@
+"""
+Change versions and conditional GET.
+
+A ChangeVersion row per key is bumped with a single
+UPDATE ... SET version = version + 1 whenever the data behind it changes, in
+the same transaction as the write:
+
+    hubs        the hub list (any hub, membership or post count change)
+    hub:<id>    a hub's post list, including comment and helpful counts
+    post:<id>   a post page: the post, its comments and their votes
+    rollups     the daily growth rollups
+    matching    the mentor matching index (core/matching.py)
+    epoch       everything; bumped after bulk loads that skip signals
+
+Views validate If-None-Match / If-Modified-Since against these rows, so a
+client polling an unchanged page gets a 304 after one indexed lookup instead
+of the page's real queries and rendering.
+"""
+
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .models import Hub, Post, Comment, ChangeVersion
+
+EPOCH = 'epoch'
+
+
+def bump(*keys):
+    """Atomically increment the version of each key, creating rows as needed"""
+    keys = {key for key in keys if key}
+    if not keys:
+        return
+    now = timezone.now()
+    rows = ChangeVersion.objects.filter(key__in=keys)
+    if rows.update(version=F('version') + 1, updated_at=now) == len(keys):
+        return
+    missing = keys - set(rows.values_list('key', flat=True))
+    for key in missing:
+        try:
+            with transaction.atomic():
+                ChangeVersion.objects.create(key=key, version=1, updated_at=now)
+        except IntegrityError:
+            # Another writer created it first
+            ChangeVersion.objects.filter(key=key).update(version=F('version') + 1, updated_at=now)
+
+
+def validators(keys, *extra):
+    """
+    (etag, last_modified) for the given keys plus any extra strings that the
+    response varies on (user, query string...). Keys never bumped count as
+    version 0 and contribute no Last-Modified.
+    """
+    found = dict(
+        (key, (version, updated_at)) for key, version, updated_at in
+        ChangeVersion.objects.filter(key__in=[*keys, EPOCH]).values_list('key', 'version', 'updated_at')
+    )
+    parts = [f'{key}={found.get(key, (0, None))[0]}' for key in (*keys, EPOCH)]
+    digest = hashlib.md5('|'.join([*parts, *map(str, extra)]).encode(), usedforsecurity=False).hexdigest()
+    modified = [updated_at for _, updated_at in found.values()]
+    return f'"{digest}"', max(modified) if modified else None
+
+
+def conditional(validator):
+    """
+    Like django.views.decorators.http.condition, but with one validator
+    returning (etag, last_modified) or None to skip, so both come from a single
+    query; works on sync and async views.
+    """
+    def check(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return None, None
+        result = validator(request, *args, **kwargs)
+        if result is None:
+            return None, None
+        etag, modified = result
+        modified = int(modified.timestamp()) if modified else None
+        return get_conditional_response(request, etag=etag, last_modified=modified), result
+
+    def finish(response, result):
+        if result is not None:
+            etag, modified = result
+            response.headers.setdefault('ETag', etag)
+            if modified and not response.has_header('Last-Modified'):
+                response.headers['Last-Modified'] = http_date(modified.timestamp())
+        return response
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def inner(request, *args, **kwargs):
+                response, result = await sync_to_async(check)(request, *args, **kwargs)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return finish(response, result)
+        else:
+            @wraps(view)
+            def inner(request, *args, **kwargs):
+                response, result = check(request, *args, **kwargs)
+                if response is None:
+                    response = view(request, *args, **kwargs)
+                return finish(response, result)
+        return inner
+
+    return decorator
+
+
+def bump_for_vote(post=None, comment=None):
+    """A helpful vote changes the post page, and for post votes the hub's post list too"""
+    if post is not None:
+        bump(f'post:{post.pk}', f'hub:{post.hub_id}')
+    else:
+        bump(f'post:{comment.post_id}')
+
+
+def bump_for_counters(post_ids=(), comment_ids=()):
+    """Bump the keys behind a batch of helpful_count updates (write-behind flushes)"""
+    keys = []
+    for pk, hub_id in Post.objects.filter(pk__in=post_ids).values_list('pk', 'hub_id'):
+        keys += [f'post:{pk}', f'hub:{hub_id}']
+    for post_id in Comment.objects.filter(pk__in=comment_ids).values_list('post_id', flat=True).distinct():
+        keys.append(f'post:{post_id}')
+    bump(*keys)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    moved_from = getattr(instance, '_moved_from_hub_id', None)
+    keys = [f'post:{instance.pk}', f'hub:{instance.hub_id}']
+    if created or moved_from:
+        keys += ['hubs', f'hub:{moved_from}' if moved_from else None]
+    bump(*keys)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    bump('hubs', f'hub:{instance.hub_id}')
+    ChangeVersion.objects.filter(key=f'post:{instance.pk}').delete()
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump(f'post:{instance.post_id}', f'hub:{instance.post.hub_id}')
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    # During a post delete cascade the post may already be gone; its own receiver covers the hub
+    hub_id = Post.objects.filter(pk=instance.post_id).values_list('hub_id', flat=True).first()
+    bump(f'post:{instance.post_id}', f'hub:{hub_id}' if hub_id else None)
+
+
+@receiver(post_save, sender=Hub)
+@receiver(post_delete, sender=Hub)
+def hub_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump('hubs', f'hub:{instance.pk}')
+
+
+@receiver(m2m_changed, sender=Hub.members.through)
+def hub_members_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump('hubs')
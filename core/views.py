@@ -1,30 +1,71 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import Http404, FileResponse, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.core.files.storage import default_storage
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
+from django.views.decorators.http import require_POST
+from django.utils.cache import patch_vary_headers
 from django.contrib import messages
-from django.db.models import Count, Q
 from .models import Hub, Post, Comment, UserProfile, MentorshipRequest, HelpfulVote, Skill
 from .forms import SignUpForm, UserProfileForm, PostForm, CommentForm, MentorshipRequestForm
+from .pagination import paginate_keyset, get_page_size, InvalidCursor
+from . import (
+    events, exports, fragments, images, live, matching, memberships, profiling, ranking, reputation, search, stats,
+    timeline, versions, voting,
+)
 from django.contrib.auth.models import User
+from django.conf import settings
 import json
 
+def _feed_page(request, queryset, page_size=None, keys=('created_at', 'id')):
+    """Keyset-paginate a post feed from ?cursor=, falling back to the first page on a bad cursor"""
+    queryset = queryset.select_related('author__profile', 'hub')
+    page_size = get_page_size(request, page_size)
+    try:
+        return paginate_keyset(queryset, request.GET.get('cursor'), page_size, keys=keys)
+    except InvalidCursor:
+        return paginate_keyset(queryset, None, page_size, keys=keys)
+
+
+def _ranked_feed_page(request, queryset, sort):
+    """_feed_page in the order of a ranking.SORTS tab"""
+    queryset, keys = ranking.sorted_posts(queryset, sort)
+    return _feed_page(request, queryset, keys=keys)
+
+
 @login_required
 def home(request):
-    if request.user.is_authenticated:
-        joined_hubs = request.user.joined_hubs.all()
-        if joined_hubs.exists():
-            posts = Post.objects.filter(hub__in=joined_hubs).select_related('author', 'hub')[:20]
+    sort = ranking.get_sort(request)
+    page = None
+    if request.user.is_authenticated and sort == 'new':
+        page_size = get_page_size(request)
+        try:
+            page = timeline.home_page(request.user, request.GET.get('cursor'), page_size)
+        except InvalidCursor:
+            page = timeline.home_page(request.user, None, page_size)
+
+    if page is None:
+        if request.user.is_authenticated:
+            joined_hub_ids = memberships.hub_ids(request.user)
+            if joined_hub_ids:
+                page = _ranked_feed_page(request, Post.objects.filter(hub_id__in=joined_hub_ids), sort)
+                if sort == 'new':
+                    timeline.materialize(request.user)
+            else:
+                page = _ranked_feed_page(request, Post.objects.all(), sort)
         else:
-            posts = Post.objects.all().select_related('author', 'hub')[:20]
-    else:
-        posts = Post.objects.all().select_related('author', 'hub')[:10]
+            page = _feed_page(request, Post.objects.all(), 10)
 
-    hubs = Hub.objects.annotate(member_count=Count('members'))[:6]
+    hubs = Hub.objects.all()[:6]
 
     context = {
-        'posts': posts,
+        'posts': page,
+        'page': page,
         'hubs': hubs,
+        'sort': sort,
+        'sort_tabs': ranking.tabs(sort),
     }
     return render(request, 'core/home.html', context)
 
@@ -74,23 +115,34 @@ def logout_view(request):
 
 @login_required
 def hub_list(request):
-    hubs = Hub.objects.annotate(
-        member_count=Count('members'),
-        post_count=Count('posts')
-    ).order_by('-member_count')
+    hubs = Hub.objects.order_by('-member_count')
 
     return render(request, 'core/hub_list.html', {'hubs': hubs})
 
+@login_required
+def search_view(request):
+    context = {
+        'search': search.search_request(request),
+        'hubs': Hub.objects.only('name', 'slug'),
+        'post_types': Post.POST_TYPE_CHOICES,
+    }
+    return render(request, 'core/search.html', context)
+
+
 @login_required
 def hub_detail(request, slug):
     hub = get_object_or_404(Hub, slug=slug)
-    posts = hub.posts.all().select_related('author', 'hub')
-    is_member = request.user.is_authenticated and hub.members.filter(id=request.user.id).exists()
+    sort = ranking.get_sort(request)
+    page = _ranked_feed_page(request, hub.posts.all(), sort)
+    is_member = memberships.is_member(request.user, hub.pk)
 
     context = {
         'hub': hub,
-        'posts': posts,
+        'posts': page,
+        'page': page,
         'is_member': is_member,
+        'sort': sort,
+        'sort_tabs': ranking.tabs(sort),
     }
     return render(request, 'core/hub_detail.html', context)
 
@@ -99,22 +151,34 @@ def hub_detail(request, slug):
 def join_hub(request, slug):
     hub = get_object_or_404(Hub, slug=slug)
 
-    if hub.members.filter(id=request.user.id).exists():
-        hub.members.remove(request.user)
-        messages.info(request, f'You left {hub.name}')
-    else:
-        hub.members.add(request.user)
+    if memberships.toggle(request.user, hub):
         messages.success(request, f'You joined {hub.name}!')
+    else:
+        messages.info(request, f'You left {hub.name}')
 
     return redirect('core:hub_detail', slug=slug)
 
 
+def _post_detail_validators(request, pk):
+    # Flash messages are consumed by rendering, so a 304 would swallow them
+    if len(messages.get_messages(request)):
+        return None
+    return versions.validators(
+        [f'post:{pk}'], request.user.pk, request.META.get('CSRF_COOKIE'), request.get_full_path()
+    )
+
+
+@versions.conditional(_post_detail_validators)
 def post_detail(request, pk):
     post = get_object_or_404(Post.objects.select_related('author', 'hub'), pk=pk)
     comments = post.comments.all().select_related('author')
     user_voted = False
+    voted_comment_ids = set()
     if request.user.is_authenticated:
-        user_voted = HelpfulVote.objects.filter(user=request.user, post=post).exists()
+        user_voted = voting.has_voted(request.user, post=post)
+        voted_comment_ids = set(HelpfulVote.objects.filter(
+            user=request.user, comment__post=post
+        ).values_list('comment_id', flat=True))
 
     if request.method == 'POST' and request.user.is_authenticated:
         form = CommentForm(request.POST)
@@ -133,6 +197,7 @@ def post_detail(request, pk):
         'comments': comments,
         'form': form,
         'user_voted': user_voted,
+        'voted_comment_ids': voted_comment_ids,
     }
     return render(request, 'core/post_detail.html', context)
 
@@ -182,24 +247,31 @@ def post_delete(request, pk):
 
 
 @login_required
+@require_POST
 def vote_helpful(request, pk):
     post = get_object_or_404(Post, pk=pk)
 
-    vote, created = HelpfulVote.objects.get_or_create(user=request.user, post=post)
-
-    if created:
-        post.helpful_count += 1
-        post.save()
+    if voting.toggle_vote(request.user, post=post):
         messages.success(request, 'Marked as helpful!')
     else:
-        vote.delete()
-        post.helpful_count -= 1
-        post.save()
         messages.info(request, 'Vote removed.')
 
     return redirect('core:post_detail', pk=pk)
 
 
+@login_required
+@require_POST
+def vote_comment_helpful(request, pk):
+    comment = get_object_or_404(Comment, pk=pk)
+
+    if voting.toggle_vote(request.user, comment=comment):
+        messages.success(request, 'Marked comment as helpful!')
+    else:
+        messages.info(request, 'Vote removed.')
+
+    return redirect('core:post_detail', pk=comment.post_id)
+
+
 @login_required
 def add_comment(request, post_pk):
     post = get_object_or_404(Post, pk=post_pk)
@@ -220,12 +292,15 @@ def profile_view(request, username):
     from django.contrib.auth.models import User
     user = get_object_or_404(User, username=username)
     profile = user.profile
-    posts = user.posts.all()[:10]
+    page = _feed_page(request, user.posts.all(), settings.PROFILE_PAGE_SIZE)
+    shared = memberships.shared_hubs(request.user, user) if request.user != user else frozenset()
 
     context = {
         'profile_user': user,
         'profile': profile,
-        'posts': posts,
+        'posts': page,
+        'page': page,
+        'shared_hub_count': len(shared),
     }
     return render(request, 'core/profile_view.html', context)
 
@@ -250,9 +325,43 @@ def profile_edit(request, username):
     return render(request, 'core/profile_edit.html', {'form': form})
 
 
+def avatar_file(request, name):
+    """Serve a processed profile photo; names are content hashes, so they can be cached forever"""
+    name = f'avatars/{name}'
+    if not default_storage.exists(name):
+        raise Http404('No such avatar')
+    extension = name.rsplit('.', 1)[1]
+    response = FileResponse(default_storage.open(name), content_type=images.CONTENT_TYPES[extension])
+    response['Cache-Control'] = f'public, max-age={settings.AVATAR_CACHE_SECONDS}, immutable'
+    return response
+
+
 def mentor_list(request):
-    mentors = UserProfile.objects.filter(is_mentor=True).select_related('user')
-    return render(request, 'core/mentor_list.html', {'mentors': mentors})
+    page = matching.mentor_request(request)
+    profiles = UserProfile.objects.filter(
+        user_id__in=[match.user_id for match in page.matches]
+    ).select_related('user').prefetch_related('skills').in_bulk(field_name='user_id')
+
+    mentors = []
+    for match in page.matches:
+        mentor = profiles.get(match.user_id)
+        if mentor is not None:
+            mentor.match = match
+            mentors.append(mentor)
+    return render(request, 'core/mentor_list.html', {
+        'mentors': mentors,
+        'page': page,
+        'skills': Skill.objects.order_by('name'),
+    })
+
+
+def leaderboard(request):
+    """Top members by reputation, plus the viewer's own rank"""
+    leaders = reputation.leaderboard(settings.LEADERBOARD_SIZE)
+    my_rank = None
+    if request.user.is_authenticated:
+        my_rank = reputation.rank(request.user.profile)
+    return render(request, 'core/leaderboard.html', {'leaders': leaders, 'my_rank': my_rank})
 
 
 @login_required
@@ -279,6 +388,29 @@ def request_mentorship(request, username):
     return render(request, 'core/request_mentorship.html', {'form': form, 'mentor': mentor})
 
 
+async def event_stream(request):
+    """Server-Sent Events for the ?channel= names a page follows (see core/live.py)"""
+    if not isinstance(request, ASGIRequest):
+        # A stream would hold a sync worker for its whole life; 204 tells EventSource not to retry
+        return HttpResponse(status=204)
+    user = await live.afollower(await request.auser(), request.GET.get('token'))
+    channels = live.channels_for(user, request.GET.getlist('channel'))
+    if not channels:
+        return HttpResponseBadRequest('No channel you can follow')
+    last_event_id = live.parse_last_event_id(
+        request.headers.get('Last-Event-ID') or request.GET.get('last_event_id'))
+    response = StreamingHttpResponse(events.sse(channels, last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stops nginx and similar proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    # Pages served by another process (EVENTS_URL) read the stream cross-origin
+    origin = request.headers.get('Origin')
+    if origin and live.allowed_origin(origin):
+        response['Access-Control-Allow-Origin'] = origin
+        patch_vary_headers(response, ('Origin',))
+    return response
+
+
 @login_required
 def mentorship_dashboard(request):
     sent_requests = MentorshipRequest.objects.filter(mentee=request.user).select_related('mentor')
@@ -307,43 +439,37 @@ def update_mentorship_status(request, pk):
 
 @staff_member_required
 def analytics_dashboard(request):
-        member_count=Count('members'),
-        post_count=Count('posts')
-    ).values('name', 'icon', 'member_count', 'post_count')
-    skills = Skill.objects.annotate(
-        user_count=Count('users')
-    ).filter(user_count__gt=0).order_by('-user_count')[:10]
+    snapshot = stats.get_platform_snapshot()
     hub_data = [
         {'hub': h['name'], 'posts': h['post_count'], 'members': h['member_count']}
-        for h in hubs
+        for h in snapshot['hub_breakdown']
     ]
 
-    skill_data = [
-        {'skill': s.name, 'users': s.user_count}
-        for s in skills
-    ]
-    mentorship_stats = {
-        'pending': MentorshipRequest.objects.filter(status='pending').count(),
-        'accepted': MentorshipRequest.objects.filter(status='accepted').count(),
-        'declined': MentorshipRequest.objects.filter(status='declined').count(),
-        'completed': MentorshipRequest.objects.filter(status='completed').count(),
-    }
-
     context = {
         'hub_data': json.dumps(hub_data),
-        'skill_data': json.dumps(skill_data),
-        'mentorship_stats': mentorship_stats,
-        'total_users': User.objects.count(),
-        'total_posts': Post.objects.count(),
-        'total_comments': Comment.objects.count(),
-        'total_hubs': Hub.objects.count(),
+        'skill_data': json.dumps(snapshot['top_skills']),
+        'mentorship_stats': snapshot['mentorship'],
+        'total_users': snapshot['total_users'],
+        'total_posts': snapshot['total_posts'],
+        'total_comments': snapshot['total_comments'],
+        'total_hubs': snapshot['total_hubs'],
+        'export_datasets': list(exports.DATASETS),
+        'fragment_stats': fragments.stats(),
+        'fragment_stats_shared': settings.FRAGMENT_STATS_SHARED,
     }
 
     return render(request, 'core/analytics_dashboard.html', context)
 
 
-import csv
-from django.http import HttpResponse
+@staff_member_required
+def sql_profile(request):
+    """Slowest recently profiled requests in this worker, with their repeated queries"""
+    return render(request, 'core/sql_profile.html', {
+        'profiles': profiling.slow_requests(),
+        'sample_rate': settings.SQL_PROFILER_SAMPLE_RATE,
+        'slow_ms': settings.SQL_PROFILER_SLOW_MS,
+        'repeat_threshold': settings.SQL_PROFILER_REPEAT_THRESHOLD,
+    })
 
 
 @login_required
@@ -353,20 +479,15 @@ def export_portfolio(request, username):
         messages.error(request, 'You can only export your own portfolio.')
         return redirect('core:home')
 
-    from django.contrib.auth.models import User
     user = get_object_or_404(User, username=username)
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="{username}_portfolio.csv"'
-    writer = csv.writer(response)
-    writer.writerow(['Type', 'Title', 'Hub', 'Date', 'Helpful Count', 'Comments'])
-    for post in user.posts.all():
-        writer.writerow([
-            post.get_post_type_display(),
-            post.title,
-            post.hub.name,
-            post.created_at.strftime('%Y-%m-%d'),
-            post.helpful_count,
-            post.comment_count()
-        ])
-
-    return response
\ No newline at end of file
+    header, rows = exports.portfolio_rows(user)
+    return exports.stream(header, rows, 'csv', f'{username}_portfolio.csv')
+
+
+@staff_member_required
+def bulk_export(request, dataset, fmt):
+    """Stream a whole table (posts, comments or mentorship) as CSV or NDJSON"""
+    if dataset not in exports.DATASETS or fmt not in exports.FORMATS:
+        raise Http404('Unknown export')
+    header, rows = exports.dataset_rows(dataset)
+    return exports.stream(header, rows, fmt, f'astra_{dataset}.{fmt}')
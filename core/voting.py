@@ -0,0 +1,91 @@
+"""
+Helpful votes on posts and comments.
+
+HelpfulVote rows are the source of truth; the helpful_count columns are
+adjusted with single conditional UPDATEs (never read-modify-write), so
+concurrent voters can't lose each other's increments. Casting and retracting
+are idempotent: voting twice or retracting a missing vote changes nothing.
+
+With VOTE_WRITE_BEHIND enabled nothing but the HelpfulVote row is written in
+the voter's transaction: the helpful_count delta and the author's reputation
+go through core/buffers.py and are written in batches, along with the ranking,
+version and live updates that follow them, so a burst of votes on one hot
+post turns into one UPDATE per row instead of a queue of writers waiting on
+the same row locks.
+"""
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from . import buffers, live, ranking, reputation, versions
+from .models import Post, Comment, HelpfulVote, adjust_counter
+
+COUNTED_MODELS = {'post': Post, 'comment': Comment}
+
+
+def _target(post=None, comment=None):
+    if (post is None) == (comment is None):
+        raise ValueError('Vote on exactly one of post or comment')
+    return ('post', post) if post is not None else ('comment', comment)
+
+
+def has_voted(user, post=None, comment=None):
+    kind, obj = _target(post, comment)
+    return HelpfulVote.objects.filter(user=user, **{kind: obj}).exists()
+
+
+def cast_vote(user, post=None, comment=None):
+    """Record a helpful vote; returns False if the user had already voted"""
+    kind, obj = _target(post, comment)
+    try:
+        with transaction.atomic():
+            HelpfulVote.objects.create(user=user, **{kind: obj})
+            _record(user, kind, obj, 1)
+    except IntegrityError:
+        return False
+    return True
+
+
+def retract_vote(user, post=None, comment=None):
+    """Remove a helpful vote; returns False if there was nothing to remove"""
+    kind, obj = _target(post, comment)
+    with transaction.atomic():
+        deleted, _ = HelpfulVote.objects.filter(user=user, **{kind: obj}).delete()
+        if deleted:
+            _record(user, kind, obj, -1)
+    return bool(deleted)
+
+
+def toggle_vote(user, post=None, comment=None):
+    """Flip the user's vote and return True if they now have one"""
+    if retract_vote(user, post=post, comment=comment):
+        return False
+    cast_vote(user, post=post, comment=comment)
+    return True
+
+
+def _record(voter, kind, obj, sign):
+    if settings.VOTE_WRITE_BEHIND:
+        buffers.add('helpful', kind, obj.pk, delta=sign)
+        reputation.record_vote(voter, sign, buffered=True, **{kind: obj})
+    else:
+        adjust_counter(COUNTED_MODELS[kind].objects.filter(pk=obj.pk), 'helpful_count', sign)
+        if kind == 'post':
+            ranking.refresh([obj.pk])
+        live.helpful_counts_changed(**{f'{kind}_ids': [obj.pk]})
+        reputation.record_vote(voter, sign, **{kind: obj})
+        versions.bump_for_vote(**{kind: obj})
+
+
+@buffers.applier('helpful')
+def apply_deltas(deltas):
+    """Write {(kind, pk): delta} to the helpful_count columns"""
+    for (kind, pk), delta in deltas.items():
+        COUNTED_MODELS[kind].objects.filter(pk=pk).update(helpful_count=Greatest(F('helpful_count') + delta, 0))
+    post_ids = [pk for kind, pk in deltas if kind == 'post']
+    comment_ids = [pk for kind, pk in deltas if kind == 'comment']
+    ranking.refresh(post_ids)
+    versions.bump_for_counters(post_ids=post_ids, comment_ids=comment_ids)
+    live.helpful_counts_changed(post_ids=post_ids, comment_ids=comment_ids)